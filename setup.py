@@ -8,6 +8,6 @@ setup(name='uvcclient',
       url='http://github.org/kk7ds/uvcclient',
       packages=['uvcclient'],
       scripts=['uvc'],
-      install_requires=[],
+      install_requires=['futures; python_version < "3"'],
       tests_require=['mock'],
 )
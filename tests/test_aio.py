@@ -0,0 +1,141 @@
+import gzip
+import json
+import threading
+import unittest
+
+try:
+    import asyncio
+    from http import server as http_server
+    from uvcclient import aio
+except (ImportError, SyntaxError):
+    aio = None
+
+from uvcclient import nvr
+
+
+class FakeNVRHandler(object if aio is None else
+                     http_server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    cameras = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, data, gzipped=False):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        if gzipped:
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/api/2.0/bootstrap':
+            self._reply(200, {'data': [{'systemInfo': {'version': '3.2.1'}}]})
+        elif path == '/api/2.0/camera':
+            self._reply(200, {'data': list(self.cameras.values())},
+                        gzipped=True)
+        elif path.startswith('/api/2.0/camera/'):
+            cam = self.cameras.get(path.rsplit('/', 1)[1])
+            if cam is None:
+                self._reply(404, {})
+            else:
+                self._reply(200, {'data': [cam]})
+        else:
+            self._reply(404, {})
+
+    def do_PUT(self):
+        path = self.path.split('?')[0]
+        length = int(self.headers['Content-Length'])
+        cam = json.loads(self.rfile.read(length).decode())
+        self.cameras[path.rsplit('/', 1)[1]] = cam
+        self._reply(200, {'data': [cam]})
+
+
+@unittest.skipIf(aio is None, 'asyncio is not available')
+class TestAsyncUVCRemote(unittest.TestCase):
+    def setUp(self):
+        super(TestAsyncUVCRemote, self).setUp()
+        FakeNVRHandler.cameras = {
+            'id1': {'_id': 'id1', 'uuid': 'uuid1', 'name': 'Porch',
+                    'state': 'CONNECTED', 'managed': True,
+                    'deleted': False, 'zones': ['z1'],
+                    'ispSettings': {'irLedMode': 'auto', 'irLedLevel': 215,
+                                    'brightness': 50},
+                    'recordingSettings': {'fullTimeRecordEnabled': False,
+                                          'motionRecordEnabled': True}},
+        }
+        self.server = http_server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                      FakeNVRHandler)
+        self.server.daemon_threads = True
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  args=(0.05,))
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(self.loop.close)
+        self.addCleanup(asyncio.set_event_loop, None)
+        self.client = aio.AsyncUVCRemote('127.0.0.1',
+                                         self.server.server_address[1],
+                                         'key')
+        self.addCleanup(self.client.close)
+
+    def run_coro(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def test_getters(self):
+        self.assertEqual('motion',
+                         self.run_coro(self.client.get_recordmode('id1')))
+        self.assertEqual('auto',
+                         self.run_coro(self.client.get_irledmode('id1')))
+        self.assertEqual(['z1'], self.run_coro(self.client.list_zones('id1')))
+        self.assertEqual(1, self.client.pool_stats['misses'])
+        self.assertEqual(2, self.client.pool_stats['hits'])
+
+    def test_setter(self):
+        self.assertTrue(self.run_coro(
+            self.client.set_irledmode('id1', 'off')))
+        self.assertEqual('off',
+                         self.run_coro(self.client.get_irledmode('id1')))
+        self.assertEqual({'irLedMode': 'manual', 'irLedLevel': 0,
+                          'brightness': 50},
+                         FakeNVRHandler.cameras['id1']['ispSettings'])
+
+    def test_setter_invalid(self):
+        self.assertRaises(nvr.Invalid, self.run_coro,
+                          self.client.set_irledmode('id1', 'bright'))
+
+    def test_index_gzip(self):
+        index = self.run_coro(self.client.index())
+        self.assertEqual(['id1'], [x['id'] for x in index])
+        self.assertEqual('id1',
+                         self.run_coro(self.client.name_to_uuid('Porch')))
+
+    def test_concurrent(self):
+        coros = [self.client.get_brightness('id1') for i in range(20)]
+        results = self.run_coro(asyncio.gather(*coros))
+        self.assertEqual([50] * 20, results)
+
+    def test_camera_model(self):
+        cam = self.run_coro(self.client.get_camera_model('id1'))
+        self.assertEqual('Porch', cam.name)
+        self.assertEqual('motion', cam.recording_settings.mode)
+
+    def test_replayed_methods(self):
+        for name in self.client.REPLAYED_METHODS:
+            self.assertTrue(hasattr(nvr.UVCRemote, name), name)
+        # Sync helpers are not exposed unless they can be replayed
+        self.assertRaises(AttributeError, getattr, self.client,
+                          'camera_models')
+        self.assertRaises(AttributeError, getattr, self.client,
+                          'get_bootstrap_cache')
+
+    def test_not_found(self):
+        self.assertRaises(nvr.NvrError, self.run_coro,
+                          self.client.get_camera('nothere'))
@@ -0,0 +1,158 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from uvcclient import alerts
+from uvcclient import fakeserver
+from uvcclient import nvr
+from uvcclient import store
+
+
+class TestAlertSync(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeNVR(cameras=2, alerts=25).start()
+        self.addCleanup(self.server.stop)
+        self.client = nvr.UVCRemote('127.0.0.1', self.server.port, 'key')
+        self.addCleanup(self.client.close)
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.store = store.InfoStore(os.path.join(tmpdir, 'store'))
+
+    def _add_alerts(self, count, timestamp=None):
+        start = len(self.server.alerts)
+        for i in range(start, start + count):
+            alert = fakeserver.make_alert(i, self.server.cameras)
+            if timestamp is not None:
+                alert['timestamp'] = timestamp
+            self.server.alerts.append(alert)
+
+    def test_incremental(self):
+        sync = alerts.AlertSync(self.client, self.store, page_size=10)
+        synced = list(sync.sync())
+        self.assertEqual(self.server.alerts, synced)
+        self.assertEqual(3, self.server.requests['GET'])
+
+        self._add_alerts(3)
+        sync = alerts.AlertSync(self.client, self.store, page_size=10)
+        synced = list(sync.sync())
+        self.assertEqual(self.server.alerts[-3:], synced)
+        self.assertTrue(sync.server_filtering)
+
+        self.assertEqual([], list(sync.sync()))
+
+    def test_same_timestamp(self):
+        sync = alerts.AlertSync(self.client, page_size=10)
+        list(sync.sync())
+        # Another alert arrives in the same millisecond as the newest one
+        self._add_alerts(1, timestamp=self.server.alerts[-1]['timestamp'])
+        self.assertEqual(self.server.alerts[-1:], list(sync.sync()))
+
+    def test_partial_consume(self):
+        sync = alerts.AlertSync(self.client, self.store, page_size=10)
+        gen = sync.sync()
+        first = [next(gen) for i in range(5)]
+        gen.close()
+        self.assertEqual(self.server.alerts[:5], first)
+
+        sync = alerts.AlertSync(self.client, self.store, page_size=10)
+        self.assertEqual(self.server.alerts[5:], list(sync.sync()))
+
+    def test_no_server_paging(self):
+        self.server.alert_paging = False
+        sync = alerts.AlertSync(self.client, self.store, page_size=10)
+        self.assertEqual(self.server.alerts, list(sync.sync()))
+        self.assertFalse(sync.server_filtering)
+
+        self._add_alerts(2)
+        sync = alerts.AlertSync(self.client, self.store, page_size=10)
+        self.assertFalse(sync.server_filtering)
+        self.assertEqual(self.server.alerts[-2:], list(sync.sync()))
+
+    def test_reset(self):
+        sync = alerts.AlertSync(self.client, self.store)
+        list(sync.sync())
+        sync.reset()
+        self.assertEqual(25, len(list(sync.sync())))
+
+
+class TestGetAlerts(unittest.TestCase):
+    def test_params(self):
+        with fakeserver.FakeNVR(cameras=1, alerts=5) as server:
+            client = nvr.UVCRemote('127.0.0.1', server.port, 'key')
+            page = client.get_alerts(limit=2, offset=1, order='asc')
+            self.assertEqual(server.alerts[1:3], page)
+            self.assertEqual(5, len(client.get_all_alerts()))
+            client.close()
+
+
+class TestDeleteAlerts(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeNVR(cameras=2, alerts=40).start()
+        self.addCleanup(self.server.stop)
+        self.client = nvr.UVCRemote('127.0.0.1', self.server.port, 'key')
+        self.addCleanup(self.client.close)
+
+    def test_delete_all(self):
+        result = self.client.delete_alerts(max_workers=4)
+        self.assertEqual(40, len(result.deleted))
+        self.assertEqual({}, result.failed)
+        self.assertEqual(0, result.remaining)
+        self.assertTrue(result.ok)
+        self.assertEqual([], self.client.get_all_alerts())
+
+    def test_filter(self):
+        camera = self.server.cameras[0]['_id']
+        start = self.server.alerts[10]['timestamp']
+        end = self.server.alerts[19]['timestamp']
+        predicate = alerts.alert_filter(start=start, end=end,
+                                        alert_type='connection',
+                                        camera=camera)
+        result = self.client.delete_alerts(predicate=predicate)
+        # Alerts alternate between the two cameras and the two types
+        expected = [a['_id'] for a in self.server.alerts[10:20]
+                    if predicate(a)]
+        self.assertNotEqual([], expected)
+        self.assertEqual(sorted(expected), sorted(result.deleted))
+        self.assertEqual(40 - len(expected),
+                         len(self.client.get_all_alerts()))
+
+    def test_retry(self):
+        self.server.error_rate = 0.5
+        result = self.client.delete_alerts(
+            alerts=self.server.alerts[:10], retries=10, backoff=0,
+            verify=False)
+        self.server.error_rate = 0
+        self.assertEqual({}, result.failed)
+        self.assertEqual(10, len(result.deleted))
+
+    def test_give_up(self):
+        alert = dict(self.server.alerts[0], _id='missing')
+        result = self.client.delete_alerts(alerts=[alert], retries=1,
+                                           backoff=0)
+        self.assertEqual(['missing'], list(result.failed))
+        self.assertFalse(result.ok)
+
+    def test_no_retry_on_client_error(self):
+        alert = dict(self.server.alerts[0], _id='missing')
+        requests = self.server.request_count
+        result = self.client.delete_alerts(alerts=[alert], retries=3,
+                                           backoff=0, verify=False)
+        self.assertIsInstance(result.failed['missing'], nvr.NvrRequestError)
+        self.assertEqual(requests + 1, self.server.request_count)
+
+    def test_jittered_backoff(self):
+        self.server.error_rate = 1
+        with mock.patch('time.sleep') as sleep:
+            with mock.patch('random.uniform', return_value=0.25) as uniform:
+                result = self.client.delete_alerts(
+                    alerts=self.server.alerts[:1], retries=2, backoff=1,
+                    verify=False)
+        self.server.error_rate = 0
+        self.assertIsInstance(result.failed[self.server.alerts[0]['_id']],
+                              nvr.NvrServerError)
+        self.assertEqual([mock.call(0, 1), mock.call(0, 2)],
+                         uniform.call_args_list)
+        self.assertEqual([mock.call(0.25)] * 2, sleep.call_args_list)
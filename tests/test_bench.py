@@ -0,0 +1,61 @@
+import optparse
+import unittest
+
+from uvcclient import bench
+from uvcclient import fakeserver
+from uvcclient import nvr
+
+
+class TestBench(unittest.TestCase):
+    def test_measure(self):
+        calls = []
+        result = bench.measure(lambda: calls.append(1), 5,
+                               alloc_iterations=2)
+        # One warm-up call, five timed and two traced
+        self.assertEqual(8, len(calls))
+        self.assertEqual(5, result['calls'])
+        self.assertTrue(result['p50_ms'] <= result['max_ms'])
+        # RSS is only reported per process, by measure_isolated()
+        self.assertNotIn('peak_rss_kb', result)
+
+    def test_peak_per_scenario(self):
+        big = bench.measure(lambda: bytearray(10 ** 6), 1)
+        small = bench.measure(lambda: bytearray(10), 1)
+        self.assertTrue(big['peak_alloc_bytes'] >= 10 ** 6)
+        self.assertTrue(small['peak_alloc_bytes'] < 10 ** 5)
+
+    def test_nvr_benchmarks(self):
+        with fakeserver.FakeNVR(cameras=2, alerts=5) as server:
+            client = nvr.UVCRemote('127.0.0.1', server.port, 'fake')
+            ident = server.cameras[0]['_id']
+            benchmarks = bench.nvr_benchmarks(client, [ident])
+            for name, fn in benchmarks.items():
+                fn()
+            client.close()
+        self.assertFalse(
+            server.cameras[0]['recordingSettings']['motionRecordEnabled'])
+
+    def test_run(self):
+        opts = optparse.Values({'cameras': 2, 'alerts': 5, 'iterations': 2,
+                                'latency': 0, 'snapshot_size': 100})
+        results = bench.run(opts, ['index', 'camera_snapshot',
+                                   'camera_list_gzip'])
+        self.assertEqual(['camera_list_gzip', 'camera_snapshot', 'index'],
+                         sorted(results['results']))
+        self.assertEqual(2, results['results']['index']['calls'])
+        for result in results['results'].values():
+            self.assertNotIn('error', result)
+            if bench.resource is not None:
+                self.assertTrue(result['peak_rss_kb'] > 0)
+                self.assertTrue(result['rss_growth_kb'] >= 0)
+        self.assertEqual(
+            set(bench.NVR_BENCHMARKS),
+            set(bench.nvr_benchmarks(nvr.UVCRemote('127.0.0.1', 1, 'k'),
+                                     ['x'])))
+
+    def test_measure_isolated(self):
+        with fakeserver.FakeNVR(cameras=2) as server:
+            result = bench.measure_isolated('index', server.port, 2)
+            error = bench.measure_isolated('missing', server.port, 2)
+        self.assertEqual(2, result['calls'])
+        self.assertIn('KeyError', error['error'])
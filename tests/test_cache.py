@@ -0,0 +1,49 @@
+import unittest
+
+import mock
+
+from uvcclient import cache
+
+
+class TestCameraCache(unittest.TestCase):
+    def test_returns_copies(self):
+        c = cache.CameraCache(ttl=60)
+        c.put('foo', {'data': [{'name': 'foo'}]})
+        doc = c.get('foo')
+        doc['data'][0]['name'] = 'bar'
+        self.assertEqual({'data': [{'name': 'foo'}]}, c.get('foo'))
+        self.assertEqual(2, c.stats()['hits'])
+
+    def test_miss(self):
+        c = cache.CameraCache(ttl=60)
+        self.assertIsNone(c.get('foo'))
+        self.assertEqual(1, c.stats()['misses'])
+
+    @mock.patch('time.time')
+    def test_expires(self, mock_time):
+        mock_time.return_value = 100
+        c = cache.CameraCache(ttl=5)
+        c.put('foo', {})
+        mock_time.return_value = 106
+        self.assertIsNone(c.get('foo'))
+        self.assertEqual(1, c.stats()['expirations'])
+        self.assertEqual(0, c.stats()['size'])
+
+    def test_lru_eviction(self):
+        c = cache.CameraCache(ttl=60, size=2)
+        c.put('a', 1)
+        c.put('b', 2)
+        c.get('a')
+        c.put('c', 3)
+        self.assertIsNone(c.get('b'))
+        self.assertEqual(1, c.get('a'))
+        self.assertEqual(1, c.stats()['evictions'])
+
+    def test_invalidate(self):
+        c = cache.CameraCache(ttl=60)
+        c.put('a', 1)
+        c.put('b', 2)
+        c.invalidate('a')
+        self.assertIsNone(c.get('a'))
+        c.invalidate()
+        self.assertEqual(0, c.stats()['size'])
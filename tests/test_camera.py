@@ -3,12 +3,16 @@ try:
 except ImportError:
     from http import client as httplib
 
+import io
 import json
+import socket
 import unittest
 
 import mock
 
 from uvcclient import camera
+from uvcclient import resilience
+from uvcclient import store
 
 
 class TestCamera(unittest.TestCase):
@@ -33,6 +37,109 @@ class TestCamera(unittest.TestCase):
             self.assertEquals(conn.getresponse.return_value.read.return_value,
                               r)
 
+    def test_stream_snapshot(self):
+        c = camera.UVCCameraClient('foo', 'ubnt', 'ubnt')
+        out = io.BytesIO()
+        with mock.patch.object(c, '_safe_request') as mock_r:
+            mock_r.return_value = io.BytesIO(b'image')
+            mock_r.return_value.status = 200
+            self.assertEqual(5, c.stream_snapshot(out))
+        self.assertEqual(b'image', out.getvalue())
+
+    def test_stream_snapshot_noauth(self):
+        c = camera.UVCCameraClient('foo', 'ubnt', 'ubnt')
+        with mock.patch.object(c, '_safe_request') as mock_r:
+            with mock.patch.object(c, 'login') as mock_login:
+                mock_r.return_value.status = 401
+                self.assertRaises(camera.CameraAuthError, c.stream_snapshot,
+                                  io.BytesIO())
+                mock_login.assert_called_once_with()
+            self.assertEqual(2, mock_r.call_count)
+
+    def test_relogin_when_session_expires(self):
+        c = camera.UVCCameraClient('foo', 'ubnt', 'ubnt')
+        c._cookie = 'old'
+        expired = mock.MagicMock(status=302)
+        ok = mock.MagicMock(status=200)
+
+        def fake_login():
+            c._cookie = 'new'
+
+        with mock.patch.object(c, '_safe_request') as mock_r:
+            with mock.patch.object(c, 'login') as mock_login:
+                mock_login.side_effect = fake_login
+                mock_r.side_effect = [expired, ok]
+                self.assertEqual(ok.read.return_value, c.get_snapshot())
+            mock_r.assert_called_with('GET', '/snapshot.cgi',
+                                      headers={'Cookie': 'new'},
+                                      idempotent=True)
+
+    def test_no_relogin_with_valid_session(self):
+        c = camera.UVCCameraClient('foo', 'ubnt', 'ubnt')
+        c._cookie = 'cookie'
+        with mock.patch.object(c, '_safe_request') as mock_r:
+            with mock.patch.object(c, 'login') as mock_login:
+                mock_r.return_value.status = 200
+                mock_r.return_value.read.return_value = b'{}'
+                self.assertEqual({}, c.get_status())
+                c.reboot()
+                self.assertFalse(mock_login.called)
+
+    def test_session_store(self):
+        session_store = mock.MagicMock()
+        session_store.get_camera_session.return_value = 'saved'
+        c = camera.UVCCameraClientV320('foo', 'ubnt', 'ubnt',
+                                       session_store=session_store)
+        with mock.patch.object(c, '_safe_request') as mock_r:
+            c.ensure_login()
+            self.assertFalse(mock_r.called)
+        session_store.get_camera_session.assert_called_once_with('foo:80')
+        self.assertEqual('saved', c._cookie)
+
+    @mock.patch('time.time')
+    @mock.patch.object(httplib, 'HTTPConnection')
+    def test_login_saves_session(self, mock_h, mock_time):
+        mock_time.return_value = 1000
+        session_store = mock.MagicMock()
+        session_store.get_camera_session.return_value = None
+        c = camera.UVCCameraClientV320('foo', 'ubnt', 'ubnt',
+                                       session_store=session_store,
+                                       session_ttl=60)
+        resp = mock_h.return_value.getresponse.return_value
+        resp.status = 200
+        resp.getheaders.return_value = {'set-cookie': 'cookie'}
+        c.ensure_login()
+        session_store.set_camera_session.assert_called_once_with(
+            'foo:80', 'cookie', 1060)
+
+    @mock.patch.object(httplib, 'HTTPConnection')
+    def test_login_store_unwritable(self, mock_h):
+        session_store = mock.MagicMock()
+        session_store.get_camera_session.return_value = None
+        session_store.set_camera_session.side_effect = (
+            store.UnableToManageStore())
+        c = camera.UVCCameraClientV320('foo', 'ubnt', 'ubnt',
+                                       session_store=session_store)
+        resp = mock_h.return_value.getresponse.return_value
+        resp.status = 200
+        resp.getheaders.return_value = {'set-cookie': 'cookie'}
+        c.ensure_login()
+        self.assertEqual('cookie', c._cookie)
+
+    @mock.patch.object(httplib, 'HTTPConnection')
+    def test_reboot_not_retried(self, mock_h):
+        policy = resilience.Policy(retries=3, backoff=0)
+        c = camera.UVCCameraClientV320('foo', 'ubnt', 'ubnt', policy=policy)
+        c._cookie = 'cookie'
+        conn = mock_h.return_value
+        conn.sock = None
+        conn.getresponse.side_effect = socket.timeout()
+        self.assertRaises(camera.CameraConnectError, c.reboot)
+        self.assertEqual(1, conn.request.call_count)
+        # A read, on the other hand, is retried
+        self.assertRaises(camera.CameraConnectError, c.get_snapshot)
+        self.assertEqual(5, conn.request.call_count)
+
     def test_cfgwrite(self):
         c = camera.UVCCameraClient('foo', 'ubnt', 'ubnt')
         c._cookie = 'foo-cookie'
@@ -2,6 +2,7 @@ import unittest
 
 import mock
 
+from uvcclient import main
 from uvcclient import nvr
 
 
@@ -33,3 +34,26 @@ class TestCliUtils(unittest.TestCase):
         self.assertEqual(7443, port)
         self.assertEqual('myKey', key)
         self.assertEqual('/', path)
+
+    def test_select_cameras(self):
+        client = mock.MagicMock()
+        client.camera_identifier = 'id'
+        client.index.return_value = [{'name': 'Cam%i' % i, 'id': i}
+                                     for i in (1, 10, 11, 2)]
+        self.assertEqual([1], main.select_cameras(client, 'cam1'))
+        self.assertEqual([1, 10, 11], main.select_cameras(client, 'CAM1*'))
+        self.assertEqual([1, 10, 11, 2], main.select_cameras(client))
+        self.assertFalse(client.resolver.method_calls)
+
+    def test_delete_alert_filter(self):
+        alerts = [{'timestamp': 1, 'alertType': 'motion'},
+                  {'timestamp': 2, 'alertType': 'motion'},
+                  {'timestamp': 2, 'alertType': 'disconnect'},
+                  {'timestamp': 3, 'alertType': 'disconnect'}]
+        match = main.delete_alert_filter(1, 'disconnect')
+        self.assertEqual([1, 2, 3],
+                         [a['timestamp'] for a in alerts if match(a)])
+        match = main.delete_alert_filter(timestamp=2)
+        self.assertEqual(2, len([a for a in alerts if match(a)]))
+        match = main.delete_alert_filter(alert_type='motion')
+        self.assertEqual(2, len([a for a in alerts if match(a)]))
@@ -3,12 +3,15 @@ try:
 except ImportError:
     from http import client as httplib
 
+import io
 import json
+import socket
 import unittest
 import zlib
 
 import mock
 
+from uvcclient import fakeserver
 from uvcclient import nvr
 
 
@@ -31,7 +34,7 @@ class TestClientLowLevel(unittest.TestCase):
     def _bootstrap(self):
         return {'systemInfo': {'version': '3.1.3'}}
 
-    def cleanUp(self):
+    def tearDown(self):
         for i in self._patches:
             i.stop()
 
@@ -102,6 +105,100 @@ class TestClientLowLevel(unittest.TestCase):
                                              None, headers)
 
 
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        super(TestConnectionPool, self).setUp()
+        bootstrap_mock = mock.patch.object(
+            nvr.UVCRemote, '_get_bootstrap',
+            return_value={'systemInfo': {'version': '3.1.3'}})
+        bootstrap_mock.start()
+        self.addCleanup(bootstrap_mock.stop)
+
+    def _fake_resp(self, will_close=False):
+        resp = mock.MagicMock()
+        resp.status = 200
+        resp.will_close = will_close
+        resp.getheaders.return_value = []
+        resp.read.return_value = json.dumps({}).encode()
+        return resp
+
+    @mock.patch.object(nvr.UVCRemote, '_get_http_connection')
+    def test_reuses_connection(self, mock_conn):
+        conn = mock_conn.return_value
+        conn.getresponse.return_value = self._fake_resp()
+        client = nvr.UVCRemote('foo', 7080, 'key')
+        client._uvc_request('/bar')
+        client._uvc_request('/bar')
+        self.assertEqual(1, mock_conn.call_count)
+        self.assertEqual(2, conn.request.call_count)
+        self.assertFalse(conn.close.called)
+        stats = client.pool_stats
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(1, stats['idle'])
+
+    @mock.patch.object(nvr.UVCRemote, '_get_http_connection')
+    def test_closes_when_server_closes(self, mock_conn):
+        conn = mock_conn.return_value
+        conn.getresponse.return_value = self._fake_resp(will_close=True)
+        client = nvr.UVCRemote('foo', 7080, 'key')
+        client._uvc_request('/bar')
+        conn.close.assert_called_once_with()
+        self.assertEqual(0, client.pool_stats['idle'])
+
+    @mock.patch.object(nvr.UVCRemote, '_get_http_connection')
+    def test_reconnects_stale(self, mock_conn):
+        stale = mock.MagicMock()
+        stale.getresponse.return_value = self._fake_resp()
+        fresh = mock.MagicMock()
+        fresh.getresponse.return_value = self._fake_resp()
+        mock_conn.side_effect = [stale, fresh]
+        client = nvr.UVCRemote('foo', 7080, 'key')
+        client._uvc_request('/bar')
+        stale.request.side_effect = httplib.BadStatusLine('')
+        self.assertEqual({}, client._uvc_request('/bar'))
+        stale.close.assert_called_once_with()
+        self.assertTrue(fresh.request.called)
+        self.assertEqual(1, client.pool_stats['reconnects'])
+
+    @mock.patch.object(nvr.UVCRemote, '_get_http_connection')
+    def test_no_resend_after_timeout(self, mock_conn):
+        stale = mock.MagicMock()
+        stale.getresponse.return_value = self._fake_resp()
+        fresh = mock.MagicMock()
+        fresh.getresponse.return_value = self._fake_resp()
+        mock_conn.side_effect = [stale, fresh]
+        client = nvr.UVCRemote('foo', 7080, 'key')
+        client._uvc_request('/bar')
+        # The NVR may have applied the PUT before the read timed out
+        stale.getresponse.side_effect = socket.timeout()
+        self.assertRaises(nvr.NvrError, client._uvc_request, '/bar', 'PUT',
+                          '{}')
+        self.assertEqual(2, stale.request.call_count)
+        self.assertFalse(fresh.request.called)
+
+    @mock.patch.object(nvr.UVCRemote, '_get_http_connection')
+    def test_closes_on_error(self, mock_conn):
+        conn = mock_conn.return_value
+        conn.getresponse.return_value = self._fake_resp()
+        conn.getresponse.return_value.status = 500
+        client = nvr.UVCRemote('foo', 7080, 'key')
+        self.assertRaises(nvr.NvrError, client._uvc_request, '/bar')
+        conn.close.assert_called_once_with()
+        self.assertEqual(0, client.pool_stats['idle'])
+
+    def test_bounded_idle(self):
+        conns = [mock.MagicMock() for i in range(3)]
+        pool = nvr.ConnectionPool(mock.MagicMock(side_effect=conns),
+                                  max_idle=2)
+        taken = [pool.get()[0] for i in range(3)]
+        for conn in taken:
+            pool.put(conn)
+        self.assertEqual(2, pool.stats()['idle'])
+        self.assertEqual(1, pool.stats()['discards'])
+        conns[2].close.assert_called_once_with()
+
+
 class TestClient32(unittest.TestCase):
     @mock.patch.object(nvr.UVCRemote, '_get_bootstrap')
     def test_bootstrap_server_version(self, mock_bootstrap):
@@ -115,6 +212,35 @@ class TestClient32(unittest.TestCase):
         client = nvr.UVCRemote('foo', 7080, 'key')
         self.assertEqual((3, 4, 0), client.server_version)
 
+    @mock.patch.object(nvr.UVCRemote, '_get_bootstrap')
+    def test_bootstrap_is_lazy(self, mock_bootstrap):
+        mock_bootstrap.return_value = {'systemInfo': {'version': '3.4.5'}}
+        client = nvr.UVCRemote('foo', 7080, 'key')
+        self.assertFalse(mock_bootstrap.called)
+        self.assertEqual('id', client.camera_identifier)
+        self.assertEqual((3, 4, 5), client.server_version)
+        mock_bootstrap.assert_called_once_with()
+
+    @mock.patch.object(nvr.UVCRemote, '_get_bootstrap')
+    def test_bootstrap_cache_hit(self, mock_bootstrap):
+        cache = mock.MagicMock()
+        cache.get.return_value = {'systemInfo': {'version': '3.1.0'}}
+        client = nvr.UVCRemote('foo', 7080, 'key', bootstrap_cache=cache)
+        self.assertEqual((3, 1, 0), client.server_version)
+        cache.get.assert_called_once_with('bootstrap:foo:7080')
+        self.assertFalse(mock_bootstrap.called)
+        self.assertFalse(cache.put.called)
+
+    @mock.patch.object(nvr.UVCRemote, '_get_bootstrap')
+    def test_bootstrap_cache_miss(self, mock_bootstrap):
+        mock_bootstrap.return_value = {'systemInfo': {'version': '3.2.0'}}
+        cache = mock.MagicMock()
+        cache.get.return_value = None
+        client = nvr.UVCRemote('foo', 7080, 'key', bootstrap_cache=cache)
+        self.assertEqual((3, 2, 0), client.server_version)
+        cache.put.assert_called_once_with('bootstrap:foo:7080',
+                                          mock_bootstrap.return_value)
+
     @mock.patch.object(nvr.UVCRemote, '_get_bootstrap')
     @mock.patch.object(nvr.UVCRemote, 'index')
     def test_310_returns_uuid(self, mock_index, mock_bootstrap):
@@ -161,7 +287,7 @@ class TestClient(unittest.TestCase):
     def _bootstrap(self):
         return {'systemInfo': {'version': '3.1.3'}}
 
-    def cleanUp(self):
+    def tearDown(self):
         for i in self._patches:
             i.stop()
 
@@ -199,6 +325,98 @@ class TestClient(unittest.TestCase):
             client.set_recordmode('uuid', 'motion', chan='high')
             self.assertTrue(mock_r.called)
 
+    def test_set_irledmode(self):
+        fake_resp = {'data': [{'ispSettings': {'irLedMode': 'auto',
+                                               'irLedLevel': 215}}]}
+        client = nvr.UVCRemote('foo', 7080, 'key')
+        with mock.patch.object(client, '_uvc_request') as mock_r:
+            mock_r.return_value = fake_resp
+            client.set_irledmode('uuid', 'OFF')
+            mock_r.assert_called_with('/api/2.0/camera/uuid', 'PUT',
+                                      json.dumps({'ispSettings': {
+                                          'irLedMode': 'manual',
+                                          'irLedLevel': 0}}))
+            self.assertRaises(nvr.Invalid, client.set_irledmode, 'uuid',
+                              'bright')
+
+    def test_edit(self):
+        fake_resp = {'data': [{
+            'ispSettings': {'brightness': 50, 'irLedMode': 'manual',
+                            'irLedLevel': 0},
+            'recordingSettings': {'fullTimeRecordEnabled': False,
+                                  'motionRecordEnabled': False,
+                                  'channel': 0},
+        }]}
+        client = nvr.UVCRemote('foo', 7080, 'key')
+        with mock.patch.object(client, '_uvc_request') as mock_r:
+            mock_r.return_value = fake_resp
+            with client.edit('uuid') as cam:
+                cam.brightness = 60
+                cam.irledmode = 'auto'
+                cam.update(recordmode='motion', recordchannel='low')
+            self.assertEqual(2, mock_r.call_count)
+            mock_r.assert_any_call('/api/2.0/camera/uuid')
+            payload = json.loads(mock_r.call_args[0][2])
+            self.assertEqual({'brightness': 60, 'irLedMode': 'auto',
+                              'irLedLevel': 215}, payload['ispSettings'])
+            self.assertEqual({'fullTimeRecordEnabled': False,
+                              'motionRecordEnabled': True,
+                              'channel': 2}, payload['recordingSettings'])
+            self.assertEqual(fake_resp['data'][0], cam.result)
+
+    def test_edit_invalid(self):
+        fake_resp = {'data': [{'ispSettings': {'aemode': 'auto'}}]}
+        client = nvr.UVCRemote('foo', 7080, 'key')
+        with mock.patch.object(client, '_uvc_request') as mock_r:
+            mock_r.return_value = fake_resp
+
+            def do_edit():
+                with client.edit('uuid') as cam:
+                    cam.aemode = 'antiflicker50hz'
+                    cam.irsensitivity = 'extreme'
+
+            self.assertRaises(nvr.Invalid, do_edit)
+            mock_r.assert_called_once_with('/api/2.0/camera/uuid')
+
+            def do_bad_name():
+                with client.edit('uuid') as cam:
+                    cam.notasetting = 1
+
+            self.assertRaises(AttributeError, do_bad_name)
+
+    def test_map_cameras(self):
+        client = nvr.UVCRemote('foo', 7080, 'key')
+
+        def fn(ident):
+            if ident == 'bad':
+                raise nvr.NvrError('failed')
+            return ident.upper()
+
+        results = client.map_cameras(fn, ['a', 'bad', 'c'], max_workers=2)
+        self.assertEqual(['a', 'bad', 'c'], list(results.keys()))
+        self.assertEqual('A', results['a'].value)
+        self.assertTrue(results['c'].ok)
+        self.assertFalse(results['bad'].ok)
+        self.assertIsInstance(results['bad'].error, nvr.NvrError)
+
+    def test_map_cameras_defaults_to_index(self):
+        client = nvr.UVCRemote('foo', 7080, 'key')
+        with mock.patch.object(client, 'index') as mock_index:
+            mock_index.return_value = [{'uuid': 'u1', 'id': 'i1'},
+                                       {'uuid': 'u2', 'id': 'i2'}]
+            results = client.map_cameras(lambda x: x, max_workers=100)
+        self.assertEqual(['u1', 'u2'], list(results.keys()))
+
+    @mock.patch('time.sleep')
+    @mock.patch('time.time')
+    def test_rate_limiter(self, mock_time, mock_sleep):
+        mock_time.return_value = 100.0
+        limiter = nvr.RateLimiter(4)
+        for i in range(3):
+            limiter.wait()
+        self.assertEqual([mock.call(0.25), mock.call(0.5)],
+                         mock_sleep.call_args_list)
+
     def test_get_picture_settings(self):
         fake_resp = {'data': [{'ispSettings': {'settingA': 1,
                                                'settingB': 'foo'}}]}
@@ -257,6 +475,39 @@ class TestClient(unittest.TestCase):
             mock_r.assert_any_call('/api/2.0/camera/uuid', 'PUT',
                                    json.dumps({'zones': ['fake-zone1']}))
 
+    def test_camera_cache(self):
+        client = nvr.UVCRemote('foo', 7080, 'key', cache_ttl=60)
+        fake_resp = {'data': [{'ispSettings': {'brightness': 50,
+                                               'hue': 40}}]}
+        with mock.patch.object(client, '_uvc_request_safe') as mock_r:
+            mock_r.return_value = fake_resp
+            self.assertEqual(50, client.get_brightness('uuid'))
+            self.assertEqual(40, client.get_hue('uuid'))
+            mock_r.assert_called_once_with('/api/2.0/camera/uuid', 'GET',
+                                           None, 'application/json')
+        self.assertEqual(1, client.cache_stats['hits'])
+        self.assertEqual(1, client.cache_stats['misses'])
+
+    def test_camera_cache_updated_by_put(self):
+        client = nvr.UVCRemote('foo', 7080, 'key', cache_ttl=60)
+        before = {'data': [{'ispSettings': {'brightness': 50}}]}
+        after = {'data': [{'ispSettings': {'brightness': 60}}]}
+        with mock.patch.object(client, '_uvc_request_safe') as mock_r:
+            mock_r.side_effect = [before, after]
+            client.set_brightness('uuid', 60)
+            self.assertEqual(60, client.get_brightness('uuid'))
+            self.assertEqual(2, mock_r.call_count)
+
+    def test_camera_cache_disabled(self):
+        client = nvr.UVCRemote('foo', 7080, 'key')
+        fake_resp = {'data': [{'ispSettings': {'brightness': 50}}]}
+        with mock.patch.object(client, '_uvc_request_safe') as mock_r:
+            mock_r.return_value = fake_resp
+            client.get_brightness('uuid')
+            client.get_brightness('uuid')
+            self.assertEqual(2, mock_r.call_count)
+        self.assertIsNone(client.cache_stats)
+
     def test_get_snapshot(self):
         client = nvr.UVCRemote('foo', 7080, 'key')
         with mock.patch.object(client, '_safe_request') as mock_r:
@@ -267,8 +518,243 @@ class TestClient(unittest.TestCase):
                 'GET', '/api/2.0/snapshot/camera/foo?force=true&apiKey=key')
             self.assertEqual('image', resp)
 
+    def test_stream_snapshot(self):
+        client = nvr.UVCRemote('foo', 7080, 'key')
+        out = io.BytesIO()
+        with mock.patch.object(client, '_safe_request') as mock_r:
+            mock_r.return_value = io.BytesIO(b'image')
+            mock_r.return_value.status = 200
+            self.assertEqual(5, client.stream_snapshot('foo', out))
+            mock_r.assert_called_once_with(
+                'GET', '/api/2.0/snapshot/camera/foo?force=true&apiKey=key')
+        self.assertEqual(b'image', out.getvalue())
+
     def test_get_snapshot_error(self):
         client = nvr.UVCRemote('foo', 7080, 'key')
         with mock.patch.object(client, '_safe_request') as mock_r:
             mock_r.return_value.status = 401
             self.assertRaises(nvr.NvrError, client.get_snapshot, 'foo')
+
+
+class TestFleetSnapshot(unittest.TestCase):
+    def setUp(self):
+        super(TestFleetSnapshot, self).setUp()
+        bootstrap_mock = mock.patch.object(
+            nvr.UVCRemote, '_get_bootstrap',
+            return_value={'systemInfo': {'version': '3.2.0'}})
+        bootstrap_mock.start()
+        self.addCleanup(bootstrap_mock.stop)
+        self.cameras = [
+            {'_id': 'id1', 'uuid': 'uuid1', 'name': 'Porch',
+             'mac': '80:2A:A8:00:00:01', 'host': '10.0.0.1',
+             'state': 'CONNECTED', 'managed': True, 'deleted': False,
+             'recordingSettings': {'fullTimeRecordEnabled': False,
+                                   'motionRecordEnabled': True},
+             'zones': ['zone1']},
+            {'_id': 'id2', 'uuid': 'uuid2', 'name': 'Garage',
+             'mac': '802aa8000002', 'host': '10.0.0.2',
+             'state': 'DISCONNECTED', 'managed': True, 'deleted': True,
+             'recordingSettings': {'fullTimeRecordEnabled': True,
+                                   'motionRecordEnabled': False},
+             'zones': []},
+        ]
+        self.client = nvr.UVCRemote('foo', 7080, 'key')
+        patcher = mock.patch.object(self.client, '_uvc_request')
+        self.mock_r = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_r.return_value = {'data': self.cameras}
+
+    def test_lookup(self):
+        fleet = self.client.fleet_snapshot()
+        self.mock_r.assert_called_once_with('/api/2.0/camera')
+        self.assertEqual('id1', fleet.lookup('id1')['_id'])
+        self.assertEqual('id1', fleet.lookup('uuid1')['_id'])
+        self.assertEqual('id1', fleet.lookup('Porch')['_id'])
+        self.assertEqual('id1', fleet.lookup('802aa8000001')['_id'])
+        self.assertEqual('id2', fleet.lookup('80-2a-a8-00-00-02')['_id'])
+        self.assertIsNone(fleet.lookup('nothere'))
+
+    def test_getters_from_memory(self):
+        fleet = self.client.fleet_snapshot()
+        self.assertEqual('motion', fleet.get_recordmode('id1'))
+        self.assertEqual('full', fleet.get_recordmode('Garage'))
+        self.assertEqual('10.0.0.2', fleet.get_cameraipaddress('uuid2'))
+        self.assertEqual(['zone1'], fleet.list_zones('id1'))
+        self.assertEqual('id1', fleet.name_to_uuid('Porch'))
+        self.assertEqual(1, self.mock_r.call_count)
+
+    def test_index(self):
+        fleet = self.client.fleet_snapshot()
+        with mock.patch.object(self.client, '_uvc_iter') as mock_iter:
+            mock_iter.return_value = iter(self.cameras)
+            self.assertEqual(self.client.index(), fleet.index())
+            mock_iter.assert_called_once_with('/api/2.0/camera')
+        self.assertEqual(['id1'], [x['id'] for x in fleet.index()])
+
+    def test_get_camera_copies(self):
+        fleet = self.client.fleet_snapshot()
+        fleet.get_camera('id1')['name'] = 'changed'
+        self.assertEqual('Porch', fleet.get_camera('id1')['name'])
+        self.assertRaises(nvr.NvrError, fleet.get_camera, 'nothere')
+
+    def test_writes_go_to_nvr(self):
+        fleet = self.client.fleet_snapshot()
+        fleet._uvc_request('/api/2.0/camera/id1', 'PUT', '{}')
+        self.mock_r.assert_called_with('/api/2.0/camera/id1', 'PUT', '{}',
+                                       'application/json')
+
+
+class TestChangeTracking(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeNVR(cameras=4).start()
+        self.addCleanup(self.server.stop)
+        self.client = nvr.UVCRemote('127.0.0.1', self.server.port, 'key',
+                                    track_changes=True)
+        self.addCleanup(self.client.close)
+        self.ident = self.server.cameras[0]['_id']
+
+    def test_hash_skips_parse(self):
+        first = self.client.get_camera(self.ident)
+        self.assertIs(first, self.client.get_camera(self.ident))
+        self.server.cameras[0]['name'] = 'Renamed'
+        second = self.client.get_camera(self.ident)
+        self.assertIsNot(first, second)
+        self.assertEqual('Renamed', second['name'])
+
+    def test_etag(self):
+        self.server.etags = True
+        first = self.client.get_camera(self.ident)
+        self.assertIs(first, self.client.get_camera(self.ident))
+        self.assertEqual(1, self.server.not_modified)
+
+    def test_not_tracked_by_default(self):
+        client = nvr.UVCRemote('127.0.0.1', self.server.port, 'key')
+        self.assertIsNot(client.get_camera(self.ident),
+                         client.get_camera(self.ident))
+
+    def test_setter_after_get(self):
+        self.client.get_camera(self.ident)
+        self.client.set_irledmode(self.ident, 'off')
+        self.assertEqual('off', self.client.get_irledmode(self.ident))
+        self.assertEqual('manual',
+                         self.client.get_camera(self.ident)
+                         ['ispSettings']['irLedMode'])
+
+    def test_changed_since(self):
+        changed, token = self.client.changed_since()
+        self.assertEqual(sorted(c['_id'] for c in self.server.cameras),
+                         changed)
+        self.assertEqual([], self.client.changed_since(token)[0])
+
+        self.server.cameras[2]['name'] = 'Renamed'
+        removed = self.server.cameras.pop(3)
+        changed, token = self.client.changed_since(token)
+        self.assertEqual(sorted([self.server.cameras[2]['_id'],
+                                 removed['_id']]), changed)
+        self.assertEqual([], self.client.changed_since(token)[0])
+
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeNVR(cameras=5, alerts=50, gzip=True,
+                                         apikey='key').start()
+        self.addCleanup(self.server.stop)
+        self.client = nvr.UVCRemote('127.0.0.1', self.server.port, 'key')
+        self.addCleanup(self.client.close)
+
+    def test_index(self):
+        seen = []
+        self.client.add_request_hook(seen.append)
+        self.assertEqual([c['_id'] for c in self.server.cameras],
+                         [c['id'] for c in self.client.index()])
+        self.assertEqual(200, seen[0].status)
+        self.assertTrue(seen[0].bytes_in > 0)
+        self.assertEqual(1, self.client.pool_stats['idle'])
+
+    def test_alerts(self):
+        self.assertEqual(self.server.alerts,
+                         list(self.client.iter_alerts()))
+        self.assertEqual(self.server.alerts[:3],
+                         self.client.get_alerts(limit=3, order='asc'))
+        self.assertEqual(1, self.client.pool_stats['idle'])
+
+    def test_early_close_discards_connection(self):
+        alerts = self.client.iter_alerts()
+        next(alerts)
+        alerts.close()
+        self.assertEqual(0, self.client.pool_stats['idle'])
+        self.assertEqual(50, len(self.client.get_all_alerts()))
+
+    def test_error(self):
+        self.client._apikey = 'wrong'
+        self.assertRaises(nvr.NotAuthorized, self.client.index)
+
+
+class TestPartialUpdates(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeNVR(cameras=2).start()
+        self.addCleanup(self.server.stop)
+        self.client = nvr.UVCRemote('127.0.0.1', self.server.port, 'key',
+                                    partial_updates=True)
+        self.addCleanup(self.client.close)
+        self.ident = self.server.cameras[0]['_id']
+        self.puts = []
+        self.client.add_request_hook(
+            lambda info: info.method == 'PUT' and self.puts.append(info))
+
+    def test_camera_patch(self):
+        old = {'a': 1, 'b': {'c': 2, 'd': 3}, 'e': [1]}
+        new = {'a': 1, 'b': {'c': 2, 'd': 4}, 'e': [1, 2], 'f': None}
+        self.assertEqual({'b': {'d': 4}, 'e': [1, 2], 'f': None},
+                         nvr.camera_patch(old, new))
+        self.assertIsNone(nvr.camera_patch(old, {'a': 1}))
+
+    def test_setter_sends_patch(self):
+        full = len(json.dumps(self.server.cameras[0]))
+        self.client.set_brightness(self.ident, 80)
+        self.assertEqual(80, self.server.cameras[0]['ispSettings']
+                         ['brightness'])
+        self.assertEqual(1, len(self.puts))
+        self.assertEqual(len('{"ispSettings": {"brightness": 80}}'),
+                         self.puts[0].bytes_out)
+        self.assertEqual(full - self.puts[0].bytes_out,
+                         self.puts[0].bytes_saved)
+
+    def test_editor(self):
+        with self.client.edit(self.ident) as cam:
+            cam.recordmode = 'full'
+            cam.irledmode = 'off'
+        self.assertEqual('full', self.client.get_recordmode(self.ident))
+        self.assertEqual('off', self.client.get_irledmode(self.ident))
+        self.assertTrue(self.puts[0].bytes_saved > 0)
+
+    def test_refused(self):
+        real = self.client._uvc_request
+
+        def refuse_patches(path, method='GET', data=None, *args, **kwargs):
+            if method == 'PUT' and kwargs.get('bytes_saved'):
+                raise nvr.NvrRequestError('Request failed: 400')
+            return real(path, method, data, *args, **kwargs)
+
+        with mock.patch.object(self.client, '_uvc_request',
+                               side_effect=refuse_patches):
+            self.client.set_brightness(self.ident, 80)
+        self.assertEqual(80, self.server.cameras[0]['ispSettings']
+                         ['brightness'])
+        self.assertIsNone(self.client._originals)
+        self.assertEqual(0, self.puts[-1].bytes_saved)
+
+    def test_replaced(self):
+        def replace(key, update):
+            camera = self.server.find_camera(key)
+            ids = {'_id': camera['_id'], 'uuid': camera['uuid']}
+            camera.clear()
+            camera.update(update, **ids)
+            return camera
+
+        with mock.patch.object(self.server, 'update_camera',
+                               side_effect=replace):
+            self.client.set_brightness(self.ident, 80)
+        self.assertEqual(2, len(self.puts))
+        self.assertIn('zones', self.server.cameras[0])
+        self.assertIsNone(self.client._originals)
@@ -0,0 +1,96 @@
+import io
+import unittest
+
+from uvcclient import camera
+from uvcclient import fakeserver
+from uvcclient import nvr
+
+
+class TestFakeNVR(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeNVR(cameras=5, alerts=3,
+                                         apikey='key').start()
+        self.addCleanup(self.server.stop)
+        self.client = nvr.UVCRemote('127.0.0.1', self.server.port, 'key')
+        self.addCleanup(self.client.close)
+
+    def test_bootstrap(self):
+        self.assertEqual((3, 10, 0), self.client.server_version)
+
+    def test_index(self):
+        index = self.client.index()
+        self.assertEqual(5, len(index))
+        self.assertEqual('Camera 0', index[0]['name'])
+
+    def test_bad_apikey(self):
+        client = nvr.UVCRemote('127.0.0.1', self.server.port, 'wrong')
+        self.assertRaises(nvr.NotAuthorized, client.index)
+
+    def test_get_and_set(self):
+        ident = self.server.cameras[1]['_id']
+        self.assertEqual('auto', self.client.get_irledmode(ident))
+        self.client.set_irledmode(ident, 'off')
+        self.assertEqual('off', self.client.get_irledmode(ident))
+        self.assertEqual('manual',
+                         self.server.cameras[1]['ispSettings']['irLedMode'])
+
+    def test_missing_camera(self):
+        self.assertRaises(nvr.NvrError, self.client.get_camera, 'nope')
+
+    def test_alerts(self):
+        alerts = self.client.get_all_alerts()
+        self.assertEqual(3, len(alerts))
+        alerts[0]['alertState'] = 'deleted'
+        self.client.delete_alert(alerts[0])
+        self.assertEqual(2, len(self.client.get_all_alerts()))
+
+    def test_snapshot(self):
+        ident = self.server.cameras[0]['_id']
+        image = self.client.get_snapshot(ident)
+        self.assertEqual(len(self.server.snapshot), len(image))
+        self.assertTrue(image.startswith(b'\xff\xd8'))
+
+    def test_gzip(self):
+        self.server.gzip = True
+        self.assertEqual(5, len(self.client.index()))
+
+    def test_errors(self):
+        self.server.error_rate = 1
+        self.assertRaises(nvr.NvrError, self.client.index)
+        self.assertEqual(1, self.server.requests['GET'])
+
+
+class TestFakeCamera(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeCamera(snapshot_size=1000).start()
+        self.addCleanup(self.server.stop)
+
+    def test_login_and_snapshot(self):
+        client = camera.UVCCameraClient('127.0.0.1', 'ubnt', 'ubnt',
+                                        port=self.server.port)
+        client.login()
+        self.assertEqual(1000, len(client.get_snapshot()))
+        self.assertEqual(1, self.server.logins)
+
+    def test_v320(self):
+        client = camera.UVCCameraClientV320('127.0.0.1', 'ubnt', 'ubnt',
+                                            port=self.server.port)
+        client.login()
+        sink = io.BytesIO()
+        self.assertEqual(1000, client.stream_snapshot(sink))
+        self.assertEqual({'deviceInfo': {'name': 'Fake camera'}},
+                         client.get_status())
+
+    def test_bad_password(self):
+        client = camera.UVCCameraClient('127.0.0.1', 'ubnt', 'wrong',
+                                        port=self.server.port)
+        self.assertRaises(camera.CameraAuthError, client.login)
+
+    def test_relogin(self):
+        client = camera.UVCCameraClient('127.0.0.1', 'ubnt', 'ubnt',
+                                        port=self.server.port)
+        client.login()
+        self.server.expire_sessions()
+        self.assertTrue(client.set_led(False))
+        self.assertEqual('0', self.server.config['led.front.status'])
+        self.assertEqual(2, self.server.logins)
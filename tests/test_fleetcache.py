@@ -0,0 +1,145 @@
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import mock
+
+from uvcclient import fakeserver
+from uvcclient import fleetcache
+from uvcclient import main
+from uvcclient import nvr
+from uvcclient import store
+
+
+class TestFleetCache(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeNVR(cameras=5).start()
+        self.addCleanup(self.server.stop)
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.path = os.path.join(tmpdir, 'fleet')
+        self.client = self._client()
+
+    def _client(self):
+        client = nvr.UVCRemote('127.0.0.1', self.server.port, 'key')
+        self.addCleanup(client.close)
+        return client
+
+    def _cache(self, client=None, **kwargs):
+        return fleetcache.FleetCache(client or self.client, path=self.path,
+                                     **kwargs)
+
+    def test_missing(self):
+        fleet = self._cache().snapshot()
+        self.assertTrue(os.path.exists(self.path))
+        self.assertEqual(len(self.server.cameras), len(fleet))
+        self.assertEqual(self.client.index(), fleet.index())
+
+    def test_fresh(self):
+        self._cache().refresh()
+        requests = self.server.request_count
+        client = self._client()
+        fleet = self._cache(client).snapshot()
+        ident = self.server.cameras[2]['_id']
+        self.assertEqual('motion', fleet.get_recordmode(ident))
+        self.assertEqual(ident, fleet.name_to_uuid('camera 2'))
+        self.assertEqual(self.server.cameras[3]['zones'],
+                         fleet.list_zones(self.server.cameras[3]['_id']))
+        self.assertEqual('id', client.camera_identifier)
+        self.assertEqual(requests, self.server.request_count)
+
+    def test_lazy(self):
+        self._cache().refresh()
+        fleet = self._cache().snapshot()
+        fleet.index()
+        self.assertEqual({}, fleet._docs)
+        cam = self.server.cameras[1]
+        self.assertEqual(cam, fleet.lookup(cam['mac'].lower()))
+        self.assertEqual([cam['_id']], list(fleet._docs))
+        self.assertIsNone(fleet.lookup('nothing'))
+
+    def test_stale(self):
+        self._cache().refresh()
+        self.server.cameras[0]['name'] = 'Renamed'
+        cache = self._cache(max_age=-1)
+        fleet = cache.snapshot()
+        # The old copy answers now, the new one is there for next time
+        self.assertEqual('Camera 0', fleet.index()[0]['name'])
+        cache.wait()
+        self.assertEqual('Renamed',
+                         self._cache().snapshot().index()[0]['name'])
+
+    def test_too_stale(self):
+        self._cache().refresh()
+        self.server.cameras[0]['name'] = 'Renamed'
+        fleet = self._cache(stale_age=-1).snapshot()
+        self.assertEqual('Renamed', fleet.index()[0]['name'])
+
+    def test_corrupt(self):
+        with open(self.path, 'wb') as f:
+            f.write(fleetcache.MAGIC + b'0000000100\n{"time"')
+        fleet = self._cache().snapshot()
+        self.assertEqual(len(self.server.cameras), len(fleet))
+        with open(self.path, 'wb'):
+            pass
+        self.assertEqual(len(self.server.cameras),
+                         len(self._cache().snapshot()))
+
+    def test_new_camera(self):
+        self._cache().refresh()
+        self.server.cameras.append(fakeserver.make_camera(9))
+        fleet = self._cache().snapshot()
+        self.assertIsNone(fleet.lookup('Camera 9'))
+        self.assertEqual('motion', fleet.get_recordmode(
+            self.server.cameras[-1]['_id']))
+
+    def test_invalidate(self):
+        cache = self._cache()
+        cache.refresh()
+        cache.invalidate()
+        self.assertFalse(os.path.exists(self.path))
+        cache.invalidate()
+
+
+class TestCliFleetCache(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeNVR(cameras=3).start()
+        self.addCleanup(self.server.stop)
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.path = os.path.join(tmpdir, 'fleet')
+        for target, value in (
+                ('uvcclient.fleetcache.default_path', self.path),
+                ('uvcclient.store.get_cache_store',
+                 store.CacheStore(os.path.join(tmpdir, 'cache')))):
+            patcher = mock.patch(target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _run(self, *args):
+        argv = ['uvc', '-H', '127.0.0.1', '-P', str(self.server.port),
+                '-K', 'key'] + list(args)
+        with mock.patch.object(sys, 'argv', argv):
+            with mock.patch('sys.stdout', new_callable=io.StringIO) as out:
+                main.main()
+        return out.getvalue()
+
+    def test_max_age(self):
+        self.assertIn('motion', self._run('--name', 'Camera 1',
+                                          '--get-recordmode'))
+        self.server.cameras[1]['recordingSettings'][
+            'fullTimeRecordEnabled'] = True
+        self.assertIn('motion', self._run('--name', 'Camera 1',
+                                          '--get-recordmode'))
+        self.assertIn('full', self._run('--name', 'Camera 1',
+                                        '--get-recordmode', '--max-age', '0'))
+
+    def test_invalidate(self):
+        self._run('-l')
+        self._run('--name', 'Camera 1', '--get-irledmode')
+        self.assertTrue(os.path.exists(self.path))
+        self._run('--name', 'Camera 1', '--irledmode', 'off')
+        self.assertFalse(os.path.exists(self.path))
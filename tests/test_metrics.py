@@ -0,0 +1,81 @@
+import unittest
+
+from uvcclient import fakeserver
+from uvcclient import metrics
+from uvcclient import nvr
+
+
+class TestHistogram(unittest.TestCase):
+    def test_cumulative(self):
+        hist = metrics.Histogram((0.1, 1))
+        for value in (0.05, 0.5, 0.7, 3):
+            hist.observe(value)
+        self.assertEqual([(0.1, 1), (1, 3), (float('inf'), 4)],
+                         hist.cumulative())
+        self.assertAlmostEqual(4.25, hist.sum)
+
+    def test_endpoint(self):
+        self.assertEqual('/api/2.0/camera/:id',
+                         metrics.endpoint('/api/2.0/camera/'
+                                          '55dd3dcd00ab5ba5a4a0f61a'))
+        uuid = '00000000-0000-0000-0000-000000000001'
+        self.assertEqual('/api/2.0/snapshot/camera/:id',
+                         metrics.endpoint('/api/2.0/snapshot/camera/%s'
+                                          '?force=true' % uuid))
+        self.assertEqual('/api/2.0/camera',
+                         metrics.endpoint('/api/2.0/camera'))
+
+
+class TestRequestHooks(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeNVR(cameras=3, gzip=True).start()
+        self.addCleanup(self.server.stop)
+        self.client = nvr.UVCRemote('127.0.0.1', self.server.port, 'key')
+        self.addCleanup(self.client.close)
+
+    def test_hooks(self):
+        before = []
+        after = []
+        self.client.add_request_hook(post=after.append, pre=before.append)
+        self.client.index()
+        self.assertEqual(after, before)
+        info = [i for i in after if i.path == '/api/2.0/camera'][0]
+        self.assertEqual(200, info.status)
+        self.assertTrue(info.bytes_in > 0)
+        self.assertTrue(info.parse_time > 0)
+        self.assertTrue(info.latency >= info.parse_time)
+
+        self.client.remove_request_hook(after.append)
+        self.client.get_camera(self.server.cameras[0]['_id'])
+        self.assertEqual(len(before), len(after) + 1)
+
+    def test_failure(self):
+        infos = []
+        self.client.add_request_hook(post=infos.append)
+        self.assertRaises(nvr.NvrError, self.client.get_camera, 'nope')
+        self.assertEqual(404, infos[-1].status)
+        self.assertIsInstance(infos[-1].error, nvr.NvrError)
+
+    def test_broken_hook(self):
+        self.client.add_request_hook(post=lambda info: 1 / 0)
+        self.assertEqual(3, len(self.client.index()))
+
+    def test_collector(self):
+        collector = metrics.RequestMetrics().install(self.client)
+        self.client.get_camera(self.server.cameras[0]['_id'])
+        self.client.get_camera(self.server.cameras[1]['_id'])
+        summary = collector.summary()
+        stats = summary['GET /api/2.0/camera/:id']
+        self.assertEqual(2, stats['count'])
+        self.assertEqual({200: 2}, stats['statuses'])
+        self.assertTrue(stats['decompress_time'] > 0)
+
+        text = collector.prometheus()
+        self.assertIn('# TYPE uvcclient_request_duration_seconds histogram',
+                      text)
+        self.assertIn('uvcclient_request_duration_seconds_count{'
+                      'endpoint="/api/2.0/camera/:id",method="GET"} 2', text)
+        self.assertIn('uvcclient_requests_total{'
+                      'endpoint="/api/2.0/camera/:id",method="GET",'
+                      'status="200"} 2', text)
+        self.assertIn('le="+Inf"', text)
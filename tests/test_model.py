@@ -0,0 +1,85 @@
+import json
+import unittest
+
+from uvcclient import fakeserver
+from uvcclient import model
+from uvcclient import nvr
+
+
+class TestCamera(unittest.TestCase):
+    def setUp(self):
+        self.doc = fakeserver.make_camera(3)
+        self.doc['someFutureField'] = {'nested': [1, 2]}
+        self.text = json.dumps(self.doc)
+
+    def test_lazy(self):
+        cam = model.Camera.from_json(self.text)
+        self.assertEqual(self.doc['name'], cam.name)
+        self.assertEqual(self.doc['_id'], cam.id)
+        self.assertEqual(self.doc['host'], cam.host)
+        self.assertFalse(cam.decoded)
+        self.assertEqual(self.text, cam.to_json())
+
+        self.assertEqual(self.doc['model'], cam.model)
+        self.assertTrue(cam.decoded)
+
+    def test_round_trip(self):
+        cam = model.Camera.from_json(self.text)
+        self.assertEqual(self.doc, cam.to_payload())
+        self.assertEqual(list(self.doc), list(cam.to_payload()))
+        self.assertEqual(self.doc, json.loads(cam.to_json()))
+
+    def test_sections(self):
+        cam = model.Camera.from_json(self.text)
+        isp = cam.isp_settings
+        self.assertEqual(self.doc['ispSettings']['brightness'],
+                         isp.brightness)
+        isp.brightness = 77
+        cam.recording_settings.full_time_record_enabled = True
+        cam.osd_settings.enable_date = 0
+        cam.name = 'Renamed'
+
+        expected = json.loads(self.text)
+        expected['ispSettings']['brightness'] = 77
+        expected['recordingSettings']['fullTimeRecordEnabled'] = True
+        expected['osdSettings']['enableDate'] = 0
+        expected['name'] = 'Renamed'
+        self.assertEqual(expected, json.loads(cam.to_json()))
+        self.assertEqual('Renamed', cam.name)
+        self.assertEqual('full', cam.recording_settings.mode)
+        self.assertIs(isp, cam.isp_settings)
+
+    def test_modes(self):
+        cam = model.Camera.from_document(self.doc)
+        isp = cam.isp_settings
+        isp.ir_led_mode = 'manual'
+        isp.ir_led_level = 0
+        self.assertEqual('off', isp.ir_led)
+        isp.icr_sensitivity = 2
+        self.assertEqual('high', isp.ir_sensitivity)
+        self.assertEqual(nvr._index_entry(self.doc), cam.index_entry())
+
+
+class TestClientModels(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeNVR(cameras=4).start()
+        self.addCleanup(self.server.stop)
+        self.client = nvr.UVCRemote('127.0.0.1', self.server.port, 'key')
+        self.addCleanup(self.client.close)
+
+    def test_camera_models(self):
+        self.server.cameras[1]['deleted'] = True
+        cams = self.client.camera_models()
+        self.assertEqual(self.client.index(),
+                         [cam.index_entry() for cam in cams])
+        self.assertFalse(any(cam.decoded for cam in cams))
+        self.assertEqual(self.server.cameras[0], cams[0].to_payload())
+
+    def test_put_camera(self):
+        ident = self.server.cameras[2]['_id']
+        cam = self.client.get_camera_model(ident)
+        cam.recording_settings.motion_record_enabled = False
+        cam.recording_settings.full_time_record_enabled = True
+        updated = self.client.put_camera(cam)
+        self.assertEqual('full', updated.recording_settings.mode)
+        self.assertEqual('full', self.client.get_recordmode(ident))
@@ -0,0 +1,107 @@
+import io
+import threading
+import time
+import unittest
+
+import mock
+
+from uvcclient import camera
+from uvcclient import nvr
+from uvcclient import poller
+
+
+class TestPercentile(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, poller.percentile(values, 50))
+        self.assertEqual(90, poller.percentile(values, 90))
+        self.assertEqual(100, poller.percentile(values, 100))
+        self.assertEqual(7, poller.percentile([7], 99))
+        self.assertIsNone(poller.percentile([], 50))
+
+
+class TestSnapshotPoller(unittest.TestCase):
+    def setUp(self):
+        super(TestSnapshotPoller, self).setUp()
+        self.client = mock.MagicMock()
+        self.client.server_version = (3, 2, 0)
+        self.client.camera_identifier = 'id'
+        self.client.get_camera.side_effect = lambda ident: {
+            '_id': ident, 'host': 'host-%s' % ident, 'username': 'ubnt',
+            'uuid': ident}
+        self.client._snapshot_response.side_effect = (
+            lambda ident: io.BytesIO(b'nvr-image'))
+        patcher = mock.patch.object(camera, 'UVCCameraClientV320')
+        self.mock_cam = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_cam.return_value._snapshot_response.side_effect = (
+            lambda: io.BytesIO(b'image'))
+        self.frames = []
+
+    def callback(self, ident, image, timestamp):
+        self.frames.append((ident, image))
+
+    def test_reuses_session(self):
+        # Once the camera has worked, the NVR is tried once to compare
+        self.client._snapshot_response.side_effect = nvr.NvrError()
+        p = poller.SnapshotPoller(self.client, ['a'], 1, self.callback,
+                                  password_lookup=lambda info: 'secret')
+        for i in range(3):
+            p._poll('a')
+        self.mock_cam.assert_called_once_with('host-a', 'ubnt', 'secret',
+                                              port=80, session_store=None,
+                                              policy=self.client.policy)
+        self.client.get_camera.assert_called_once_with('a')
+        self.assertEqual([('a', b'image')] * 3, self.frames)
+        self.assertEqual(3, p.stats()['a']['frames'])
+
+    def test_policy(self):
+        policy = mock.sentinel.policy
+        p = poller.SnapshotPoller(self.client, ['a'], 1, self.callback,
+                                  policy=policy)
+        p.fetch('a')
+        self.assertEqual(policy, self.mock_cam.call_args[1]['policy'])
+
+    def test_falls_back_to_nvr(self):
+        self.mock_cam.return_value.ensure_login.side_effect = (
+            camera.CameraConnectError())
+        p = poller.SnapshotPoller(self.client, ['a'], 1, self.callback)
+        self.assertEqual(b'nvr-image', p.fetch('a'))
+        self.assertEqual(b'nvr-image', p.fetch('a'))
+        # The camera is not retried until retry_direct has passed
+        self.assertEqual(
+            1, self.mock_cam.return_value.ensure_login.call_count)
+        self.client._snapshot_response.assert_called_with('a')
+
+    def test_nvr_only(self):
+        p = poller.SnapshotPoller(self.client, ['a'], 1, self.callback,
+                                  direct=False)
+        self.assertEqual(b'nvr-image', p.fetch('a'))
+        self.assertFalse(self.mock_cam.called)
+
+    def test_skips_busy_camera(self):
+        release = threading.Event()
+        self.mock_cam.return_value._snapshot_response.side_effect = (
+            lambda: release.wait() and io.BytesIO(b'image'))
+        p = poller.SnapshotPoller(self.client, ['a'], 0.01, self.callback)
+        p.start()
+        time.sleep(0.2)
+        release.set()
+        p.stop()
+        stats = p.stats()['a']
+        self.assertEqual(1, stats['frames'])
+        self.assertTrue(stats['skipped'] > 0)
+
+    def test_run(self):
+        p = poller.SnapshotPoller(self.client, ['a', 'b'],
+                                  {'a': 0.02, 'b': 0.05}, self.callback)
+        p.run(0.3)
+        stats = p.stats()
+        self.assertTrue(stats['a']['frames'] > stats['b']['frames'] > 0)
+        self.assertEqual(0, stats['a']['errors'])
+        self.assertIsNotNone(stats['a']['p90'])
+        self.assertTrue(stats['a']['fps'] > 0)
+
+    def test_missing_interval(self):
+        self.assertRaises(ValueError, poller.SnapshotPoller, self.client,
+                          ['a', 'b'], {'a': 1}, self.callback)
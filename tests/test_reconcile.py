@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from uvcclient import fakeserver
+from uvcclient import nvr
+from uvcclient import reconcile
+
+
+class TestDesiredState(unittest.TestCase):
+    def test_invalid(self):
+        self.assertRaises(nvr.Invalid, reconcile.DesiredState.from_dict,
+                          {'defaults': {'nosuchsetting': 1}})
+        self.assertRaises(nvr.Invalid, reconcile.DesiredState.from_dict,
+                          {'defaults': {'irledmode': 'sometimes'}})
+        self.assertRaises(nvr.Invalid, reconcile.DesiredState.from_dict,
+                          {'default': {}})
+        for value in ('60', None, True, 1.5, [60]):
+            self.assertRaises(nvr.Invalid,
+                              reconcile.DesiredState.from_dict,
+                              {'defaults': {'brightness': value}})
+
+    def test_precedence(self):
+        desired = reconcile.DesiredState.from_dict({
+            'defaults': {'brightness': 40, 'hue': 40, 'contrast': 40},
+            'groups': {'garage*': {'brightness': 50, 'hue': 50}},
+            'cameras': {'x': {'brightness': 60}},
+        })
+        settings = desired.settings_for({'name': 'Garage Door'}, 'x')
+        self.assertEqual({'brightness': 60, 'hue': 50, 'contrast': 40},
+                         dict(settings))
+        settings = desired.settings_for({'name': 'Porch'})
+        self.assertEqual({'brightness': 40, 'hue': 40, 'contrast': 40},
+                         dict(settings))
+
+
+class TestReconcile(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeNVR(cameras=6).start()
+        self.addCleanup(self.server.stop)
+        self.server.cameras[0]['name'] = 'Garage 1'
+        self.server.cameras[1]['name'] = 'Garage 2'
+        self.client = nvr.UVCRemote('127.0.0.1', self.server.port, 'key')
+        self.addCleanup(self.client.close)
+        self.desired = reconcile.DesiredState.from_dict({
+            'defaults': {'irledmode': 'auto', 'recordmode': 'motion'},
+            'groups': {'garage*': {'irsensitivity': 'high'}},
+            'cameras': {'Camera 5': {'brightness': 60},
+                        'Missing': {'brightness': 60}},
+        })
+
+    def test_plan(self):
+        plan = reconcile.plan(self.client, self.desired)
+        self.assertEqual(['Garage 1', 'Garage 2', 'Camera 5'],
+                         [camera.name for camera in plan])
+        self.assertEqual({'icrSensitivity': (0, 2)},
+                         plan.cameras[0].changes['irsensitivity'])
+        self.assertEqual(['brightness'], list(plan.cameras[2].changes))
+        self.assertEqual(['Missing'], plan.unmatched)
+        self.assertIn('Missing: no such camera', plan.describe())
+
+    def test_case_insensitive(self):
+        desired = reconcile.DesiredState.from_dict({
+            'cameras': {'camera 5': {'brightness': 60},
+                        self.server.cameras[4]['mac'].lower():
+                        {'brightness': 70}}})
+        plan = reconcile.plan(self.client, desired)
+        self.assertEqual([], plan.unmatched)
+        self.assertEqual(['Camera 4', 'Camera 5'],
+                         [camera.name for camera in plan])
+
+    def test_unmatched_not_applied(self):
+        plan, results = reconcile.reconcile(self.client, self.desired)
+        self.assertEqual(3, len(plan))
+        self.assertIsNone(results)
+        self.assertNotIn('PUT', self.server.requests)
+
+    def test_dry_run(self):
+        plan, results = reconcile.reconcile(self.client, self.desired,
+                                            dry_run=True)
+        self.assertEqual(3, len(plan))
+        self.assertIsNone(results)
+        self.assertNotIn('PUT', self.server.requests)
+
+    def test_apply(self):
+        del self.desired.cameras['Missing']
+        plan, results = reconcile.reconcile(self.client, self.desired)
+        self.assertTrue(all(result.ok for result in results.values()))
+        self.assertEqual(3, self.server.requests['PUT'])
+        self.assertEqual(2, self.server.cameras[1]['ispSettings']
+                         ['icrSensitivity'])
+        self.assertEqual(60, self.server.cameras[5]['ispSettings']
+                         ['brightness'])
+        # Nothing left to do the second time around
+        plan, results = reconcile.reconcile(self.client, self.desired)
+        self.assertEqual(0, len(plan))
+        self.assertEqual(3, self.server.requests['PUT'])
+
+    def test_load(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'desired.json')
+        with open(path, 'w') as f:
+            json.dump({'groups': {'b*': {'hue': 1}, 'a*': {'hue': 2}}}, f)
+        desired = reconcile.DesiredState.load(path)
+        self.assertEqual(['b*', 'a*'], [p for p, s in desired.groups])
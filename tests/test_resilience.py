@@ -0,0 +1,141 @@
+import socket
+import time
+import unittest
+
+import mock
+
+from uvcclient import camera
+from uvcclient import fakeserver
+from uvcclient import metrics
+from uvcclient import nvr
+from uvcclient import resilience
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_trip_and_reset(self):
+        breaker = resilience.CircuitBreaker(failure_threshold=2,
+                                            reset_timeout=0.05)
+        breaker.failure()
+        self.assertEqual(resilience.CLOSED, breaker.state)
+        breaker.failure()
+        self.assertEqual(resilience.OPEN, breaker.state)
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.06)
+        self.assertEqual(resilience.HALF_OPEN, breaker.state)
+        self.assertTrue(breaker.allow())
+        # Only one trial request at a time
+        self.assertFalse(breaker.allow())
+        breaker.success()
+        self.assertEqual(resilience.CLOSED, breaker.state)
+        self.assertEqual({'state': 'closed', 'failures': 0, 'trips': 1,
+                          'rejected': 2}, breaker.stats())
+
+    def test_failed_trial_reopens(self):
+        breaker = resilience.CircuitBreaker(failure_threshold=1,
+                                            reset_timeout=0.05)
+        breaker.failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertEqual(resilience.OPEN, breaker.state)
+        self.assertEqual(2, breaker.stats()['trips'])
+
+
+class TestPolicy(unittest.TestCase):
+    def setUp(self):
+        self.policy = resilience.Policy(retries=2, backoff=0)
+        self.fn = mock.MagicMock()
+
+    def test_retry_get(self):
+        self.fn.side_effect = [socket.error('reset'), 'ok']
+        self.assertEqual('ok', self.policy.call('host', 'GET', self.fn))
+        self.assertEqual(2, self.fn.call_count)
+
+    def test_gives_up(self):
+        self.fn.side_effect = socket.timeout('slow')
+        self.assertRaises(socket.timeout, self.policy.call, 'host', 'GET',
+                          self.fn)
+        self.assertEqual(3, self.fn.call_count)
+
+    def test_put_only_retried_before_sending(self):
+        self.fn.side_effect = socket.timeout('slow')
+        self.assertRaises(socket.timeout, self.policy.call, 'host', 'PUT',
+                          self.fn)
+        self.assertEqual(1, self.fn.call_count)
+
+        self.fn.reset_mock()
+        self.fn.side_effect = [resilience.ConnectError('refused'), 'ok']
+        self.assertEqual('ok', self.policy.call('host', 'PUT', self.fn))
+
+    def test_not_transient(self):
+        self.fn.side_effect = nvr.NotAuthorized()
+        self.assertRaises(nvr.NotAuthorized, self.policy.call, 'host',
+                          'GET', self.fn)
+        self.assertEqual(1, self.fn.call_count)
+
+    def test_breaker(self):
+        self.policy.breakers = resilience.BreakerRegistry(
+            failure_threshold=3)
+        self.fn.side_effect = socket.error('down')
+        self.assertRaises(socket.error, self.policy.call, 'host', 'GET',
+                          self.fn)
+        self.assertRaises(resilience.CircuitOpen, self.policy.call, 'host',
+                          'GET', self.fn)
+        self.assertEqual(3, self.fn.call_count)
+        self.fn.side_effect = None
+        self.policy.call('other', 'GET', self.fn)
+        self.assertEqual(['host', 'other'],
+                         sorted(self.policy.breakers.stats()))
+
+    def test_delay(self):
+        policy = resilience.Policy(backoff=1, max_backoff=3)
+        for attempt in range(5):
+            delay = policy.delay(attempt)
+            self.assertTrue(0 <= delay <= min(3, 2 ** attempt))
+
+
+class TestClients(unittest.TestCase):
+    def setUp(self):
+        self.breakers = resilience.BreakerRegistry(failure_threshold=2)
+        self.policy = resilience.Policy(connect_timeout=1, read_timeout=0.2,
+                                        retries=1, backoff=0,
+                                        breakers=self.breakers)
+
+    def test_read_timeout(self):
+        with fakeserver.FakeNVR(cameras=1, latency=0.5) as server:
+            client = nvr.UVCRemote('127.0.0.1', server.port, 'key',
+                                   policy=self.policy)
+            start = time.time()
+            self.assertRaises(nvr.NvrError, client.index)
+            self.assertTrue(time.time() - start < 1)
+            self.assertEqual(2, server.requests['GET'])
+            client.close()
+
+    def test_server_errors_retried(self):
+        with fakeserver.FakeNVR(cameras=1, error_rate=1) as server:
+            client = nvr.UVCRemote('127.0.0.1', server.port, 'key',
+                                   policy=self.policy)
+            self.assertRaises(nvr.NvrServerError, client.index)
+            self.assertEqual(2, server.requests['GET'])
+            # The breaker is open now, so nothing more is sent
+            self.assertRaises(nvr.NvrError, client.get_camera, 'foo')
+            self.assertEqual(2, server.requests['GET'])
+            client.close()
+
+    def test_shared_with_camera(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        cam = camera.UVCCameraClient('127.0.0.1', 'ubnt', 'ubnt',
+                                     port=port, policy=self.policy)
+        self.assertRaises(camera.CameraConnectError, cam.login)
+        self.assertRaises(camera.CameraConnectError, cam.login)
+        state = self.breakers.stats()['127.0.0.1:%i' % port]
+        self.assertEqual('open', state['state'])
+        self.assertEqual(1, state['rejected'])
+
+        exported = metrics.RequestMetrics(breakers=self.breakers).prometheus()
+        self.assertIn('uvcclient_circuit_state{host="127.0.0.1:%i",'
+                      'state="open"} 1' % port, exported)
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from uvcclient import fakeserver
+from uvcclient import nvr
+from uvcclient import resolver
+from uvcclient import store
+
+
+class TestCameraResolver(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeNVR(cameras=12).start()
+        self.addCleanup(self.server.stop)
+        self.server.cameras[3]['name'] = 'Front Porch'
+        self.server.cameras[4]['name'] = 'Back Porch'
+        self.client = nvr.UVCRemote('127.0.0.1', self.server.port, 'key')
+        self.addCleanup(self.client.close)
+
+    def test_lookup_keys(self):
+        cam = self.server.cameras[3]
+        res = self.client.resolver
+        for key in (cam['_id'], cam['uuid'], cam['host'], 'front porch',
+                    cam['mac'], '80:2a:a8:00:00:03'):
+            self.assertEqual(cam['_id'], res.resolve(key), key)
+        self.assertEqual(1, self.server.requests['GET'] - 1)
+
+    def test_name_to_uuid(self):
+        for i in range(5):
+            self.assertEqual(self.server.cameras[3]['_id'],
+                             self.client.name_to_uuid('Front Porch'))
+        # One bootstrap and one camera list
+        self.assertEqual(2, self.server.requests['GET'])
+
+    def test_find(self):
+        res = self.client.resolver
+        self.assertEqual(['Front Porch'],
+                         [c['name'] for c in res.find('front')])
+        self.assertEqual(['Front Porch', 'Back Porch'],
+                         [c['name'] for c in res.find('*PORCH')])
+        self.assertEqual(3, len(res.find('camera 1')))
+
+    @mock.patch('time.time')
+    def test_refresh_on_miss(self, mock_time):
+        mock_time.return_value = 1000
+        res = resolver.CameraResolver(self.client, ttl=None, min_refresh=5)
+        self.assertIsNone(res.lookup('Garage'))
+        self.server.cameras[0]['name'] = 'Garage'
+        # Too soon after the last refresh
+        self.assertIsNone(res.lookup('Garage'))
+        mock_time.return_value = 1010
+        self.assertEqual('Garage', res.lookup('garage')['name'])
+
+    @mock.patch('time.time')
+    def test_ttl(self, mock_time):
+        mock_time.return_value = 1000
+        res = resolver.CameraResolver(self.client, ttl=60)
+        self.assertEqual('Camera 0', res.lookup(
+            self.server.cameras[0]['_id'])['name'])
+        self.server.cameras[0]['name'] = 'Garage'
+        self.assertEqual('Camera 0', res.lookup(
+            self.server.cameras[0]['_id'])['name'])
+        mock_time.return_value = 1100
+        self.assertEqual('Garage', res.lookup(
+            self.server.cameras[0]['_id'])['name'])
+
+    def test_persisted(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        cache = store.CacheStore(os.path.join(tmpdir, 'cache'))
+        resolver.CameraResolver(self.client, store=cache).refresh()
+        requests = self.server.request_count
+        res = resolver.CameraResolver(self.client, store=cache)
+        self.assertEqual(12, len(res.cameras()))
+        self.assertEqual(requests, self.server.request_count)
+
+    def test_persisted_miss(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        cache = store.CacheStore(os.path.join(tmpdir, 'cache'))
+        with mock.patch('time.time', return_value=1000):
+            resolver.CameraResolver(self.client, store=cache).refresh()
+        self.server.cameras[0]['name'] = 'Garage'
+        with mock.patch('time.time', return_value=1060):
+            res = resolver.CameraResolver(self.client, store=cache)
+            # The saved index is a minute old, so a miss refreshes it
+            self.assertEqual('Garage', res.lookup('garage')['name'])
+
+    def test_fleet_snapshot(self):
+        self.client.server_version
+        fleet = self.client.fleet_snapshot()
+        requests = self.server.request_count
+        self.assertEqual(self.server.cameras[4]['_id'],
+                         fleet.name_to_uuid('back porch'))
+        self.assertEqual(requests, self.server.request_count)
@@ -0,0 +1,121 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import mock
+
+from uvcclient import fakeserver
+from uvcclient import nvr
+from uvcclient import router
+from uvcclient import store
+
+
+class TestSnapshotRouter(unittest.TestCase):
+    def setUp(self):
+        self.nvr = fakeserver.FakeNVR(cameras=1, snapshot_size=1000).start()
+        self.addCleanup(self.nvr.stop)
+        self.camera = fakeserver.FakeCamera(snapshot_size=2000).start()
+        self.addCleanup(self.camera.stop)
+        self.nvr.cameras[0]['host'] = '127.0.0.1'
+        self.client = nvr.UVCRemote('127.0.0.1', self.nvr.port, 'key')
+        self.addCleanup(self.client.close)
+        self.info = self.client.get_camera(self.nvr.cameras[0]['_id'])
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.store = store.CacheStore(os.path.join(tmpdir, 'cache'))
+
+    def _router(self, **kwargs):
+        return router.SnapshotRouter(self.client, store=self.store,
+                                     camera_port=self.camera.port, **kwargs)
+
+    def test_prefers_direct(self):
+        snapshots = self._router()
+        self.assertEqual(self.camera.snapshot,
+                         snapshots.get_snapshot(self.info))
+        routes = snapshots.table()[self.info['_id']]
+        self.assertIsNotNone(routes[router.DIRECT].ewma)
+        self.assertIsNone(routes[router.NVR].ewma)
+
+    def test_unreachable_camera(self):
+        self.camera.stop()
+        snapshots = self._router()
+        self.assertEqual(self.nvr.snapshot, snapshots.get_snapshot(self.info))
+        routes = snapshots.table()[self.info['_id']]
+        self.assertEqual(1, routes[router.DIRECT].failures)
+
+        # The direct route is not tried again until its cooldown passes,
+        # even by a router started later
+        snapshots = self._router()
+        self.assertEqual([router.NVR, router.DIRECT],
+                         snapshots.plan(self.info))
+        out = io.BytesIO()
+        self.assertEqual(len(self.nvr.snapshot),
+                         snapshots.stream_snapshot(self.info, out))
+        self.assertEqual(1, snapshots.table()[self.info['_id']]
+                         [router.DIRECT].failures)
+
+    def test_fastest_and_probe(self):
+        snapshots = self._router(probe_interval=3600)
+        routes = snapshots._routes(self.info['_id'])
+        routes[router.DIRECT].ewma = 0.5
+        routes[router.NVR].ewma = 0.1
+        # Direct was never attempted, so it is probed first
+        self.assertEqual([router.DIRECT, router.NVR],
+                         snapshots.plan(self.info))
+        snapshots.get_snapshot(self.info)
+        self.assertEqual([router.NVR, router.DIRECT],
+                         snapshots.plan(self.info))
+
+    def test_saves_on_route_change(self):
+        snapshots = self._router()
+        ident = self.info['_id']
+        with mock.patch.object(self.store, 'put',
+                               wraps=self.store.put) as put:
+            # The untried NVR route becomes the one to try next
+            snapshots._record(ident, router.DIRECT, 0.1)
+            self.assertEqual(1, put.call_count)
+            # Direct is faster
+            snapshots._record(ident, router.NVR, 0.5)
+            self.assertEqual(2, put.call_count)
+            for i in range(3):
+                snapshots._record(ident, router.DIRECT, 0.2)
+            self.assertEqual(2, put.call_count)
+            snapshots._record(ident, router.DIRECT)
+            self.assertEqual(3, put.call_count)
+
+    def test_reuses_camera_client(self):
+        snapshots = self._router()
+        snapshots.get_snapshot(self.info)
+        cam_client = snapshots._camera_client(self.info)
+        snapshots.get_snapshot(self.info)
+        snapshots.get_snapshot(self.info)
+        self.assertIs(cam_client, snapshots._camera_client(self.info))
+
+        # A camera client that failed is not kept
+        self.camera.stop()
+        routes = snapshots._routes(self.info['_id'])
+        routes[router.NVR].ewma = 10
+        routes[router.NVR].last_attempt = time.time()
+        self.assertEqual(self.nvr.snapshot, snapshots.get_snapshot(self.info))
+        self.assertEqual({}, snapshots._camera_clients)
+
+    def test_no_host(self):
+        del self.info['host']
+        self.assertEqual([router.NVR], self._router().plan(self.info))
+
+    def test_no_usable_route(self):
+        del self.info['host']
+        snapshots = self._router(routes=(router.DIRECT,))
+        self.assertEqual([], snapshots.plan(self.info))
+        with self.assertRaises(nvr.NvrError) as cm:
+            snapshots.get_snapshot(self.info)
+        self.assertIn(self.info['_id'], str(cm.exception))
+
+    def test_all_routes_fail(self):
+        self.camera.stop()
+        self.nvr.error_rate = 1
+        self.assertRaises(nvr.NvrError, self._router().get_snapshot,
+                          self.info)
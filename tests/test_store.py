@@ -1,5 +1,8 @@
 import contextlib
 import mock
+import os
+import shutil
+import tempfile
 import unittest
 
 from uvcclient import store
@@ -66,3 +69,63 @@ class TestStore(unittest.TestCase):
             s.set_camera_password('foo', 'bar')
             mock_save.assert_called_once_with()
         self.assertEqual({'foo': 'bar'}, s.get_camera_passwords())
+
+    @mock.patch('time.time')
+    def test_camera_sessions(self, mock_time):
+        mock_time.return_value = 1000
+        with mock.patch.object(builtins, 'open') as mock_open:
+            mock_open.side_effect = OSError
+            s = store.InfoStore('barfoo')
+        with mock.patch.object(s, 'save') as mock_save:
+            s.set_camera_session('cam:80', 'cookie', 1100)
+            s.set_camera_session('old:80', 'stale', 1050)
+            self.assertEqual(2, mock_save.call_count)
+        self.assertEqual('cookie', s.get_camera_session('cam:80'))
+        self.assertIsNone(s.get_camera_session('nothere'))
+        mock_time.return_value = 1060
+        self.assertIsNone(s.get_camera_session('old:80'))
+        with mock.patch.object(s, 'save'):
+            s.set_camera_session('new:80', 'cookie', 1200)
+        self.assertNotIn('old:80', s._data['camera_sessions'])
+
+
+class TestCacheStore(unittest.TestCase):
+    def setUp(self):
+        super(TestCacheStore, self).setUp()
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.path = os.path.join(tmpdir, 'cache')
+
+    def test_put_get(self):
+        s = store.CacheStore(self.path)
+        self.assertIsNone(s.get('foo'))
+        s.put('foo', {'bar': 1})
+        self.assertEqual({'bar': 1}, store.CacheStore(self.path).get('foo'))
+        self.assertEqual(0o600, os.stat(self.path).st_mode & 0o777)
+
+    @mock.patch('time.time')
+    def test_expires(self, mock_time):
+        mock_time.return_value = 1000
+        s = store.CacheStore(self.path, ttl=60)
+        s.put('foo', 'bar')
+        mock_time.return_value = 1059
+        self.assertEqual('bar', s.get('foo'))
+        self.assertIsNone(s.get('foo', ttl=30))
+        mock_time.return_value = 1061
+        self.assertIsNone(s.get('foo'))
+
+    def test_invalidate(self):
+        s = store.CacheStore(self.path)
+        s.put('foo', 1)
+        s.put('bar', 2)
+        s.invalidate('foo')
+        self.assertIsNone(s.get('foo'))
+        self.assertEqual(2, s.get('bar'))
+
+    def test_corrupt(self):
+        with open(self.path, 'w') as f:
+            f.write('not json')
+        s = store.CacheStore(self.path)
+        self.assertIsNone(s.get('foo'))
+        s.put('foo', 1)
+        self.assertEqual(1, s.get('foo'))
@@ -0,0 +1,133 @@
+import gzip
+import io
+import json
+import unittest
+
+import mock
+
+from uvcclient import streams
+
+
+class NoReadinto(object):
+    def __init__(self, data):
+        self._f = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self._f.read(size)
+
+
+class TestCopyStream(unittest.TestCase):
+    DATA = b'jpeg' * 1000
+
+    def test_to_file(self):
+        out = io.BytesIO()
+        self.assertEqual(len(self.DATA),
+                         streams.copy_stream(io.BytesIO(self.DATA), out,
+                                             chunk_size=100))
+        self.assertEqual(self.DATA, out.getvalue())
+
+    def test_without_readinto(self):
+        out = io.BytesIO()
+        streams.copy_stream(NoReadinto(self.DATA), out, chunk_size=7)
+        self.assertEqual(self.DATA, out.getvalue())
+
+    def test_to_socket(self):
+        sock = mock.MagicMock(spec=['sendall'])
+        sent = []
+        sock.sendall.side_effect = lambda data: sent.append(bytes(data))
+        streams.copy_stream(io.BytesIO(self.DATA), sock, chunk_size=1024)
+        self.assertEqual(self.DATA, b''.join(sent))
+        self.assertEqual(4, len(sent))
+
+    def test_to_buffer(self):
+        buf = bytearray(5000)
+        count = streams.copy_stream(io.BytesIO(self.DATA), buf)
+        self.assertEqual(len(self.DATA), count)
+        self.assertEqual(self.DATA, bytes(buf[:count]))
+
+    def test_to_buffer_without_readinto(self):
+        buf = bytearray(len(self.DATA))
+        streams.copy_stream(NoReadinto(self.DATA), buf)
+        self.assertEqual(self.DATA, bytes(buf))
+
+    def test_to_buffer_too_small(self):
+        self.assertRaises(ValueError, streams.copy_stream,
+                          io.BytesIO(self.DATA), bytearray(100))
+
+
+def gzipped(data):
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestIterJsonItems(unittest.TestCase):
+    DOC = {'meta': {'total': 3},
+           'data': [{'name': u'caf\u00e9', 'n': 1}, 12345, [1.5, None],
+                    'x'],
+           'more': [1, 2]}
+
+    def test_chunk_sizes(self):
+        data = json.dumps(self.DOC, ensure_ascii=False).encode('utf-8')
+        for size in (1, 2, 3, 7, 64, len(data)):
+            self.assertEqual(self.DOC['data'],
+                             list(streams.iter_json_items(
+                                 chunked(data, size))))
+
+    def test_raw(self):
+        data = json.dumps(self.DOC).encode()
+        for size in (1, 5, len(data)):
+            items = list(streams.iter_json_items(chunked(data, size),
+                                                 raw=True))
+            self.assertEqual(self.DOC['data'], [item for item, t in items])
+            self.assertEqual(self.DOC['data'],
+                             [json.loads(t) for item, t in items])
+
+    def test_numbers_across_chunks(self):
+        for chunks, expected in (
+                ([b'{"data": [1.', b'5, 2]}'], [1.5, 2]),
+                ([b'{"data": [1e', b'3]}'], [1e3]),
+                ([b'{"data": [-', b'12', b']}'], [-12]),
+                ([b'{"data": [12', b'34 ,5]}'], [1234, 5]),
+                ([b'{"n": 1', b'0, "data": [tr', b'ue]}'], [True])):
+            self.assertEqual(expected,
+                             list(streams.iter_json_items(chunks)))
+
+    def test_other_key(self):
+        data = json.dumps(self.DOC).encode()
+        self.assertEqual([1, 2], list(streams.iter_json_items([data],
+                                                              'more')))
+
+    def test_empty(self):
+        for doc in (b'{}', b'{"data": []}', b' { "meta" : {} } '):
+            self.assertEqual([], list(streams.iter_json_items([doc])))
+
+    def test_truncated(self):
+        data = json.dumps(self.DOC).encode()
+        items = streams.iter_json_items(chunked(data[:40], 5))
+        self.assertRaises(ValueError, list, items)
+
+    def test_not_an_object(self):
+        self.assertRaises(ValueError, list,
+                          streams.iter_json_items([b'[1, 2]']))
+
+
+class TestIterChunks(unittest.TestCase):
+    def test_gzip(self):
+        data = b'{"data": [1, 2, 3]}' * 100
+        compressed = gzipped(data)
+        reader = streams.CountingReader(io.BytesIO(compressed))
+        chunks = list(streams.iter_chunks(reader, gzipped=True,
+                                          chunk_size=16))
+        self.assertEqual(data, b''.join(chunks))
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(len(compressed), reader.count)
+
+    def test_plain(self):
+        self.assertEqual([b'abc', b'de'], list(streams.iter_chunks(
+            io.BytesIO(b'abcde'), chunk_size=3)))
@@ -0,0 +1,80 @@
+import unittest
+
+from uvcclient import fakeserver
+from uvcclient import nvr
+from uvcclient import watcher
+
+
+class TestDiff(unittest.TestCase):
+    def test_diff(self):
+        old = {'a': 1, 'b': {'c': 2, 'd': [1]}, 'lastSeen': 1}
+        new = {'a': 1, 'b': {'c': 3, 'd': [1, 2]}, 'e': 4, 'lastSeen': 2}
+        self.assertEqual(
+            sorted([(('b', 'c'), 2, 3), (('b', 'd'), [1], [1, 2]),
+                    (('e',), None, 4)]),
+            sorted(watcher.diff(old, new, ignore=['lastSeen'])))
+
+
+class TestFleetWatcher(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeNVR(cameras=3).start()
+        self.addCleanup(self.server.stop)
+        self.client = nvr.UVCRemote('127.0.0.1', self.server.port, 'key')
+        self.addCleanup(self.client.close)
+        self.watcher = watcher.FleetWatcher(self.client, interval=0.05,
+                                            max_interval=1, backoff=2)
+
+    def test_events(self):
+        self.assertEqual([], self.watcher.poll())
+        self.assertEqual([], self.watcher.poll())
+
+        cams = self.server.cameras
+        cams[0]['state'] = 'DISCONNECTED'
+        cams[1]['recordingSettings']['fullTimeRecordEnabled'] = True
+        cams[1]['lastSeen'] = 12345
+        removed = cams.pop(2)
+        cams.append(fakeserver.make_camera(7))
+        events = sorted(self.watcher.poll(), key=lambda e: e.camera)
+
+        self.assertEqual([watcher.StateChanged, watcher.SettingChanged,
+                          watcher.CameraRemoved, watcher.CameraAdded],
+                         [type(e) for e in events])
+        self.assertEqual(('CONNECTED', 'DISCONNECTED'),
+                         (events[0].old, events[0].new))
+        self.assertEqual('recordingSettings.fullTimeRecordEnabled',
+                         events[1].key)
+        self.assertEqual(removed['_id'], events[2].camera)
+        self.assertEqual('Camera 7', events[3].name)
+
+    def test_deleted_is_removed(self):
+        self.watcher.poll()
+        self.server.cameras[0]['deleted'] = True
+        events = self.watcher.poll()
+        self.assertEqual([watcher.CameraRemoved], [type(e) for e in events])
+
+    def test_callbacks(self):
+        seen = []
+        self.watcher.subscribe(seen.append)
+        self.watcher.subscribe(lambda event: 1 / 0)
+        self.watcher.poll()
+        self.server.cameras[0]['name'] = 'Renamed'
+        self.watcher.poll()
+        self.assertEqual(1, len(seen))
+        self.assertEqual(('name',), seen[0].path)
+
+    def test_adaptive_interval(self):
+        self.assertEqual(0.1, self.watcher._next_interval(False))
+        self.watcher.interval = 0.8
+        self.assertEqual(1, self.watcher._next_interval(False))
+        self.assertEqual(0.05, self.watcher._next_interval(True))
+
+    def test_background(self):
+        self.watcher.poll()
+        self.watcher.start()
+        self.addCleanup(self.watcher.stop)
+        events = self.watcher.events(timeout=5)
+        self.server.cameras[1]['state'] = 'UPGRADING'
+        event = next(events)
+        self.assertIsInstance(event, watcher.StateChanged)
+        self.assertEqual('UPGRADING', event.new)
+        events.close()
@@ -0,0 +1,492 @@
+"""asyncio versions of the NVR and camera clients (Python 3.5+ only).
+
+The HTTP/1.1 transport here is built on asyncio streams alone and keeps
+connections alive between requests, so many requests can be in flight
+on one event loop without a thread each.
+"""
+
+import asyncio
+import json
+import logging
+import ssl as ssl_module
+import urllib.parse
+import zlib
+
+from uvcclient import camera
+from uvcclient import model
+from uvcclient import nvr
+
+
+class _Response(object):
+    """A fully read HTTP response, shaped like http.client's."""
+
+    def __init__(self, status, reason, headers, body, will_close):
+        self.status = status
+        self.reason = reason
+        self._headers = headers
+        self._body = body
+        self.will_close = will_close
+
+    def getheaders(self):
+        return self._headers
+
+    def getheader(self, name, default=None):
+        name = name.lower()
+        for key, value in self._headers:
+            if key.lower() == name:
+                return value
+        return default
+
+    def read(self):
+        return self._body
+
+
+class _Connection(object):
+    def __init__(self, reader, writer, host):
+        self._reader = reader
+        self._writer = writer
+        self._host = host
+
+    def close(self):
+        self._writer.close()
+
+    async def request(self, method, url, body=None, headers=None):
+        if isinstance(body, str):
+            body = body.encode()
+        lines = ['%s %s HTTP/1.1' % (method, url), 'Host: %s' % self._host]
+        for key, value in (headers or {}).items():
+            lines.append('%s: %s' % (key, value))
+        if body is not None or method in ('POST', 'PUT'):
+            lines.append('Content-Length: %i' % len(body or b''))
+        self._writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+        if body:
+            self._writer.write(body)
+        await self._writer.drain()
+        return await self._read_response(method)
+
+    async def _read_response(self, method):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionResetError('Server closed the connection')
+        version, status, reason = (line.decode('latin-1').rstrip('\r\n') +
+                                   '  ').split(' ', 2)
+        status = int(status)
+        headers = []
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, value = line.decode('latin-1').split(':', 1)
+            headers.append((key.strip(), value.strip()))
+        fields = dict((k.lower(), v) for k, v in headers)
+        will_close = (version == 'HTTP/1.0' or
+                      fields.get('connection', '').lower() == 'close')
+
+        if method == 'HEAD' or status in (204, 304) or status < 200:
+            body = b''
+        elif 'chunked' in fields.get('transfer-encoding', '').lower():
+            body = await self._read_chunked()
+        elif 'content-length' in fields:
+            body = await self._reader.readexactly(
+                int(fields['content-length']))
+        else:
+            body = await self._reader.read()
+            will_close = True
+        return _Response(status, reason.strip(), headers, body, will_close)
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self._reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                # Skip any trailers
+                while (await self._reader.readline()) not in (b'\r\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self._reader.readexactly(size))
+            await self._reader.readexactly(2)
+
+
+class AsyncConnectionPool(object):
+    """Persistent HTTP/1.1 connections to one server for asyncio.
+
+    At most ``max_connections`` requests are in flight at once; up to
+    that many idle connections are kept open for reuse.
+    """
+
+    def __init__(self, host, port, ssl=False, max_connections=10):
+        self._host = host
+        self._port = port
+        self._ssl = ssl
+        self._max_connections = max_connections
+        self._semaphore = None
+        self._idle = []
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+
+    async def _connect(self):
+        if self._ssl is True:
+            context = ssl_module.create_default_context()
+        else:
+            context = self._ssl or None
+        reader, writer = await asyncio.open_connection(
+            self._host, self._port, ssl=context)
+        return _Connection(reader, writer, '%s:%s' % (self._host,
+                                                      self._port))
+
+    async def request(self, method, url, body=None, headers=None):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_connections)
+        async with self._semaphore:
+            if self._idle:
+                self.hits += 1
+                conn, reused = self._idle.pop(), True
+            else:
+                self.misses += 1
+                conn, reused = await self._connect(), False
+            try:
+                try:
+                    resp = await conn.request(method, url, body, headers)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    if not reused:
+                        raise
+                    # The server closed our idle keep-alive connection
+                    conn.close()
+                    self.reconnects += 1
+                    conn = await self._connect()
+                    resp = await conn.request(method, url, body, headers)
+            except BaseException:
+                conn.close()
+                raise
+            if resp.will_close or len(self._idle) >= self._max_connections:
+                conn.close()
+            else:
+                self._idle.append(conn)
+            return resp
+
+    def close(self):
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'reconnects': self.reconnects,
+                'idle': len(self._idle)}
+
+
+class _NeedResponse(BaseException):
+    pass
+
+
+class _Replay(object):
+    """Stands in for a UVCRemote while one of its methods is replayed.
+
+    Requests are answered from the responses collected so far; the
+    first one without an answer stops the replay so the caller can
+    fetch it asynchronously and try again.
+    """
+
+    def __init__(self, client, responses):
+        self._client = client
+        self._responses = responses
+        self.requests = []
+
+    # Whole documents are always sent
+    _originals = None
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _put_camera(self, url, document, original=None):
+        return nvr.UVCRemote._put_camera(self, url, document, original)
+
+    def _uvc_request(self, path, method='GET', data=None,
+                     mimetype='application/json'):
+        self.requests.append((path, method, data, mimetype))
+        if len(self.requests) > len(self._responses):
+            raise _NeedResponse()
+        return json.loads(self._responses[len(self.requests) - 1])
+
+
+class AsyncUVCRemote(object):
+    """asyncio remote control client for Ubiquiti Unifi Video NVR.
+
+    Every getter and setter of UVCRemote is available here as a
+    coroutine with the same arguments and results, e.g.::
+
+        mode = await client.get_recordmode(camera_id)
+        await client.set_irledmode(camera_id, 'auto')
+    """
+    CHANNEL_NAMES = nvr.UVCRemote.CHANNEL_NAMES
+    # UVCRemote methods that only make NVR requests, and so can be
+    # replayed (see _Replay). Anything else needs its own coroutine below.
+    REPLAYED_METHODS = (
+        'get_enablestatusled', 'set_enablestatusled',
+        'get_enablesuggestedvideosettings', 'set_enablesuggestedvideosettings',
+        'get_firmwareBuild', 'get_firmwareVersion',
+        'get_hasDefaultCredentials', 'get_cameramacaddress',
+        'get_iscameramanagedbynvr', 'get_cameramicvolume',
+        'set_cameramicvolume', 'get_cameramodel', 'get_cameraplatform',
+        'get_cameraipaddress', 'get_recordprepaddingtime',
+        'set_recordprepaddingtime', 'get_recordpostpaddingtime',
+        'set_recordpostpaddingtime', 'get_cameratimezone',
+        'get_externalirmode', 'set_externalirmode', 'get_showosddatemode',
+        'set_showosddatemode', 'get_showosdlogomode', 'set_showosdlogomode',
+        'get_brightness', 'set_brightness', 'get_irbrightness',
+        'set_irbrightness', 'get_contrast', 'set_contrast', 'get_ircontrast',
+        'set_ircontrast', 'get_denoise', 'set_denoise', 'get_irdenoise',
+        'set_irdenoise', 'get_hue', 'set_hue', 'get_irhue', 'set_irhue',
+        'get_saturation', 'set_saturation', 'get_irsaturation',
+        'set_irsaturation', 'get_sharpness', 'set_sharpness',
+        'get_irsharpness', 'set_irsharpness', 'get_wdr', 'set_wdr',
+        'get_lensdistortioncorrectionmode', 'set_lensdistortioncorrectionmode',
+        'get_aemode', 'set_aemode', 'get_aggressiveantiflicker',
+        'set_aggressiveantiflicker', 'get_orientation', 'get_irsensitivity',
+        'set_irsensitivity', 'get_irledmode', 'set_irledmode',
+        'get_picture_settings', 'set_picture_settings', 'get_recordmode',
+        'set_recordmode', 'list_zones', 'prune_zones')
+
+    def __init__(self, host, port, apikey, path='/', ssl=False,
+                 max_connections=10):
+        if path != '/':
+            raise nvr.Invalid('Path not supported yet')
+        self._host = host
+        self._port = port
+        self._apikey = apikey
+        self._bootstrap = None
+        self._log = logging.getLogger('UVC(%s:%s)' % (host, port))
+        self._pool = AsyncConnectionPool(host, port, ssl=ssl,
+                                         max_connections=max_connections)
+
+    def __getattr__(self, name):
+        if name in self.REPLAYED_METHODS:
+            async def method(*args, **kwargs):
+                return await self._replay(name, *args, **kwargs)
+            method.__name__ = name
+            method.__doc__ = getattr(nvr.UVCRemote, name).__doc__
+            return method
+        raise AttributeError(name)
+
+    @property
+    def pool_stats(self):
+        return self._pool.stats()
+
+    def close(self):
+        self._pool.close()
+
+    async def _replay(self, name, *args, **kwargs):
+        func = getattr(nvr.UVCRemote, name)
+        responses = []
+        while True:
+            replay = _Replay(self, responses)
+            try:
+                return func(replay, *args, **kwargs)
+            except _NeedResponse:
+                path, method, data, mimetype = replay.requests[-1]
+                responses.append(await self._uvc_request_raw(
+                    path, method, data, mimetype))
+
+    async def _uvc_request_raw(self, path, method='GET', data=None,
+                               mimetype='application/json'):
+        if '?' in path:
+            url = '%s&apiKey=%s' % (path, self._apikey)
+        else:
+            url = '%s?apiKey=%s' % (path, self._apikey)
+        headers = {
+            'Content-Type': mimetype,
+            'Accept': 'application/json, text/javascript, */*; q=0.01',
+            'Accept-Encoding': 'gzip, deflate, sdch',
+        }
+        self._log.debug('%s %s data=%r', method, url, data)
+        try:
+            resp = await self._pool.request(method, url, data, headers)
+        except (OSError, asyncio.IncompleteReadError):
+            raise nvr.NvrError('Failed to contact NVR')
+        self._log.debug('%s %s Result: %s %s', method, url, resp.status,
+                        resp.reason)
+        if resp.status in (401, 403):
+            raise nvr.NotAuthorized('NVR reported authorization failure')
+        if resp.status // 100 != 2:
+            raise nvr.NvrError('Request failed: %s' % resp.status)
+        data = resp.read()
+        if resp.getheader('Content-Encoding') == 'gzip':
+            data = zlib.decompress(data, 32 + zlib.MAX_WBITS)
+        return data.decode()
+
+    async def _uvc_request(self, path, method='GET', data=None,
+                           mimetype='application/json'):
+        return json.loads(await self._uvc_request_raw(path, method, data,
+                                                      mimetype))
+
+    async def get_bootstrap(self):
+        if self._bootstrap is None:
+            data = await self._uvc_request('/api/2.0/bootstrap')
+            self._bootstrap = data['data'][0]
+        return self._bootstrap
+
+    async def get_server_version(self):
+        await self.get_bootstrap()
+        return self.server_version
+
+    @property
+    def server_version(self):
+        """The NVR version; requires get_bootstrap() to have run."""
+        if self._bootstrap is None:
+            raise nvr.NvrError('Bootstrap has not been fetched yet')
+        version = self._bootstrap['systemInfo']['version'].split('.')
+        try:
+            rev = int(version[2])
+        except ValueError:
+            rev = 0
+        return (int(version[0]), int(version[1]), rev)
+
+    async def get_camera_identifier(self):
+        if await self.get_server_version() >= (3, 2, 0):
+            return 'id'
+        else:
+            return 'uuid'
+
+    async def index(self):
+        """Return an index of available cameras.
+
+        :returns: A list of dictionaries with keys of name, uuid
+        """
+        cams = (await self._uvc_request('/api/2.0/camera'))['data']
+        return [nvr._index_entry(x) for x in cams if not x['deleted']]
+
+    async def get_camera(self, uuid):
+        data = await self._uvc_request('/api/2.0/camera/%s' % uuid)
+        return data['data'][0]
+
+    async def get_camera_model(self, uuid):
+        """Return a model.Camera for one camera."""
+        return model.Camera.from_document(await self.get_camera(uuid))
+
+    async def get_snapshot(self, uuid):
+        url = '/api/2.0/snapshot/camera/%s?force=true&apiKey=%s' % (
+            uuid, self._apikey)
+        try:
+            resp = await self._pool.request('GET', url)
+        except (OSError, asyncio.IncompleteReadError):
+            raise nvr.CameraConnectionError('Unable to contact camera')
+        if resp.status != 200:
+            raise nvr.NvrError('Snapshot returned %i' % resp.status)
+        return resp.read()
+
+    async def delete_alert(self, alert):
+        url = '/api/2.0/alert/%s' % alert['_id']
+        return await self._uvc_request(url, 'PUT', json.dumps(alert))
+
+    async def get_all_alerts(self):
+        return await self.get_alerts()
+
+    async def get_alerts(self, **params):
+        url = '/api/2.0/alert'
+        if params:
+            url = '%s?%s' % (url, urllib.parse.urlencode(
+                sorted(params.items())))
+        return (await self._uvc_request(url))['data']
+
+    async def name_to_uuid(self, name):
+        """Attempt to convert a camera name to its UUID.
+
+        :param name: Camera name
+        :returns: The UUID of the first camera with the same name if found,
+                  otherwise None. On v3.2.0 and later, returns id.
+        """
+        key = await self.get_camera_identifier()
+        cams_by_name = {x['name']: x[key] for x in await self.index()}
+        return cams_by_name.get(name)
+
+
+class AsyncUVCCameraClient(object):
+    """asyncio version of camera.UVCCameraClient."""
+
+    def __init__(self, host, username, password, port=80,
+                 max_connections=2):
+        self._host = host
+        self._port = port
+        self._username = username
+        self._password = password
+        self._cookie = ''
+        self._log = logging.getLogger('UVCCamera(%s)' % self._host)
+        self._pool = AsyncConnectionPool(host, port,
+                                         max_connections=max_connections)
+
+    snapshot_url = camera.UVCCameraClient.snapshot_url
+    reboot_url = camera.UVCCameraClient.reboot_url
+    status_url = camera.UVCCameraClient.status_url
+
+    def close(self):
+        self._pool.close()
+
+    async def _safe_request(self, method, url, body=None, headers=None):
+        try:
+            return await self._pool.request(method, url, body, headers)
+        except (OSError, asyncio.IncompleteReadError):
+            raise camera.CameraConnectError('Unable to contact camera')
+
+    def _set_cookie(self, resp):
+        self._cookie = resp.getheader('Set-Cookie', '')
+
+    async def login(self):
+        resp = await self._safe_request('GET', '/')
+        self._set_cookie(resp)
+        session = self._cookie.split('=')[1].split(';')[0]
+        data = urllib.parse.urlencode({'username': self._username,
+                                       'password': self._password,
+                                       'AIROS_SESSIONID': session})
+        headers = {"Content-type": "application/x-www-form-urlencoded",
+                   "Accept": "*",
+                   'Cookie': self._cookie}
+        resp = await self._safe_request('POST', '/login.cgi', data, headers)
+        if resp.status != 200:
+            raise camera.CameraAuthError('Failed to login: %s' % resp.reason)
+
+    async def _cfgwrite(self, setting, value):
+        resp = await self._safe_request(
+            'GET', '/cfgwrite.cgi?%s=%s' % (setting, value),
+            headers={'Cookie': self._cookie})
+        self._log.debug('Setting %s=%s: %s %s', setting, value,
+                        resp.status, resp.reason)
+        return resp.status == 200
+
+    async def set_led(self, enabled):
+        return await self._cfgwrite('led.front.status', int(enabled))
+
+    async def _authed_get(self, url, what):
+        resp = await self._safe_request('GET', url,
+                                        headers={'Cookie': self._cookie})
+        if resp.status in (401, 403, 302):
+            raise camera.CameraAuthError('Not logged in')
+        elif resp.status != 200:
+            raise camera.CameraConnectError(
+                '%s failed: %s' % (what, resp.status))
+        return resp
+
+    async def get_snapshot(self):
+        return (await self._authed_get(self.snapshot_url, 'Snapshot')).read()
+
+    async def reboot(self):
+        await self._authed_get(self.reboot_url, 'Reboot')
+
+    async def get_status(self):
+        resp = await self._authed_get(self.status_url, 'Status')
+        return json.loads(resp.read().decode())
+
+
+class AsyncUVCCameraClientV320(AsyncUVCCameraClient):
+    snapshot_url = camera.UVCCameraClientV320.snapshot_url
+
+    async def login(self):
+        headers = {'Content-Type': 'application/json'}
+        data = json.dumps({'username': self._username,
+                           'password': self._password})
+        resp = await self._safe_request('POST', '/api/1.1/login', data,
+                                        headers)
+        if resp.status != 200:
+            raise camera.CameraAuthError('Failed to login: %s' % resp.reason)
+        self._set_cookie(resp)
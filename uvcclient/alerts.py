@@ -0,0 +1,173 @@
+import logging
+
+LOG = logging.getLogger(__name__)
+
+
+def _newer(alert, since, seen):
+    if since is None:
+        return True
+    timestamp = alert.get('timestamp')
+    if timestamp is None:
+        return False
+    return timestamp > since or (timestamp == since and
+                                 alert['_id'] not in seen)
+
+
+class AlertSync(object):
+    """Fetches only the alerts added since the last sync.
+
+    The newest alert timestamp seen so far, with the ids of the alerts
+    at exactly that timestamp, form a high-water mark that is saved in
+    the store (see store.InfoStore) after each sync. The NVR is asked
+    for newer alerts a page at a time with startTime, limit, offset and
+    order parameters. If it turns out to ignore them, the whole alert
+    table is fetched and filtered here instead, and that is remembered
+    so later syncs do not try again.
+
+    :param client: A UVCRemote
+    :param store: Where to keep the high-water mark between runs, or
+                  None to keep it only in memory
+    :param page_size: Number of alerts to ask the NVR for at a time
+    """
+
+    def __init__(self, client, store=None, page_size=500, key=None):
+        self._client = client
+        self._store = store
+        self._page_size = page_size
+        self._key = key or '%s:%s' % (client._host, client._port)
+        mark = (store and store.get_alert_mark(self._key)) or {}
+        self.timestamp = mark.get('timestamp')
+        self._ids = set(mark.get('ids', []))
+        self.server_filtering = mark.get('server_filtering', True)
+
+    def _full_table(self, since):
+        # Stream the table and keep only the new alerts, so that a large
+        # table never has to be held in memory whole
+        new = [alert for alert in self._client.iter_alerts()
+               if _newer(alert, since, self._ids)]
+        return sorted(new, key=lambda alert: alert.get('timestamp') or 0)
+
+    def _fetch(self, since):
+        """Yield candidate alerts, paging on the NVR if it supports it."""
+        if not self.server_filtering:
+            for alert in self._full_table(since):
+                yield alert
+            return
+        offset = 0
+        fetched = set()
+        while True:
+            params = {'limit': self._page_size, 'offset': offset,
+                      'order': 'asc'}
+            if since is not None:
+                params['startTime'] = since
+            page = self._client.get_alerts(**params)
+            ids = set(alert['_id'] for alert in page)
+            if len(page) > self._page_size or (ids and ids <= fetched):
+                # The NVR ignored limit or offset and sent the whole table
+                LOG.debug('NVR does not page alerts, filtering locally')
+                self.server_filtering = False
+                by_time = sorted(page,
+                                 key=lambda a: a.get('timestamp') or 0)
+                for alert in by_time:
+                    if alert['_id'] not in fetched:
+                        yield alert
+                return
+            if since is not None and any(
+                    (alert.get('timestamp') or 0) < since for alert in page):
+                LOG.debug('NVR ignored startTime, filtering locally')
+                self.server_filtering = False
+            fetched |= ids
+            for alert in page:
+                yield alert
+            if len(page) < self._page_size:
+                return
+            offset += len(page)
+
+    def _advance(self, alert):
+        timestamp = alert.get('timestamp')
+        if self.timestamp is None or timestamp > self.timestamp:
+            self.timestamp = timestamp
+            self._ids = set([alert['_id']])
+        elif timestamp == self.timestamp:
+            self._ids.add(alert['_id'])
+
+    def sync(self):
+        """Yield each alert added since the last sync.
+
+        The high-water mark moves past each alert as it is yielded and
+        is saved when the generator finishes or is closed, so alerts not
+        consumed are returned again by the next sync.
+        """
+        since = self.timestamp
+        seen = set(self._ids)
+        yielded = set()
+        try:
+            for alert in self._fetch(since):
+                if alert['_id'] in yielded or not _newer(alert, since, seen):
+                    continue
+                yielded.add(alert['_id'])
+                self._advance(alert)
+                yield alert
+        finally:
+            self.save()
+
+    def save(self):
+        if self._store is not None:
+            self._store.set_alert_mark(self._key, {
+                'timestamp': self.timestamp,
+                'ids': sorted(self._ids),
+                'server_filtering': self.server_filtering,
+            })
+
+    def reset(self):
+        """Forget the high-water mark, so the next sync returns everything."""
+        self.timestamp = None
+        self._ids = set()
+        self.save()
+
+
+def alert_filter(start=None, end=None, alert_type=None, camera=None):
+    """Build a predicate matching alerts by time, type and camera.
+
+    :param start: Earliest timestamp to match (milliseconds, inclusive)
+    :param end: Latest timestamp to match (milliseconds, inclusive)
+    :param alert_type: An alertType, or a collection of them
+    :param camera: A camera _id, or a collection of them
+    """
+    if isinstance(alert_type, str):
+        alert_type = [alert_type]
+    if isinstance(camera, str):
+        camera = [camera]
+    alert_types = alert_type and set(alert_type)
+    cameras = camera and set(camera)
+
+    def match(alert):
+        timestamp = alert.get('timestamp')
+        if start is not None and (timestamp is None or timestamp < start):
+            return False
+        if end is not None and (timestamp is None or timestamp > end):
+            return False
+        if alert_types and str(alert.get('alertType')) not in alert_types:
+            return False
+        if cameras and alert.get('cameraId') not in cameras:
+            return False
+        return True
+
+    return match
+
+
+class DeleteResult(object):
+    """The outcome of UVCRemote.delete_alerts()."""
+
+    def __init__(self):
+        self.deleted = []
+        self.failed = {}
+        self.remaining = None
+
+    @property
+    def ok(self):
+        return not self.failed and not self.remaining
+
+    def __repr__(self):
+        return '<DeleteResult deleted=%i failed=%i remaining=%s>' % (
+            len(self.deleted), len(self.failed), self.remaining)
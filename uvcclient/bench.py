@@ -0,0 +1,280 @@
+"""Benchmarks for the NVR and camera clients.
+
+The clients are run against fakeserver servers started in a child
+process, so the allocation and RSS figures only cover the client side.
+Each benchmark also runs in its own child process, so its peak RSS is
+not hidden by the peak of an earlier one.
+Results are printed as JSON, so runs can be compared between releases::
+
+    python -m uvcclient.bench --cameras 50 --alerts 5000 > before.json
+"""
+
+import gc
+import json
+import multiprocessing
+import optparse
+import platform
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from uvcclient import camera
+from uvcclient import fakeserver
+from uvcclient import nvr
+from uvcclient.poller import percentile
+
+
+def _serve(cls, kwargs, ports):
+    server = getattr(fakeserver, cls)(**kwargs).start()
+    ports.put(server.port)
+    while True:
+        time.sleep(3600)
+
+
+class ServerProcess(object):
+    """Runs a fakeserver server class in a child process."""
+
+    def __init__(self, cls, **kwargs):
+        self._cls = cls
+        self._kwargs = kwargs
+        self._process = None
+        self.port = None
+
+    def __enter__(self):
+        ports = multiprocessing.Queue()
+        self._process = multiprocessing.Process(
+            target=_serve, args=(self._cls, self._kwargs, ports))
+        self._process.daemon = True
+        self._process.start()
+        self.port = ports.get(timeout=30)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._process.terminate()
+        self._process.join()
+
+
+def peak_rss():
+    """Return the peak resident set size of this process in KiB."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss //= 1024
+    return rss
+
+
+def measure(fn, iterations, alloc_iterations=10):
+    """Time fn over a number of calls and sample its allocations.
+
+    :param fn: Callable taking no arguments
+    :param iterations: Number of timed calls
+    :param alloc_iterations: Number of further calls made with
+                             tracemalloc running
+    :returns: A dict of results; times are in milliseconds
+    """
+    fn()
+    latencies = []
+    gc.collect()
+    start = time.time()
+    for i in range(iterations):
+        call_start = time.time()
+        fn()
+        latencies.append((time.time() - call_start) * 1000)
+    elapsed = time.time() - start
+
+    result = {
+        'calls': iterations,
+        'total_s': elapsed,
+        'ops_per_s': iterations / elapsed if elapsed else None,
+        'mean_ms': sum(latencies) / len(latencies),
+        'p50_ms': percentile(latencies, 50),
+        'p90_ms': percentile(latencies, 90),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': max(latencies),
+    }
+
+    if tracemalloc is not None and alloc_iterations:
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            for i in range(alloc_iterations):
+                fn()
+            after, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        result['retained_bytes_per_call'] = (
+            (after - before) // alloc_iterations)
+        result['peak_alloc_bytes'] = peak - before
+    return result
+
+
+def nvr_benchmarks(client, camera_ids):
+    """Return a dict of benchmark name to callable for an NVR client."""
+    ident = camera_ids[0]
+    modes = ['motion', 'none']
+    state = {'set': 0}
+
+    def setter():
+        state['set'] += 1
+        client.set_recordmode(ident, modes[state['set'] % 2])
+
+    return {
+        'index': client.index,
+        'get_recordmode': lambda: client.get_recordmode(ident),
+        'set_recordmode': setter,
+        'get_all_alerts': client.get_all_alerts,
+        'get_snapshot': lambda: client.get_snapshot(ident),
+    }
+
+
+NVR_BENCHMARKS = ('get_all_alerts', 'get_recordmode', 'get_snapshot',
+                  'index', 'set_recordmode')
+NVR_GZIP_BENCHMARKS = ('camera_list_gzip', 'index_gzip')
+
+
+def _setup(name, port):
+    """Connect a client to the server on port for a benchmark.
+
+    :returns: A (fn, close) tuple; fn is the callable to measure
+    """
+    if name == 'camera_snapshot':
+        client = camera.UVCCameraClient('127.0.0.1', 'ubnt', 'ubnt',
+                                        port=port)
+        client.login()
+        return client.get_snapshot, lambda: None
+
+    client = nvr.UVCRemote('127.0.0.1', port, 'fake')
+    if name == 'index_gzip':
+        # index() decompresses and decodes as the body streams in
+        fn = client.index
+    elif name == 'camera_list_gzip':
+        # _uvc_request() reads the whole body, then decompresses
+        def fn():
+            return client._uvc_request('/api/2.0/camera')
+    else:
+        camera_ids = [c['id'] for c in client.index()]
+        fn = nvr_benchmarks(client, camera_ids)[name]
+    return fn, client.close
+
+
+def _measure_child(name, port, iterations, results):
+    try:
+        fn, close = _setup(name, port)
+        start_rss = peak_rss()
+        result = measure(fn, iterations)
+        close()
+        result['peak_rss_kb'] = peak_rss()
+        if start_rss is not None:
+            result['rss_growth_kb'] = result['peak_rss_kb'] - start_rss
+    except Exception as ex:
+        result = {'error': '%s: %s' % (type(ex).__name__, ex)}
+    results.put(result)
+
+
+def measure_isolated(name, port, iterations):
+    """Run one benchmark in its own child process.
+
+    ru_maxrss only ever grows, so measuring every benchmark in one process
+    would report the peak of the largest benchmark run so far. A fresh
+    process gives each benchmark its own peak_rss_kb; rss_growth_kb is
+    how far it rose above the RSS after connecting.
+
+    :param name: Benchmark name
+    :param port: Port of the server to benchmark against
+    :param iterations: Number of timed calls
+    :returns: The measure() results, plus the RSS figures
+    """
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=_measure_child, args=(name, port, iterations, results))
+    process.start()
+    try:
+        return results.get()
+    finally:
+        process.join()
+
+
+def run(opts, names=None):
+    """Run the benchmarks and return the results as a dict."""
+    results = {}
+
+    def wanted(name):
+        return not names or name in names
+
+    server_args = dict(cameras=opts.cameras, alerts=opts.alerts,
+                       latency=opts.latency,
+                       snapshot_size=opts.snapshot_size)
+    nvr_names = [name for name in NVR_BENCHMARKS if wanted(name)]
+    if nvr_names:
+        with ServerProcess('FakeNVR', **server_args) as server:
+            for name in nvr_names:
+                iterations = opts.iterations
+                if name == 'get_all_alerts':
+                    iterations = max(1, iterations // 10)
+                results[name] = measure_isolated(name, server.port,
+                                                 iterations)
+
+    gzip_names = [name for name in NVR_GZIP_BENCHMARKS if wanted(name)]
+    if gzip_names:
+        server_args['gzip'] = True
+        with ServerProcess('FakeNVR', **server_args) as server:
+            for name in gzip_names:
+                results[name] = measure_isolated(name, server.port,
+                                                 opts.iterations)
+
+    if wanted('camera_snapshot'):
+        with ServerProcess('FakeCamera', latency=opts.latency,
+                           snapshot_size=opts.snapshot_size) as server:
+            results['camera_snapshot'] = measure_isolated(
+                'camera_snapshot', server.port, opts.iterations)
+
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'config': {'cameras': opts.cameras,
+                   'alerts': opts.alerts,
+                   'iterations': opts.iterations,
+                   'latency': opts.latency,
+                   'snapshot_size': opts.snapshot_size},
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = optparse.OptionParser()
+    parser.add_option('--cameras', default=50, type=int,
+                      help='Number of cameras on the fake NVR')
+    parser.add_option('--alerts', default=5000, type=int,
+                      help='Number of alerts on the fake NVR')
+    parser.add_option('--iterations', default=200, type=int,
+                      help='Timed calls per benchmark')
+    parser.add_option('--latency', default=0, type=float,
+                      help='Server-side latency per request in seconds')
+    parser.add_option('--snapshot-size', default=200 * 1024, type=int,
+                      help='Size of the fake snapshot image in bytes')
+    parser.add_option('--only', default=[], action='append',
+                      help='Run only this benchmark (may be repeated)')
+    parser.add_option('--output', default=None,
+                      help='Write results to this file instead of stdout')
+    opts, args = parser.parse_args(argv)
+
+    results = json.dumps(run(opts, opts.only), indent=2, sort_keys=True)
+    if opts.output:
+        with open(opts.output, 'w') as f:
+            f.write(results + '\n')
+    else:
+        print(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import collections
+import json
+import threading
+import time
+
+
+class CameraCache(object):
+    """An LRU cache of camera documents with a time-to-live.
+
+    Documents are stored serialized so that every caller gets its own
+    copy to modify, just as if it had been fetched from the NVR.
+    """
+
+    def __init__(self, ttl=5, size=128):
+        self._ttl = ttl
+        self._size = size
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            try:
+                stamp, doc = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            if time.time() - stamp > self._ttl:
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries[key] = (stamp, doc)
+            self.hits += 1
+        return json.loads(doc)
+
+    def put(self, key, value):
+        doc = json.dumps(value)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time(), doc)
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key=None):
+        """Drop one cached document, or all of them if key is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'expirations': self.expirations,
+                    'size': len(self._entries)}
+
+
+class BodyCache(object):
+    """The raw bodies of the last few responses, most recent last."""
+
+    def __init__(self, size=128):
+        self._size = size
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key, body):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = body
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
@@ -16,6 +16,11 @@
 import json
 import logging
 import socket
+import time
+
+from uvcclient import resilience
+from uvcclient import store
+from uvcclient import streams
 
 # Python3 compatibility
 try:
@@ -38,19 +43,73 @@ class CameraAuthError(Exception):
 
 
 class UVCCameraClient(object):
-    def __init__(self, host, username, password, port=80):
+    """Client for the web interface of a single camera.
+
+    A session cookie is kept across calls and the client logs in again
+    by itself if the camera rejects it. With a session_store (such as
+    store.InfoStore) the cookie is also saved for session_ttl seconds,
+    so later clients for the same camera can skip logging in.
+
+    Timeouts, retries and circuit breaking follow policy (see
+    resilience.Policy), which can be shared with a UVCRemote.
+    """
+
+    def __init__(self, host, username, password, port=80,
+                 session_store=None, session_ttl=1800, policy=None):
         self._host = host
         self._port = port
         self._username = username
         self._password = password
         self._cookie = ''
+        self._session_store = session_store
+        self._session_ttl = session_ttl
+        self._policy = policy or resilience.DEFAULT_POLICY
         self._log = logging.getLogger('UVCCamera(%s)' % self._host)
 
-    def _safe_request(self, *args, **kwargs):
+    @property
+    def _session_key(self):
+        return '%s:%s' % (self._host, self._port)
+
+    def _save_session(self):
+        if self._session_store is None:
+            return
+        try:
+            self._session_store.set_camera_session(
+                self._session_key, self._cookie,
+                time.time() + self._session_ttl)
+        except store.UnableToManageStore as ex:
+            # Only later runs lose out; this login still worked
+            self._log.warning('Unable to save camera session: %s', ex)
+
+    def _restore_session(self):
+        if self._session_store is not None and not self._cookie:
+            self._cookie = (self._session_store.get_camera_session(
+                self._session_key) or '')
+        return bool(self._cookie)
+
+    def ensure_login(self):
+        """Log in unless we have, or have saved, a session already."""
+        if not self._restore_session():
+            self.login()
+
+    def _request(self, method, *args, **kwargs):
+        conn = httplib.HTTPConnection(self._host, self._port,
+                                      **self._policy.connection_args())
+        self._policy.connect(conn)
+        conn.request(method, *args, **kwargs)
+        return conn.getresponse()
+
+    def _safe_request(self, method, *args, **kwargs):
+        # Commands such as reboot are sent as GETs, but must not be sent
+        # again once they may have reached the camera
+        idempotent = kwargs.pop('idempotent', None)
         try:
-            conn = httplib.HTTPConnection(self._host, self._port)
-            conn.request(*args, **kwargs)
-            return conn.getresponse()
+            return self._policy.call(
+                '%s:%s' % (self._host, self._port), method,
+                lambda: self._request(method, *args, **kwargs),
+                idempotent=idempotent)
+        except resilience.CircuitOpen as ex:
+            raise CameraConnectError(str(ex))
         except (socket.error, OSError):
             raise CameraConnectError('Unable to contact camera')
         except httplib.HTTPException as ex:
@@ -80,12 +139,33 @@ class UVCCameraClient(object):
         resp = self._safe_request('POST', '/login.cgi', data, headers)
         if resp.status != 200:
             raise CameraAuthError('Failed to login: %s' % resp.reason)
+        self._save_session()
+
+    def _authed_request(self, url, idempotent=True):
+        """GET url with our session, logging in again if it is rejected.
+
+        :param idempotent: False if the GET changes something on the
+                           camera, so it is only retried when it could
+                           not be sent at all
+        """
+        self._restore_session()
+        resp = self._safe_request('GET', url,
+                                  headers={'Cookie': self._cookie},
+                                  idempotent=idempotent)
+        if resp.status in (401, 403, 302):
+            self._log.debug('Session rejected, logging in again')
+            resp.read()
+            self.login()
+            resp = self._safe_request('GET', url,
+                                      headers={'Cookie': self._cookie},
+                                      idempotent=idempotent)
+        if resp.status in (401, 403, 302):
+            raise CameraAuthError('Not logged in')
+        return resp
 
     def _cfgwrite(self, setting, value):
-        headers = {'Cookie': self._cookie}
-        resp = self._safe_request(
-            'GET', '/cfgwrite.cgi?%s=%s' % (setting, value),
-            headers=headers)
+        resp = self._authed_request(
+            '/cfgwrite.cgi?%s=%s' % (setting, value), idempotent=False)
         self._log.debug('Setting %s=%s: %s %s' % (setting, value,
                                                   resp.status,
                                                   resp.reason))
@@ -106,37 +186,36 @@ class UVCCameraClient(object):
     def status_url(self):
         return '/api/1.1/status'
 
-    def get_snapshot(self):
-        conn = httplib.HTTPConnection(self._host, self._port)
-        headers = {'Cookie': self._cookie}
-        resp = self._safe_request('GET', self.snapshot_url,
-                                  headers=headers)
-        if resp.status in (401, 403, 302):
-            raise CameraAuthError('Not logged in')
-        elif resp.status != 200:
+    def _snapshot_response(self):
+        resp = self._authed_request(self.snapshot_url)
+        if resp.status != 200:
             raise CameraConnectError(
                 'Snapshot failed: %s' % resp.status)
-        return resp.read()
+        return resp
+
+    def get_snapshot(self):
+        return self._snapshot_response().read()
+
+    def stream_snapshot(self, sink, chunk_size=streams.DEFAULT_CHUNK_SIZE):
+        """Copy a snapshot into sink without buffering the whole image.
+
+        :param sink: A file, socket or writable buffer (see
+                     streams.copy_stream)
+        :param chunk_size: Size of the reusable copy buffer
+        :returns: The size of the image in bytes
+        """
+        return streams.copy_stream(self._snapshot_response(), sink,
+                                   chunk_size)
 
     def reboot(self):
-        conn = httplib.HTTPConnection(self._host, self._port)
-        headers = {'Cookie': self._cookie}
-        resp = self._safe_request('GET', self.reboot_url,
-                                  headers=headers)
-        if resp.status in (401, 403, 302):
-            raise CameraAuthError('Not logged in')
-        elif resp.status != 200:
+        resp = self._authed_request(self.reboot_url, idempotent=False)
+        if resp.status != 200:
             raise CameraConnectError(
                 'Reboot failed: %s' % resp.status)
 
     def get_status(self):
-        conn = httplib.HTTPConnection(self._host, self._port)
-        headers = {'Cookie': self._cookie}
-        resp = self._safe_request('GET', self.status_url,
-                                  headers=headers)
-        if resp.status in (401, 403, 302):
-            raise CameraAuthError('Not logged in')
-        elif resp.status != 200:
+        resp = self._authed_request(self.status_url)
+        if resp.status != 200:
             raise CameraConnectError(
                 'Status failed: %s' % resp.status)
         return json.loads(resp.read().decode())
@@ -160,3 +239,4 @@ class UVCCameraClientV320(UVCCameraClient):
             self._cookie = headers['Set-Cookie']
         except KeyError:
             self._cookie = headers['set-cookie']
+        self._save_session()
@@ -0,0 +1,509 @@
+"""Stand-in NVR and camera HTTP servers for offline testing.
+
+FakeNVR and FakeCamera implement enough of the real APIs for UVCRemote
+and UVCCameraClient to run against them, with a configurable fleet
+size, added latency, gzip responses and random failures. They can be
+used from tests and benchmarks, or run from the command line::
+
+    python -m uvcclient.fakeserver --cameras 200 --latency 0.01
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import optparse
+import random
+import threading
+import time
+import uuid as uuid_module
+
+try:
+    from http import server as BaseHTTPServer
+    import socketserver as SocketServer
+    import urllib.parse as urlparse
+except ImportError:
+    import BaseHTTPServer
+    import SocketServer
+    import urlparse
+
+
+def make_camera(index, version='3.10.0'):
+    """Build a camera document shaped like the ones the NVR returns."""
+    mac = '802AA8%06X' % index
+    return {
+        '_id': '%024x' % (index + 1),
+        'uuid': str(uuid_module.UUID(int=index + 1)),
+        'name': 'Camera %i' % index,
+        'mac': mac,
+        'host': '10.0.%i.%i' % (index // 250, index % 250 + 2),
+        'model': 'UVC G3 Micro' if index % 3 == 0 else 'UVC G3',
+        'platform': 'GEN3L',
+        'firmwareVersion': version,
+        'firmwareBuild': 'ubnt.%s.0' % version,
+        'username': 'ubnt',
+        'state': 'CONNECTED',
+        'managed': True,
+        'deleted': False,
+        'hasDefaultCredentials': False,
+        'enableStatusLed': True,
+        'enableSuggestedVideoSettings': True,
+        'micVolume': 100,
+        'deviceSettings': {'name': 'Camera %i' % index,
+                           'timezone': 'America/Los_Angeles'},
+        'ispSettings': {
+            'aemode': 'auto',
+            'aggressiveAntiFlicker': 0,
+            'brightness': 50,
+            'contrast': 50,
+            'denoise': 50,
+            'enableExternalIr': 0,
+            'flip': 0,
+            'hue': 50,
+            'icrSensitivity': 0,
+            'irLedLevel': 215,
+            'irLedMode': 'auto',
+            'irOnValBrightness': 50,
+            'irOnValContrast': 50,
+            'irOnValDenoise': 50,
+            'irOnValHue': 50,
+            'irOnValSaturation': 50,
+            'irOnValSharpness': 50,
+            'lensDistortionCorrection': 1,
+            'mirror': 0,
+            'saturation': 50,
+            'sharpness': 50,
+            'wdr': 1,
+        },
+        'osdSettings': {'enableDate': 1, 'enableLogo': 1, 'tag': ''},
+        'recordingSettings': {
+            'channel': 0,
+            'fullTimeRecordEnabled': False,
+            'motionRecordEnabled': True,
+            'postPaddingSecs': 2,
+            'prePaddingSecs': 2,
+        },
+        'channels': [
+            {'id': str(i), 'name': name, 'enabled': True, 'fps': 30,
+             'bitrate': 6000000 // (i + 1), 'width': 1920 // (i + 1),
+             'height': 1080 // (i + 1)}
+            for i, name in enumerate(['High', 'Medium', 'Low'])],
+        'zones': [{'name': 'Default', 'sensitivity': 50,
+                   'coordinates': [[0, 0], [100, 0], [100, 100], [0, 100]]}],
+    }
+
+
+def make_alert(index, cameras, start=1500000000000):
+    camera = cameras[index % len(cameras)] if cameras else None
+    return {
+        '_id': '%024x' % (0x100000 + index),
+        'timestamp': start + index * 1000,
+        'alertType': 'motion' if index % 2 else 'connection',
+        'alertState': 'new',
+        'cameraId': camera and camera['_id'],
+        'message': 'Alert %i' % index,
+    }
+
+
+def _jpeg(size):
+    body = b'\xff\xd8\xff\xe0' + b'\x00' * max(0, size - 6) + b'\xff\xd9'
+    return body[:max(size, 6)]
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections are not worth a traceback
+        pass
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def _send(self, status, body=b'', content_type='application/json',
+              headers=None):
+        gzipped = (self.fake.gzip and len(body) and
+                   'gzip' in self.headers.get('Accept-Encoding', ''))
+        if gzipped:
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+                f.write(body)
+            body = buf.getvalue()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        for key, value in (headers or []):
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data, sort_keys=True).encode()
+        if not self.fake.etags or status != 200:
+            return self._send(status, body)
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.fake.not_modified += 1
+            return self._send(304, b'', headers=[('ETag', etag)])
+        return self._send(status, body, headers=[('ETag', etag)])
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length).decode()
+
+    def _handle(self, method):
+        self.fake._count(method)
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+        if self.fake.error_rate and random.random() < self.fake.error_rate:
+            return self._send(500, b'{}')
+        url = urlparse.urlparse(self.path)
+        query = urlparse.parse_qs(url.query)
+        handler = getattr(self, '_%s' % method.lower())
+        return handler(url.path, query)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+class _NVRHandler(_Handler):
+    def _authorized(self, query):
+        if self.fake.apikey is None:
+            return True
+        return query.get('apiKey', [None])[0] == self.fake.apikey
+
+    def _get(self, path, query):
+        if not self._authorized(query):
+            return self._send(401, b'{}')
+        parts = path.strip('/').split('/')
+        if path == '/api/2.0/bootstrap':
+            return self._send_json({'data': [self.fake.bootstrap]})
+        elif path == '/api/2.0/camera':
+            return self._send_json({'data': self.fake.cameras})
+        elif path.startswith('/api/2.0/camera/'):
+            camera = self.fake.find_camera(parts[-1])
+            if camera is None:
+                return self._send(404, b'{}')
+            return self._send_json({'data': [camera]})
+        elif path == '/api/2.0/alert':
+            return self._send_json({'data': self.fake.list_alerts(query)})
+        elif path.startswith('/api/2.0/snapshot/camera/'):
+            if self.fake.find_camera(parts[-1]) is None:
+                return self._send(404, b'{}')
+            return self._send(200, self.fake.snapshot, 'image/jpeg')
+        return self._send(404, b'{}')
+
+    def _put(self, path, query):
+        if not self._authorized(query):
+            return self._send(401, b'{}')
+        parts = path.strip('/').split('/')
+        try:
+            update = json.loads(self._body())
+        except ValueError:
+            return self._send(400, b'{}')
+        if path.startswith('/api/2.0/camera/'):
+            camera = self.fake.update_camera(parts[-1], update)
+            if camera is None:
+                return self._send(404, b'{}')
+            return self._send_json({'data': [camera]})
+        elif path.startswith('/api/2.0/alert/'):
+            alert = self.fake.update_alert(parts[-1], update)
+            if alert is None:
+                return self._send(404, b'{}')
+            return self._send_json({'data': [alert]})
+        return self._send(404, b'{}')
+
+    def _post(self, path, query):
+        if path == '/api/2.0/login':
+            creds = json.loads(self._body() or '{}')
+            if (creds.get('username'), creds.get('password')) in (
+                    self.fake.users):
+                return self._send_json({'data': [{}]})
+            return self._send(401, b'{}')
+        return self._send(404, b'{}')
+
+
+class _CameraHandler(_Handler):
+    def _session(self):
+        cookie = self.headers.get('Cookie', '')
+        for part in cookie.replace(';', ' ').split():
+            if '=' in part:
+                name, value = part.split('=', 1)
+                if name == self.fake.COOKIE:
+                    return value
+        return None
+
+    def _get(self, path, query):
+        if path == '/':
+            session = self.fake._new_session()
+            return self._send(200, b'<html></html>', 'text/html', [
+                ('Set-Cookie', '%s=%s; Path=/' % (self.fake.COOKIE,
+                                                  session))])
+        if not self.fake._valid_session(self._session()):
+            if path == '/snapshot.cgi' or path == '/cfgwrite.cgi':
+                return self._send(302, b'', headers=[('Location', '/')])
+            return self._send(401, b'{}')
+        if path in ('/snapshot.cgi', '/snap.jpeg'):
+            return self._send(200, self.fake.snapshot, 'image/jpeg')
+        elif path == '/api/1.1/status':
+            return self._send_json(self.fake.status)
+        elif path == '/api/1.1/reboot':
+            self.fake.reboots += 1
+            return self._send_json({})
+        elif path == '/cfgwrite.cgi':
+            for key, values in query.items():
+                self.fake.config[key] = values[0]
+            return self._send(200, b'')
+        return self._send(404, b'{}')
+
+    def _post(self, path, query):
+        body = self._body()
+        if path == '/login.cgi':
+            form = urlparse.parse_qs(body)
+            creds = (form.get('username', [''])[0],
+                     form.get('password', [''])[0])
+            session = form.get('AIROS_SESSIONID', [''])[0]
+            if creds != (self.fake.username, self.fake.password):
+                return self._send(403, b'')
+            self.fake._login(session)
+            return self._send(200, b'')
+        elif path == '/api/1.1/login':
+            creds = json.loads(body or '{}')
+            if (creds.get('username'), creds.get('password')) != (
+                    self.fake.username, self.fake.password):
+                return self._send(401, b'{}')
+            session = self.fake._new_session()
+            self.fake._login(session)
+            return self._send(200, b'{}', headers=[
+                ('Set-Cookie', '%s=%s; Path=/' % (self.fake.COOKIE,
+                                                  session))])
+        return self._send(404, b'{}')
+
+
+class _FakeServer(object):
+    handler = None
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, gzip=False,
+                 error_rate=0, snapshot_size=200 * 1024, etags=False):
+        self.host = host
+        self.etags = etags
+        self.latency = latency
+        self.gzip = gzip
+        self.error_rate = error_rate
+        self.snapshot = _jpeg(snapshot_size)
+        self.requests = {}
+        self.not_modified = 0
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self.handler)
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def _count(self, method):
+        with self._lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+
+    @property
+    def request_count(self):
+        with self._lock:
+            return sum(self.requests.values())
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        args=(0.05,))
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class FakeNVR(_FakeServer):
+    """A stand-in Unifi Video NVR serving a generated fleet.
+
+    :param cameras: Number of cameras to generate
+    :param alerts: Number of alerts to generate
+    :param version: NVR version reported by the bootstrap
+    :param apikey: If set, requests with another apiKey are refused
+    :param latency: Seconds to wait before answering each request
+    :param gzip: Whether to gzip responses for clients that accept it
+    :param error_rate: Fraction of requests answered with a 500
+    :param etags: Whether to send ETags and answer If-None-Match
+    :param alert_paging: Whether the alert list honours the startTime,
+                         limit, offset and order query arguments
+    """
+    handler = _NVRHandler
+
+    def __init__(self, cameras=10, alerts=0, version='3.10.0', apikey=None,
+                 users=(('admin', 'admin'),), alert_paging=True, **kwargs):
+        super(FakeNVR, self).__init__(**kwargs)
+        self.apikey = apikey
+        self.users = list(users)
+        self.bootstrap = {'systemInfo': {'version': version}}
+        self.cameras = [make_camera(i, version) for i in range(cameras)]
+        self.alerts = [make_alert(i, self.cameras) for i in range(alerts)]
+        self.alert_paging = alert_paging
+
+    @property
+    def env(self):
+        """The UVC environment variable for talking to this server."""
+        return 'http://%s:%i/?apiKey=%s' % (self.host, self.port,
+                                            self.apikey or 'fake')
+
+    def find_camera(self, key):
+        for camera in self.cameras:
+            if key in (camera['_id'], camera['uuid']):
+                return camera
+        return None
+
+    def update_camera(self, key, update):
+        with self._lock:
+            camera = self.find_camera(key)
+            if camera is not None:
+                _merge(camera, update)
+            return camera
+
+    def list_alerts(self, query):
+        alerts = [a for a in self.alerts if a['alertState'] != 'deleted']
+        if not self.alert_paging:
+            return alerts
+
+        def arg(name, default=None):
+            return query.get(name, [default])[0]
+
+        if arg('startTime') is not None:
+            alerts = [a for a in alerts
+                      if a['timestamp'] >= int(arg('startTime'))]
+        alerts.sort(key=lambda a: a['timestamp'],
+                    reverse=arg('order') == 'desc')
+        offset = int(arg('offset', 0))
+        if arg('limit') is not None:
+            return alerts[offset:offset + int(arg('limit'))]
+        return alerts[offset:]
+
+    def update_alert(self, key, update):
+        with self._lock:
+            for alert in self.alerts:
+                if alert['_id'] == key:
+                    alert.update(update)
+                    return alert
+        return None
+
+
+class FakeCamera(_FakeServer):
+    """A stand-in camera web interface (both login styles).
+
+    :param username: Admin username the camera accepts
+    :param password: Admin password the camera accepts
+    :param snapshot_size: Size in bytes of the served JPEG
+    """
+    handler = _CameraHandler
+    COOKIE = 'AIROS_SESSIONID'
+
+    def __init__(self, username='ubnt', password='ubnt', **kwargs):
+        super(FakeCamera, self).__init__(**kwargs)
+        self.username = username
+        self.password = password
+        self.status = {'deviceInfo': {'name': 'Fake camera'}}
+        self.config = {}
+        self.reboots = 0
+        self.logins = 0
+        self._sessions = set()
+
+    def _new_session(self):
+        return uuid_module.uuid4().hex
+
+    def _login(self, session):
+        with self._lock:
+            self.logins += 1
+            self._sessions.add(session)
+
+    def _valid_session(self, session):
+        with self._lock:
+            return session in self._sessions
+
+    def expire_sessions(self):
+        """Forget every session, as if the camera had rebooted."""
+        with self._lock:
+            self._sessions.clear()
+
+
+def _merge(target, update):
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = value
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--host', default='127.0.0.1')
+    parser.add_option('--port', default=7080, type=int)
+    parser.add_option('--cameras', default=10, type=int,
+                      help='Number of cameras in the fleet')
+    parser.add_option('--alerts', default=0, type=int,
+                      help='Number of alerts in the alert table')
+    parser.add_option('--latency', default=0, type=float,
+                      help='Seconds to wait before each response')
+    parser.add_option('--gzip', action='store_true', default=False,
+                      help='Gzip responses')
+    parser.add_option('--error-rate', default=0, type=float,
+                      help='Fraction of requests that fail with a 500')
+    parser.add_option('--camera-port', default=None, type=int,
+                      help='Also serve a fake camera on this port')
+    opts, args = parser.parse_args()
+
+    nvr = FakeNVR(cameras=opts.cameras, alerts=opts.alerts,
+                  host=opts.host, port=opts.port, latency=opts.latency,
+                  gzip=opts.gzip, error_rate=opts.error_rate).start()
+    servers = [nvr]
+    print('export UVC="%s"' % nvr.env)
+    if opts.camera_port:
+        servers.append(FakeCamera(host=opts.host, port=opts.camera_port,
+                                  latency=opts.latency).start())
+        print('Fake camera on %s:%i' % (opts.host, opts.camera_port))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""A copy of the NVR's bootstrap and camera list kept on disk.
+
+Read-only queries can be answered from it without contacting the NVR::
+
+    cache = FleetCache(client)
+    fleet = cache.snapshot()
+    print(fleet.get_recordmode('Front Porch'))
+
+The file starts with a short JSON header holding the bootstrap and,
+for every camera, its ids, name, addresses, state and where its
+document lies in the rest of the file. The documents follow as plain
+JSON. The file is memory-mapped, so opening it only reads the header;
+a camera's document is decoded when it is first looked at.
+
+How old the copy may be is up to max_age and stale_age. Within
+max_age it is used as it is. Up to stale_age it is still used, but a
+fresh copy is fetched in the background for next time. Older than
+that, or missing, the NVR is asked before answering.
+"""
+
+import copy
+import json
+import logging
+import mmap
+import os
+import re
+import threading
+import time
+
+from uvcclient import nvr
+
+LOG = logging.getLogger(__name__)
+
+MAGIC = b'UVCFLEET1\n'
+_LENGTH_SIZE = 11  # Ten digits and a newline
+INDEX_KEYS = ('_id', 'uuid', 'name', 'mac', 'host', 'state', 'managed',
+              'deleted')
+
+
+def default_path(host, port):
+    """The cache file for an NVR, next to the ~/.uvcclient store."""
+    name = re.sub('[^A-Za-z0-9.-]', '_', '%s-%s' % (host, port))
+    return os.path.expanduser(os.path.join('~', '.uvcclient-fleet-%s' %
+                                           name))
+
+
+def write(path, bootstrap, cameras):
+    """Write a cache file.
+
+    :param cameras: (document, json text) pairs, such as from
+                    UVCRemote._uvc_iter(..., raw=True)
+    """
+    entries = []
+    texts = []
+    offset = 0
+    for doc, text in cameras:
+        data = text.encode('utf-8')
+        entry = dict((key, doc.get(key)) for key in INDEX_KEYS)
+        entry['offset'] = offset
+        entry['length'] = len(data)
+        entries.append(entry)
+        texts.append(data)
+        offset += len(data)
+    header = json.dumps({'time': time.time(),
+                         'bootstrap': bootstrap,
+                         'cameras': entries}).encode('utf-8')
+    tmp = '%s.%i.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(('%010i\n' % len(header)).encode('ascii'))
+        f.write(header)
+        for data in texts:
+            f.write(data)
+    os.chmod(tmp, 0o600)
+    os.rename(tmp, path)
+
+
+class FleetFile(object):
+    """An open cache file.
+
+    :raises: ValueError if the file is not a valid cache file, and
+             OSError/IOError if it cannot be read
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError('Empty cache file')
+        try:
+            start = len(MAGIC) + _LENGTH_SIZE
+            if self._map[:len(MAGIC)] != MAGIC:
+                raise ValueError('Not a fleet cache file')
+            length = int(self._map[len(MAGIC):start])
+            header = json.loads(self._map[start:start + length].decode())
+            self._data_start = start + length
+            self.time = header['time']
+            self.bootstrap = header['bootstrap']
+            self.entries = header['cameras']
+            if self.entries:
+                last = self.entries[-1]
+                if self._data_start + last['offset'] + last['length'] > len(
+                        self._map):
+                    raise ValueError('Truncated cache file')
+        except Exception:
+            self._map.close()
+            raise
+
+    @property
+    def age(self):
+        return time.time() - self.time
+
+    def document(self, entry):
+        """Decode the document of one camera entry."""
+        start = self._data_start + entry['offset']
+        return json.loads(self._map[start:start + entry['length']].decode())
+
+    def close(self):
+        self._map.close()
+
+
+class CachedFleet(nvr.FleetSnapshot):
+    """A FleetSnapshot read from a cache file.
+
+    index(), lookups and name resolution use only the header; camera
+    documents are decoded as they are needed.
+    """
+
+    def __init__(self, client, fleet_file):
+        self._client = client
+        self._file = fleet_file
+        self._resolver = None
+        self._docs = {}
+        self._by_key = {}
+        self._by_mac = {}
+        for entry in fleet_file.entries:
+            for key in ('_id', 'uuid', 'name'):
+                if entry.get(key) is not None:
+                    self._by_key.setdefault(entry[key], entry)
+            if entry.get('mac'):
+                self._by_mac.setdefault(nvr._normalize_mac(entry['mac']),
+                                        entry)
+
+    @property
+    def age(self):
+        """Seconds since the cache was written."""
+        return self._file.age
+
+    def _document(self, entry):
+        doc = self._docs.get(entry['_id'])
+        if doc is None:
+            doc = self._docs[entry['_id']] = self._file.document(entry)
+        return doc
+
+    @property
+    def _cameras(self):
+        return [self._document(entry) for entry in self._file.entries]
+
+    def __len__(self):
+        return len(self._file.entries)
+
+    def lookup(self, key):
+        try:
+            entry = self._by_key[key]
+        except KeyError:
+            try:
+                entry = self._by_mac.get(nvr._normalize_mac(key))
+            except AttributeError:
+                entry = None
+        return entry and self._document(entry)
+
+    def index(self):
+        return [nvr._index_entry(entry) for entry in self._file.entries
+                if not entry['deleted']]
+
+    def get_camera(self, uuid):
+        # A camera added since the cache was written is fetched from the
+        # NVR rather than reported missing
+        camera = self.lookup(uuid)
+        if camera is None:
+            return self._client.get_camera(uuid)
+        return copy.deepcopy(camera)
+
+
+class FleetCache(object):
+    """Keeps a client's fleet cache file up to date.
+
+    :param client: A UVCRemote
+    :param path: The cache file, by default one per NVR next to the
+                 ~/.uvcclient store
+    :param max_age: Seconds a cached copy is used without refreshing
+    :param stale_age: Seconds a cached copy is still used while a fresh
+                      one is fetched in the background
+    """
+
+    def __init__(self, client, path=None, max_age=60, stale_age=3600):
+        self._client = client
+        self._path = path or default_path(client._host, client._port)
+        self._max_age = max_age
+        self._stale_age = stale_age
+        self._refresher = None
+
+    def _open(self):
+        try:
+            return FleetFile(self._path)
+        except (OSError, IOError):
+            return None
+        except ValueError as ex:
+            LOG.warning('Ignoring bad fleet cache %s: %s', self._path, ex)
+            return None
+
+    def refresh(self):
+        """Fetch the fleet from the NVR and save it.
+
+        :returns: A CachedFleet of the new copy
+        """
+        bootstrap = self._client._get_bootstrap()
+        write(self._path, bootstrap,
+              self._client._uvc_iter('/api/2.0/camera', raw=True))
+        return CachedFleet(self._client, FleetFile(self._path))
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+        except Exception as ex:
+            LOG.debug('Refreshing fleet cache failed: %s', ex)
+
+    def refresh_in_background(self):
+        """Start refreshing the cache in a thread, unless already doing so.
+
+        The thread is not a daemon, so a program that exits meanwhile
+        waits for it to finish writing.
+        """
+        if self._refresher is None or not self._refresher.is_alive():
+            self._refresher = threading.Thread(target=self._refresh_quietly,
+                                               name='FleetCacheRefresh')
+            self._refresher.start()
+        return self._refresher
+
+    def wait(self, timeout=None):
+        """Wait for a background refresh to finish."""
+        if self._refresher is not None:
+            self._refresher.join(timeout)
+
+    def snapshot(self):
+        """Return a CachedFleet, as fresh as the staleness policy needs.
+
+        The client's bootstrap is taken from the cache too if it has
+        not been fetched yet.
+        """
+        fleet_file = self._open()
+        if fleet_file is None or fleet_file.age > self._stale_age:
+            if fleet_file is not None:
+                fleet_file.close()
+            fleet = self.refresh()
+        else:
+            if fleet_file.age > self._max_age:
+                LOG.debug('Fleet cache is %is old, refreshing',
+                          fleet_file.age)
+                self.refresh_in_background()
+            fleet = CachedFleet(self._client, fleet_file)
+        if self._client._bootstrap_data is None:
+            self._client._bootstrap_data = fleet._file.bootstrap
+        return fleet
+
+    def invalidate(self):
+        """Remove the cache file, so the next snapshot() asks the NVR."""
+        try:
+            os.unlink(self._path)
+        except (OSError, IOError):
+            pass
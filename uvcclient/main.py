@@ -14,44 +14,88 @@
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import fnmatch
 import getpass
 import logging
 import optparse
 import sys
 import pprint
 
+from uvcclient import alerts
 from uvcclient import nvr
 from uvcclient import camera
+from uvcclient import fleetcache
+from uvcclient import reconcile
+from uvcclient import resilience
+from uvcclient import router as router_module
 from uvcclient import store
 
 INFO_STORE = store.get_info_store()
 
 
-def do_led(camera_info, enabled):
+def do_led(camera_info, enabled, policy=None):
     password = INFO_STORE.get_camera_password(camera_info['uuid']) or 'ubnt'
     cam_client = camera.UVCCameraClient(camera_info['host'],
                                         camera_info['username'],
-                                        password)
-    cam_client.login()
+                                        password,
+                                        session_store=INFO_STORE,
+                                        policy=policy)
+    cam_client.ensure_login()
     cam_client.set_led(enabled)
 
 
-def do_snapshot(client, camera_info):
-    password = INFO_STORE.get_camera_password(camera_info['uuid']) or 'ubnt'
-    if client.server_version >= (3, 2, 0):
-        cam_client = camera.UVCCameraClientV320(camera_info['host'],
-                                                camera_info['username'],
-                                                password)
-    else:
-        cam_client = camera.UVCCameraClient(camera_info['host'],
-                                            camera_info['username'],
-                                            password)
-    try:
-        cam_client.login()
-        return cam_client.get_snapshot()
-    except (camera.CameraAuthError, camera.CameraConnectError):
-        # Fall back to proxy through the NVR
-        return client.get_snapshot(camera_info['uuid'])
+def do_snapshot(client, camera_info, router=None):
+    if router is None:
+        router = snapshot_router(client)
+    return router.get_snapshot(camera_info)
+
+
+def snapshot_router(client, cache_store=None):
+    """Return a SnapshotRouter that tries the camera or the NVR,
+    whichever has worked best for it before."""
+    return router_module.SnapshotRouter(client, store=cache_store,
+                                        passwords=INFO_STORE)
+
+
+def select_cameras(client, pattern=None):
+    """Return the identifiers of all cameras whose name matches pattern.
+
+    This is for commands that change every matching camera, so it reads
+    a fresh index and matches the whole name as a glob, never a prefix.
+    """
+    idents = []
+    for cam in client.index():
+        if pattern and not fnmatch.fnmatch(cam['name'].lower(),
+                                           pattern.lower()):
+            continue
+        idents.append(cam[client.camera_identifier])
+    return idents
+
+
+def changes_cameras(opts):
+    """Whether the command in opts changes any camera's settings."""
+    return bool(opts.reconcile or opts.recordmode or opts.externalirmode or
+                opts.irsensitivity or opts.irledmode or
+                opts.set_picture_settings or opts.set_led is not None or
+                opts.prune_zones)
+
+
+def do_fleet_set(client, opts, setter):
+    targets = select_cameras(client, opts.filter)
+    if not targets:
+        print('No cameras matched')
+        return 1
+    results = client.map_cameras(setter, targets,
+                                 max_workers=opts.workers, rate=opts.rate)
+    failed = 0
+    for ident, result in results.items():
+        if not result.ok:
+            print('%s: failed: %s' % (ident, result.error))
+            failed += 1
+        elif result.value is not True:
+            print('%s: not updated' % ident)
+            failed += 1
+    return 1 if failed else 0
 
 
 def do_set_password(opts):
@@ -68,6 +112,45 @@ def do_set_password(opts):
     print('Password set')
 
 
+def delete_alert_filter(timestamp=None, alert_type=None):
+    """Match alerts with the timestamp or the type, as --delete-alert
+    always has; giving both widens the match rather than narrowing it."""
+    predicates = []
+    if timestamp is not None:
+        predicates.append(alerts.alert_filter(start=timestamp,
+                                              end=timestamp))
+    if alert_type is not None:
+        predicates.append(alerts.alert_filter(alert_type=alert_type))
+    return lambda alert: any(match(alert) for match in predicates)
+
+
+def do_reconcile(client, opts):
+    try:
+        desired = reconcile.DesiredState.load(opts.reconcile)
+    except (IOError, OSError, ValueError, nvr.Invalid) as ex:
+        print('Unable to load %s: %s' % (opts.reconcile, ex))
+        return 1
+    plan, results = reconcile.reconcile(client, desired, opts.dry_run,
+                                        max_workers=opts.workers,
+                                        rate=opts.rate)
+    if plan.cameras or plan.unmatched:
+        print(plan.describe())
+    if plan.unmatched:
+        print('%i camera entries match no camera; nothing changed' %
+              len(plan.unmatched))
+        return 1
+    if not plan.cameras:
+        print('All cameras match')
+    elif results is not None:
+        failed = [r for r in results.values() if not r.ok]
+        for result in failed:
+            print('%s: failed: %s' % (result.camera, result.error))
+        print('%i cameras updated' % (len(results) - len(failed)))
+        if failed:
+            return 1
+    return 0
+
+
 def main():
     host, port, apikey, path = nvr.get_auth_from_env()
 
@@ -79,10 +162,39 @@ def main():
     parser.add_option('-K', '--apikey', default=apikey,
                       help='UVC API Key')
     parser.add_option('-v', '--verbose', action='store_true', default=False)
+    parser.add_option('--no-cache', action='store_true', default=False,
+                      help='Do not use cached NVR information')
+    parser.add_option('--max-age', default=60, type=float,
+                      help=('Seconds cached camera information is used for '
+                            '--list, --get-recordmode and --list-zones '
+                            'before asking the NVR again'))
+    parser.add_option('--stale-age', default=None, type=float,
+                      help=('Seconds older cached camera information is '
+                            'still used while a fresh copy is fetched in '
+                            'the background (default: --max-age)'))
     parser.add_option('-d', '--dump', action='store_true', default=False)
     parser.add_option('-u', '--uuid', default=None, help='Camera UUID')
-    parser.add_option('--name', default=None, help='Camera name')
+    parser.add_option('--name', default=None,
+                      help=('Camera name (or a unique prefix of one), MAC '
+                            'address or IP address'))
     parser.add_option('-l', '--list', action='store_true', default=False)
+    parser.add_option('--all', action='store_true', default=False,
+                      help='Apply a set option to every camera')
+    parser.add_option('--filter', default=None, metavar='PATTERN',
+                      help=('Apply a set option to every camera whose name '
+                            'matches the glob PATTERN; use PATTERN* to '
+                            'match a prefix'))
+    parser.add_option('--workers', default=4, type=int,
+                      help=('Cameras to update at once with --all/--filter, '
+                            'or alerts to delete at once'))
+    parser.add_option('--rate', default=None, type=float,
+                      help=('Most camera updates or alert deletes to start '
+                            'per second'))
+    parser.add_option('--timeout', default=10, type=float,
+                      help=('Seconds to wait for the NVR or a camera to '
+                            'connect or answer (0 to wait forever)'))
+    parser.add_option('--retries', default=2, type=int,
+                      help='Times to retry a request that failed')
     parser.add_option('--irsensitivity', default=None,
                       help='IR Camera Sensitivity (low,medium,high)')
     parser.add_option('--irledmode', default=None,
@@ -124,6 +236,14 @@ def main():
     parser.add_option('--password', default=None, help='Password to attempt the login with')
     parser.add_option('--get-allalerts', default=None, action='store_true',
                       help='Dump the alerts in the alert table')
+    parser.add_option('--reconcile', default=None, metavar='FILE',
+                      help=('Change camera settings to match a desired '
+                            'state file'))
+    parser.add_option('--dry-run', action='store_true', default=False,
+                      help='With --reconcile, only show the changes')
+    parser.add_option('--get-newalerts', default=None, action='store_true',
+                      help=('Dump the alerts added since the last time '
+                            'this was run'))
     parser.add_option('--delete-allalerts', default=None, action='store_true',
                       help='Deletes all the alerts in the alert table')
     parser.add_option('--delete-alert', action='store_true',
@@ -143,21 +263,57 @@ def main():
         level = logging.WARNING
     logging.basicConfig(level=level)
 
-    client = nvr.UVCRemote(opts.host, opts.port, opts.apikey)
+    if opts.no_cache:
+        cache_store = None
+    else:
+        cache_store = store.get_cache_store()
+    policy = resilience.Policy(connect_timeout=opts.timeout or None,
+                               read_timeout=opts.timeout or None,
+                               retries=opts.retries,
+                               breakers=resilience.BreakerRegistry())
+    client = nvr.UVCRemote(opts.host, opts.port, opts.apikey,
+                           bootstrap_cache=cache_store, policy=policy)
+
+    # Read-only queries are answered from the fleet cache file when it
+    # is recent enough; anything else may change the cameras, so the
+    # file is dropped and the next query fetches them again
+    reader = client
+    if not opts.no_cache:
+        fleet_cache = fleetcache.FleetCache(
+            client, max_age=opts.max_age,
+            stale_age=max(opts.max_age, opts.stale_age or 0))
+        if opts.list or opts.get_recordmode or opts.list_zones:
+            reader = fleet_cache.snapshot()
+        elif changes_cameras(opts):
+            fleet_cache.invalidate()
 
     if opts.name:
-        opts.uuid = client.name_to_uuid(opts.name)
+        opts.uuid = reader.name_to_uuid(opts.name)
+        if not opts.uuid:
+            matches = reader.resolver.find(opts.name)
+            if len(matches) == 1:
+                opts.uuid = matches[0][client.camera_identifier]
+            elif matches:
+                print('`%s\' matches more than one camera: %s' % (
+                    opts.name, ', '.join(cam['name'] for cam in matches)))
+                return 1
         if not opts.uuid:
             print('`%s\' is not a valid name' % opts.name)
             return
 
-    if opts.dump:
+    if opts.reconcile:
+        return do_reconcile(client, opts)
+    elif opts.dump:
         client.dump(opts.uuid)
     elif opts.list:
-        for cam in client.index():
+        if reader is client:
+            fleet = client.fleet_snapshot()
+        else:
+            fleet = reader
+        for cam in fleet.index():
             ident = cam[client.camera_identifier]
-            recmode = client.get_recordmode(ident)
-            ip = client.get_cameraipaddress(ident)
+            recmode = fleet.get_recordmode(ident)
+            ip = fleet.get_cameraipaddress(ident)
             if not cam['managed']:
                 status = 'new'
             elif cam['state'] == 'FIRMWARE_OUTDATED':
@@ -173,6 +329,10 @@ def main():
             print('%s: %-24.24s %s [%10s] %s' % (cam['id'], cam['name'], ip, status, recmode))
 
     elif opts.recordmode:
+        if opts.all or opts.filter:
+            return do_fleet_set(
+                client, opts, lambda ident: client.set_recordmode(
+                    ident, opts.recordmode, opts.recordchannel))
         if not opts.uuid:
             print('Name or UUID is required')
             return 1
@@ -184,6 +344,10 @@ def main():
         else:
             return 1
     elif opts.externalirmode:
+        if opts.all or opts.filter:
+            return do_fleet_set(
+                client, opts, lambda ident: client.set_externalirmode(
+                    ident, opts.externalirmode))
         if not opts.uuid:
             print('Name or UUID is required')
             return 1
@@ -194,6 +358,10 @@ def main():
         else:
             return 1
     elif opts.irsensitivity:
+        if opts.all or opts.filter:
+            return do_fleet_set(
+                client, opts, lambda ident: client.set_irsensitivity(
+                    ident, opts.irsensitivity))
         if not opts.uuid:
             print('Name or UUID is required')
             return 1
@@ -204,6 +372,10 @@ def main():
         else:
             return 1
     elif opts.irledmode:
+        if opts.all or opts.filter:
+            return do_fleet_set(
+                client, opts, lambda ident: client.set_irledmode(
+                    ident, opts.irledmode))
         if not opts.uuid:
             print('Name or UUID is required')
             return 1
@@ -217,7 +389,7 @@ def main():
         if not opts.uuid:
             print('Name or UUID is required')
             return 1
-        r = client.get_recordmode(opts.uuid)
+        r = reader.get_recordmode(opts.uuid)
         print(r)
         return r == 'none'
 
@@ -275,7 +447,7 @@ def main():
         if 'Micro' not in camera['model']:
             print('Only micro cameras support LED status')
             return 2
-        do_led(camera, opts.set_led.lower() == 'on')
+        do_led(camera, opts.set_led.lower() == 'on', policy)
     elif opts.prune_zones:
         if not opts.uuid:
             print('Name or UUID is required')
@@ -285,7 +457,7 @@ def main():
         if not opts.uuid:
             print('Name or UUID is required')
             return 1
-        zones = client.list_zones(opts.uuid)
+        zones = reader.list_zones(opts.uuid)
         for zone in zones:
             print(zone['name'])
     elif opts.get_snapshot:
@@ -293,50 +465,44 @@ def main():
         if not camera:
             print('No such camera')
             return 1
-        if hasattr(sys.stdout, 'buffer'):
-            # sys.stdout.buffer.write(do_snapshot(client, camera))
-            sys.stdout.buffer.write(client.get_snapshot(opts.uuid))
-        else:
-            sys.stdout.write(do_snapshot(client, camera))
+        snapshot_router(client, cache_store).stream_snapshot(
+            camera, getattr(sys.stdout, 'buffer', sys.stdout))
     elif opts.set_password:
         do_set_password(opts)
     elif opts.get_allalerts:
         data = client.get_all_alerts()
         for alert in data:
             pprint.pprint(alert)
+    elif opts.get_newalerts:
+        sync = alerts.AlertSync(client, INFO_STORE)
+        for alert in sync.sync():
+            pprint.pprint(alert)
     elif opts.delete_alert:
-        data = client.get_all_alerts()
-        for alert in data:
-            if opts.timestamp is not None:
-                if alert['timestamp'] == opts.timestamp:
-                    alert['alertState'] = 'deleted'
-                    if client.delete_alert(alert)['timestamp'] == opts.timestamp:
-                        print("Alert Deleted")
-                    else:
-                        print("Failed to delete alert")
-            if opts.alert_type is not None:
-                if opts.alert_type == str(alert['alertType']):
-                    alert['alertState'] = 'deleted'
-                    resp = client.delete_alert(alert)
-                    if resp['data'][0]['alertType'] == opts.alert_type:
-                        print("Alert " + resp['data'][0]['_id'] + " Deleted")
-                    else:
-                        print("Failed to delete alert")
+        if opts.timestamp is None and opts.alert_type is None:
+            print('--timestamp or --alert-type is required')
+            return 1
+        result = client.delete_alerts(
+            predicate=delete_alert_filter(opts.timestamp, opts.alert_type),
+            max_workers=opts.workers, rate=opts.rate, verify=False)
+        for ident in result.deleted:
+            print("Alert " + ident + " Deleted")
+        for ident, error in result.failed.items():
+            print("Failed to delete alert %s: %s" % (ident, error))
+        if not result.deleted and not result.failed:
+            print("No matching alerts")
+        return 0 if result.ok else 1
     elif opts.delete_allalerts is not None:
-        data = client.get_all_alerts()
-        for alert in data:
-            alert['alertState'] = 'deleted'
-            resp = client.delete_alert(alert)
-            if resp['data'][0]['_id'] == alert['_id']:
-                print("Alert " + resp['data'][0]['_id'] + " Deleted")
-            else:
-                print("Failed to delete alert")
-
-        data = client.get_all_alerts()
-        if len(data) <= 1:
+        result = client.delete_alerts(max_workers=opts.workers,
+                                      rate=opts.rate)
+        print("%i alerts deleted" % len(result.deleted))
+        for ident, error in result.failed.items():
+            print("Failed to delete alert %s: %s" % (ident, error))
+        if not result.remaining:
             print("All alerts deleted")
         else:
-            print(str(len(data)) + " alerts remaining following deletion")
+            print(str(result.remaining) +
+                  " alerts remaining following deletion")
+        return 0 if result.ok else 1
     elif opts.test_login:
         resp = client.test_login(opts.username, opts.password)
         if resp.status == 200:
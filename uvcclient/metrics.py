@@ -0,0 +1,250 @@
+"""Per-request instrumentation for UVCRemote.
+
+UVCRemote calls its pre-request hooks with a RequestInfo before each
+NVR request and its post-request hooks once the response has been
+parsed, or the request failed. RequestMetrics is a hook that keeps
+in-memory histograms and counters per endpoint and can export them in
+the Prometheus text format::
+
+    metrics = RequestMetrics()
+    metrics.install(client)
+    client.index()
+    print(metrics.prometheus())
+
+Given the BreakerRegistry of a resilience.Policy, it also exports the
+state of each host's circuit breaker.
+"""
+
+import re
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0)
+
+_ID_SEGMENT = re.compile(r'^([0-9a-fA-F]{24}|[0-9a-fA-F-]{36}|[0-9]+)$')
+
+
+def endpoint(path):
+    """Return path without its query and with object ids replaced.
+
+    This keeps one label per API endpoint rather than one per camera.
+    """
+    path = path.split('?', 1)[0]
+    return '/'.join(':id' if _ID_SEGMENT.match(part) else part
+                    for part in path.split('/'))
+
+
+class RequestInfo(object):
+    """What is known about one NVR request.
+
+    Times are in seconds. status is None until a response arrives and
+    error is set if the request failed. bytes_saved is how much smaller
+    bytes_out was for sending only part of a document.
+    """
+
+    __slots__ = ('method', 'path', 'status', 'bytes_out', 'bytes_in',
+                 'bytes_saved', 'decompress_time', 'parse_time', 'latency',
+                 'started', 'error')
+
+    def __init__(self, method, path, bytes_out=0):
+        self.method = method
+        self.path = path
+        self.status = None
+        self.bytes_out = bytes_out
+        self.bytes_in = 0
+        self.bytes_saved = 0
+        self.decompress_time = 0.0
+        self.parse_time = 0.0
+        self.latency = None
+        self.started = time.time()
+        self.error = None
+
+    @property
+    def endpoint(self):
+        return endpoint(self.path)
+
+    def __repr__(self):
+        return '<RequestInfo %s %s status=%s latency=%s>' % (
+            self.method, self.path, self.status, self.latency)
+
+
+class Histogram(object):
+    """A cumulative histogram with fixed upper bounds."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        """Return (upper bound, count) pairs as Prometheus expects."""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            pairs.append((bound, total))
+        pairs.append((float('inf'), self.count))
+        return pairs
+
+
+class _EndpointStats(object):
+    def __init__(self, buckets):
+        self.latency = Histogram(buckets)
+        self.statuses = {}
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.bytes_saved = 0
+        self.decompress_time = 0.0
+        self.parse_time = 0.0
+
+
+def _labels(**labels):
+    return ','.join('%s="%s"' % (key, str(value).replace('"', '\\"'))
+                    for key, value in sorted(labels.items()))
+
+
+def _bound(value):
+    return '+Inf' if value == float('inf') else repr(float(value))
+
+
+class RequestMetrics(object):
+    """Collects request latencies and sizes per (method, endpoint).
+
+    :param breakers: A resilience.BreakerRegistry to report on, or None
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, breakers=None):
+        self._buckets = buckets
+        self._breakers = breakers
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def install(self, client):
+        """Add this collector as a post-request hook on client."""
+        client.add_request_hook(post=self.observe)
+        return self
+
+    def observe(self, info):
+        key = (info.method, info.endpoint)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _EndpointStats(self._buckets)
+            if info.latency is not None:
+                stats.latency.observe(info.latency)
+            if info.error is not None:
+                stats.errors += 1
+            status = info.status or 'error'
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.bytes_in += info.bytes_in
+            stats.bytes_out += info.bytes_out
+            stats.bytes_saved += info.bytes_saved
+            stats.decompress_time += info.decompress_time
+            stats.parse_time += info.parse_time
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def summary(self):
+        """Return a dict of 'METHOD endpoint' to its totals."""
+        result = {}
+        with self._lock:
+            for (method, path), stats in self._stats.items():
+                count = stats.latency.count
+                result['%s %s' % (method, path)] = {
+                    'count': count,
+                    'errors': stats.errors,
+                    'mean_latency': stats.latency.sum / count if count
+                    else None,
+                    'statuses': dict(stats.statuses),
+                    'bytes_in': stats.bytes_in,
+                    'bytes_out': stats.bytes_out,
+                    'bytes_saved': stats.bytes_saved,
+                    'decompress_time': stats.decompress_time,
+                    'parse_time': stats.parse_time,
+                }
+        return result
+
+    def prometheus(self, prefix='uvcclient'):
+        """Return the collected metrics in the Prometheus text format."""
+        latency = []
+        requests = []
+        transfer = []
+        saved = []
+        decode = []
+        with self._lock:
+            for (method, path), stats in sorted(self._stats.items()):
+                labels = _labels(method=method, endpoint=path)
+                for bound, count in stats.latency.cumulative():
+                    latency.append('%s_request_duration_seconds_bucket{%s,'
+                                   'le="%s"} %i' % (prefix, labels,
+                                                    _bound(bound), count))
+                latency.append('%s_request_duration_seconds_sum{%s} %r' % (
+                    prefix, labels, stats.latency.sum))
+                latency.append('%s_request_duration_seconds_count{%s} %i' % (
+                    prefix, labels, stats.latency.count))
+                for status, count in sorted(stats.statuses.items(),
+                                            key=lambda item: str(item[0])):
+                    requests.append('%s_requests_total{%s} %i' % (
+                        prefix, _labels(method=method, endpoint=path,
+                                        status=status), count))
+                for direction, count in (('in', stats.bytes_in),
+                                         ('out', stats.bytes_out)):
+                    transfer.append('%s_request_bytes_total{%s} %i' % (
+                        prefix, _labels(method=method, endpoint=path,
+                                        direction=direction), count))
+                if stats.bytes_saved:
+                    saved.append('%s_request_bytes_saved_total{%s} %i' % (
+                        prefix, labels, stats.bytes_saved))
+                for stage, seconds in (('decompress', stats.decompress_time),
+                                       ('parse', stats.parse_time)):
+                    decode.append('%s_decode_seconds_total{%s} %r' % (
+                        prefix, _labels(method=method, endpoint=path,
+                                        stage=stage), seconds))
+
+        states = []
+        trips = []
+        if self._breakers is not None:
+            for host, stats in sorted(self._breakers.stats().items()):
+                for state in ('closed', 'open', 'half-open'):
+                    states.append('%s_circuit_state{%s} %i' % (
+                        prefix, _labels(host=host, state=state),
+                        stats['state'] == state))
+                trips.append('%s_circuit_trips_total{%s} %i' % (
+                    prefix, _labels(host=host), stats['trips']))
+
+        lines = []
+        for name, kind, help_text, samples in (
+                ('request_duration_seconds', 'histogram',
+                 'NVR request latency', latency),
+                ('requests_total', 'counter',
+                 'NVR requests by response status', requests),
+                ('request_bytes_total', 'counter',
+                 'Bytes sent to and received from the NVR', transfer),
+                ('request_bytes_saved_total', 'counter',
+                 'Bytes not sent thanks to partial updates', saved),
+                ('decode_seconds_total', 'counter',
+                 'Time spent decompressing and parsing responses', decode),
+                ('circuit_state', 'gauge',
+                 'Circuit breaker state of each host', states),
+                ('circuit_trips_total', 'counter',
+                 'Times each host\'s circuit breaker has opened', trips)):
+            if not samples and name.startswith(('circuit_',
+                                                'request_bytes_saved')):
+                continue
+            lines.append('# HELP %s_%s %s' % (prefix, name, help_text))
+            lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
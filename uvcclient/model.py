@@ -0,0 +1,259 @@
+"""Typed, compact views of NVR camera documents.
+
+A Camera keeps the JSON text of its document and only the handful of
+fields needed to list and find cameras (ids, name, addresses, state).
+The rest of the document is decoded the first time anything else is
+asked for, so a whole fleet can be held and scanned cheaply::
+
+    for cam in client.camera_models():
+        if cam.state == 'CONNECTED':
+            print(cam.name, cam.recording_settings.mode)
+
+The sections (IspSettings, RecordingSettings, OsdSettings) read and
+write the decoded document directly. Nothing is dropped or reordered,
+so to_payload() gives back exactly the document the NVR sent, plus any
+changes, including fields this module knows nothing about.
+"""
+
+import collections
+import json
+
+
+def _key(name, doc=None):
+    """A property reading and writing one key of the section's data."""
+    def get(self):
+        return self._data.get(name)
+
+    def set(self, value):
+        self._data[name] = value
+    return property(get, set, doc=doc)
+
+
+def _loads(text):
+    return json.loads(text, object_pairs_hook=collections.OrderedDict)
+
+
+class _Section(object):
+    """A view of one sub-document of a camera."""
+
+    __slots__ = ('_data',)
+
+    def __init__(self, data):
+        self._data = data
+
+    def to_payload(self):
+        return self._data
+
+    def __eq__(self, other):
+        return (type(self) is type(other) and
+                self._data == other._data)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, dict(self._data))
+
+
+class IspSettings(_Section):
+    __slots__ = ()
+
+    brightness = _key('brightness')
+    contrast = _key('contrast')
+    denoise = _key('denoise')
+    hue = _key('hue')
+    saturation = _key('saturation')
+    sharpness = _key('sharpness')
+    wdr = _key('wdr')
+    ir_brightness = _key('irOnValBrightness')
+    ir_contrast = _key('irOnValContrast')
+    ir_denoise = _key('irOnValDenoise')
+    ir_hue = _key('irOnValHue')
+    ir_saturation = _key('irOnValSaturation')
+    ir_sharpness = _key('irOnValSharpness')
+    ir_led_mode = _key('irLedMode')
+    ir_led_level = _key('irLedLevel')
+    icr_sensitivity = _key('icrSensitivity')
+    ae_mode = _key('aemode')
+    flip = _key('flip')
+    mirror = _key('mirror')
+    enable_external_ir = _key('enableExternalIr')
+
+    @property
+    def ir_led(self):
+        """off, on or auto, as UVCRemote.get_irledmode() reports it."""
+        if self.ir_led_mode == 'auto':
+            return 'auto'
+        elif self.ir_led_mode == 'manual' and self.ir_led_level == 0:
+            return 'off'
+        elif self.ir_led_mode == 'manual' and self.ir_led_level > 0:
+            return 'on'
+        return 'unknown'
+
+    @property
+    def ir_sensitivity(self):
+        """low, medium or high."""
+        return {0: 'low', 1: 'medium', 2: 'high'}.get(self.icr_sensitivity,
+                                                      'unknown')
+
+
+class RecordingSettings(_Section):
+    __slots__ = ()
+
+    full_time_record_enabled = _key('fullTimeRecordEnabled')
+    motion_record_enabled = _key('motionRecordEnabled')
+    channel = _key('channel')
+    pre_padding_secs = _key('prePaddingSecs')
+    post_padding_secs = _key('postPaddingSecs')
+
+    @property
+    def mode(self):
+        """none, full or motion, as UVCRemote.get_recordmode() reports it."""
+        if self.full_time_record_enabled:
+            return 'full'
+        elif self.motion_record_enabled:
+            return 'motion'
+        return 'none'
+
+
+class OsdSettings(_Section):
+    __slots__ = ()
+
+    enable_date = _key('enableDate')
+    enable_logo = _key('enableLogo')
+    tag = _key('tag')
+
+
+class Camera(object):
+    """One camera document, decoded on demand.
+
+    Use from_json() or from_document() to make one.
+    """
+
+    # Decoded as soon as the camera is made, for listing and lookups
+    INDEX_KEYS = ('_id', 'uuid', 'name', 'mac', 'host', 'state', 'managed',
+                  'deleted')
+
+    __slots__ = ('_index', '_text', '_doc', '_sections')
+
+    def __init__(self, index, text=None, doc=None):
+        self._index = index
+        self._text = text
+        self._doc = doc
+        self._sections = None
+
+    @classmethod
+    def from_json(cls, text, doc=None):
+        """Make a Camera from the JSON text of its document.
+
+        :param doc: The document already decoded from text, if the
+                    caller has it, to save decoding it again here
+        """
+        if doc is None:
+            doc = json.loads(text)
+        return cls(tuple(doc.get(key) for key in cls.INDEX_KEYS), text)
+
+    @classmethod
+    def from_document(cls, doc):
+        """Make a Camera around an already decoded document."""
+        return cls(tuple(doc.get(key) for key in cls.INDEX_KEYS), doc=doc)
+
+    @property
+    def document(self):
+        """The full camera document, decoded on first use."""
+        if self._doc is None:
+            self._doc = _loads(self._text)
+        return self._doc
+
+    @property
+    def decoded(self):
+        return self._doc is not None
+
+    def _get(self, key):
+        if self._doc is not None:
+            return self._doc.get(key)
+        return self._index[self.INDEX_KEYS.index(key)]
+
+    id = property(lambda self: self._get('_id'))
+    uuid = property(lambda self: self._get('uuid'))
+    mac = property(lambda self: self._get('mac'))
+    host = property(lambda self: self._get('host'))
+    state = property(lambda self: self._get('state'))
+    managed = property(lambda self: self._get('managed'))
+    deleted = property(lambda self: self._get('deleted'))
+
+    @property
+    def name(self):
+        return self._get('name')
+
+    @name.setter
+    def name(self, value):
+        self.document['name'] = value
+
+    model = property(lambda self: self.document.get('model'))
+    platform = property(lambda self: self.document.get('platform'))
+    firmware_version = property(
+        lambda self: self.document.get('firmwareVersion'))
+    firmware_build = property(lambda self: self.document.get('firmwareBuild'))
+    zones = property(lambda self: self.document.get('zones'))
+
+    @property
+    def mic_volume(self):
+        return self.document.get('micVolume')
+
+    @mic_volume.setter
+    def mic_volume(self, value):
+        self.document['micVolume'] = value
+
+    def _section(self, cls, key):
+        if self._sections is None:
+            self._sections = {}
+        section = self._sections.get(key)
+        if section is None:
+            section = self._sections[key] = cls(self.document[key])
+        return section
+
+    @property
+    def isp_settings(self):
+        return self._section(IspSettings, 'ispSettings')
+
+    @property
+    def recording_settings(self):
+        return self._section(RecordingSettings, 'recordingSettings')
+
+    @property
+    def osd_settings(self):
+        return self._section(OsdSettings, 'osdSettings')
+
+    def identifier(self, camera_identifier):
+        """The value to use in requests, given a client's
+        camera_identifier (id or uuid)."""
+        return self.id if camera_identifier == 'id' else self.uuid
+
+    def index_entry(self):
+        """The same dict as an entry of UVCRemote.index()."""
+        return {'name': self.name,
+                'uuid': self.uuid,
+                'state': self.state,
+                'managed': self.managed,
+                'id': self.id,
+                'mac': self.mac,
+                'host': self.host,
+                }
+
+    def to_payload(self):
+        """Return the document to PUT back, with any changes made."""
+        return self.document
+
+    def to_json(self):
+        """Return the JSON text to PUT back.
+
+        This is the text the camera was made from if it was never
+        decoded, and otherwise the document encoded again.
+        """
+        if self._doc is None:
+            return self._text
+        return json.dumps(self._doc)
+
+    def __repr__(self):
+        return '<Camera %s (%s)>' % (self.id, self.name)
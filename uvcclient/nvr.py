@@ -15,13 +15,24 @@
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import collections
+import copy
+import errno
+import hashlib
 import json
 import logging
 import pprint
 import os
+import re
+import socket
 import sys
+import threading
+import time
+import types
 import zlib
 
+from concurrent import futures
+
 # Python3 compatibility
 try:
     import httplib
@@ -30,8 +41,74 @@ except ImportError:
 
 try:
     import urlparse
+    from urllib import urlencode
 except ImportError:
     import urllib.parse as urlparse
+    from urllib.parse import urlencode
+
+from uvcclient import alerts as alerts_module
+from uvcclient import cache
+from uvcclient import metrics
+from uvcclient import model
+from uvcclient import resilience
+from uvcclient import resolver as resolver_module
+from uvcclient import streams
+
+_MISSING = object()
+
+CAMERA_PATH = re.compile(r'^/api/2\.0/camera/([^/?]+)$')
+
+
+def _normalize_mac(mac):
+    return re.sub('[^0-9a-f]', '', mac.lower())
+
+
+def camera_patch(original, document):
+    """Return the parts of document that differ from original.
+
+    Nested dicts are compared key by key and only changed keys are
+    kept; anything else that changed is included whole. Returns None
+    if a key was removed, which a merged update cannot express.
+    """
+    patch = {}
+    for key, value in document.items():
+        old = original.get(key, _MISSING)
+        if old == value:
+            continue
+        if isinstance(value, dict) and isinstance(old, dict):
+            value = camera_patch(old, value)
+            if value is None:
+                return None
+        patch[key] = value
+    if any(key not in document for key in original):
+        return None
+    return patch
+
+
+def _index_entry(camera):
+    return {'name': camera['name'],
+            'uuid': camera['uuid'],
+            'state': camera['state'],
+            'managed': camera['managed'],
+            'id': camera['_id'],
+            'mac': camera.get('mac'),
+            'host': camera.get('host'),
+            }
+
+
+def _closed_by_server(error):
+    """Whether error shows the server closed the connection before
+    answering, so the request can be sent again on a new one.
+
+    A timeout does not count: the server may still have acted on it.
+    """
+    if isinstance(error, httplib.BadStatusLine):
+        # Including RemoteDisconnected
+        return True
+    return (isinstance(error, socket.error) and
+            not isinstance(error, socket.timeout) and
+            error.errno in (errno.ECONNRESET, errno.ECONNABORTED,
+                            errno.EPIPE))
 
 
 class Invalid(Exception):
@@ -45,15 +122,327 @@ class NotAuthorized(Exception):
 class NvrError(Exception):
     pass
 
+
+class NvrServerError(NvrError, resilience.TransientError):
+    """The NVR failed to handle a request (a 5xx status)."""
+    pass
+
+
+class NvrRequestError(NvrError):
+    """The NVR refused a request (a 4xx status other than 401 or 403)."""
+    pass
+
 class CameraConnectionError(Exception):
     pass
 
 
+class RateLimiter(object):
+    """Spaces out calls so that at most ``rate`` start per second.
+
+    One limiter can be shared by any number of threads.
+    """
+
+    def __init__(self, rate):
+        self._interval = 1.0 / rate
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next)
+            self._next = start + self._interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class CameraResult(object):
+    """The outcome of an operation run against one camera."""
+
+    def __init__(self, camera, value=None, error=None):
+        self.camera = camera
+        self.value = value
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        if self.ok:
+            return '<CameraResult %s: %r>' % (self.camera, self.value)
+        return '<CameraResult %s: error %r>' % (self.camera, self.error)
+
+
+class _Tracked(object):
+    """What we know about the last response for a tracked path."""
+
+    __slots__ = ('etag', 'last_modified', 'digest', 'result')
+
+    def __init__(self, etag, last_modified, digest, result):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest
+        self.result = result
+
+
+class ChangeToken(object):
+    """The state of the fleet at one poll, for UVCRemote.changed_since."""
+
+    def __init__(self, cameras):
+        self.cameras = cameras
+        self.by_id = dict((cam['_id'], cam) for cam in cameras)
+
+
+class ConnectionPool(object):
+    """A bounded, thread-safe pool of persistent HTTP/1.1 connections.
+
+    Connections are created by ``factory`` on demand and returned to the
+    pool once their response has been fully read. At most ``max_idle``
+    connections are kept open; any extra ones are closed on release.
+    """
+
+    def __init__(self, factory, max_idle=4):
+        self._factory = factory
+        self._max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+        self.discards = 0
+
+    def get(self):
+        """Get a connection from the pool.
+
+        :returns: A tuple of (connection, reused)
+        """
+        with self._lock:
+            if self._idle:
+                self.hits += 1
+                return self._idle.pop(), True
+            self.misses += 1
+        return self._factory(), False
+
+    def put(self, conn):
+        """Return a connection whose response has been fully read."""
+        with self._lock:
+            if len(self._idle) < self._max_idle:
+                self._idle.append(conn)
+                return
+            self.discards += 1
+        conn.close()
+
+    def reconnect(self, conn):
+        """Replace a stale connection with a fresh one."""
+        conn.close()
+        with self._lock:
+            self.reconnects += 1
+        return self._factory()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'reconnects': self.reconnects,
+                    'discards': self.discards,
+                    'idle': len(self._idle)}
+
+
+class _Field(object):
+    """A camera setting that can be changed by name.
+
+    :param section: The sub-document holding the setting, or None for
+                    top-level keys
+    :param key: The key to set verbatim to the requested value
+    :param modes: Alternatively, a mapping of mode names to the keys and
+                  values they set
+    """
+
+    def __init__(self, section, key=None, modes=None):
+        self.section = section
+        self.key = key
+        self.modes = modes
+
+    def values(self, value):
+        """Validate a value and return the document keys it sets."""
+        if self.modes is None:
+            return {self.key: value}
+        try:
+            return self.modes[str(value).lower()]
+        except KeyError:
+            raise Invalid('Unknown mode')
+
+    def apply(self, camera, value):
+        """Apply a value to a camera document in place."""
+        if self.section:
+            camera = camera[self.section]
+        camera.update(self.values(value))
+
+
+def _switch(key, off=0, on=1, names=('off', 'on')):
+    return {names[0]: {key: off}, names[1]: {key: on}}
+
+
+def _ordered(*pairs):
+    return collections.OrderedDict(pairs)
+
+
+CAMERA_FIELDS = {
+    'enablestatusled': _Field(None, modes=_switch(
+        'enableStatusLed', False, True, ('false', 'true'))),
+    'enablesuggestedvideosettings': _Field(None, modes=_switch(
+        'enableSuggestedVideoSettings', False, True, ('false', 'true'))),
+    'cameramicvolume': _Field(None, 'micVolume'),
+    'recordprepaddingtime': _Field('recordingSettings', 'prePaddingSecs'),
+    'recordpostpaddingtime': _Field('recordingSettings', 'postPaddingSecs'),
+    'externalirmode': _Field('ispSettings',
+                             modes=_switch('enableExternalIr')),
+    'showosddatemode': _Field('osdSettings', modes=_switch('enableDate')),
+    'showosdlogomode': _Field('osdSettings', modes=_switch('enableLogo')),
+    'brightness': _Field('ispSettings', 'brightness'),
+    'irbrightness': _Field('ispSettings', 'irOnValBrightness'),
+    'contrast': _Field('ispSettings', 'contrast'),
+    'ircontrast': _Field('ispSettings', 'irOnValContrast'),
+    'denoise': _Field('ispSettings', 'denoise'),
+    'irdenoise': _Field('ispSettings', 'irOnValDenoise'),
+    'hue': _Field('ispSettings', 'hue'),
+    'irhue': _Field('ispSettings', 'irOnValHue'),
+    'saturation': _Field('ispSettings', 'saturation'),
+    'irsaturation': _Field('ispSettings', 'irOnValSaturation'),
+    'sharpness': _Field('ispSettings', 'sharpness'),
+    'irsharpness': _Field('ispSettings', 'irOnValSharpness'),
+    'wdr': _Field('ispSettings', 'wdr'),
+    'lensdistortioncorrectionmode': _Field(
+        'ispSettings', modes=_switch('lensDistortionCorrection')),
+    'aemode': _Field('ispSettings', modes={
+        'normal': {'aemode': 'auto'},
+        'antiflicker50hz': {'aemode': 'flick50'},
+        'antiflicker60hz': {'aemode': 'flick60'},
+    }),
+    'aggressiveantiflicker': _Field('ispSettings', modes=_switch(
+        'aggressiveAntiFlicker', names=('disabled', 'enabled'))),
+    'irsensitivity': _Field('ispSettings', modes={
+        'low': {'icrSensitivity': 0},
+        'medium': {'icrSensitivity': 1},
+        'high': {'icrSensitivity': 2},
+    }),
+    'irledmode': _Field('ispSettings', modes={
+        'off': _ordered(('irLedLevel', 0), ('irLedMode', 'manual')),
+        'on': _ordered(('irLedLevel', 215), ('irLedMode', 'manual')),
+        'auto': _ordered(('irLedLevel', 215), ('irLedMode', 'auto')),
+    }),
+    'recordmode': _Field('recordingSettings', modes={
+        'none': _ordered(('fullTimeRecordEnabled', False),
+                         ('motionRecordEnabled', False)),
+        'full': _ordered(('fullTimeRecordEnabled', True),
+                         ('motionRecordEnabled', False)),
+        'motion': _ordered(('fullTimeRecordEnabled', False),
+                           ('motionRecordEnabled', True)),
+    }),
+    'recordchannel': _Field('recordingSettings', modes={
+        'high': {'channel': 0},
+        'medium': {'channel': 1},
+        'low': {'channel': 2},
+    }),
+}
+
+
+class CameraEditor(object):
+    """Collects changes to one camera and applies them in a single PUT.
+
+    Any name in CAMERA_FIELDS can be assigned, with the same values the
+    matching set_* method of UVCRemote accepts::
+
+        with client.edit(camera_id) as cam:
+            cam.brightness = 60
+            cam.irledmode = 'auto'
+
+    Invalid values raise Invalid as soon as they are assigned, and
+    nothing is sent if the block raises.
+    """
+
+    def __init__(self, client, uuid):
+        self.__dict__.update(_client=client,
+                             _url='/api/2.0/camera/%s' % uuid,
+                             document=None,
+                             changed=[],
+                             result=None)
+
+    def __enter__(self):
+        self.fetch()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None and self.changed:
+            self.commit()
+
+    def __setattr__(self, name, value):
+        if name not in CAMERA_FIELDS:
+            raise AttributeError('Unknown camera setting %s' % name)
+        self.set(name, value)
+
+    def fetch(self):
+        """Fetch the camera document that changes are made against."""
+        data = self._client._uvc_request(self._url)
+        self.__dict__['document'] = data['data'][0]
+        self.__dict__['changed'] = []
+
+    def set(self, name, value):
+        try:
+            field = CAMERA_FIELDS[name]
+        except KeyError:
+            raise Invalid('Unknown setting %s' % name)
+        if self.document is None:
+            self.fetch()
+        field.apply(self.document, value)
+        if name not in self.changed:
+            self.changed.append(name)
+
+    def update(self, **settings):
+        for name, value in settings.items():
+            self.set(name, value)
+
+    def commit(self):
+        """Send all collected changes to the NVR in one PUT.
+
+        :returns: The updated camera document
+        """
+        data = self._client._put_camera(self._url, self.document)
+        self.__dict__['result'] = data['data'][0]
+        self.__dict__['changed'] = []
+        return self.result
+
+
 class UVCRemote(object):
-    """Remote control client for Ubiquiti Unifi Video NVR."""
+    """Remote control client for Ubiquiti Unifi Video NVR.
+
+    With track_changes, index() and get_camera() remember the last
+    response for each path. They send its ETag/Last-Modified back if
+    the NVR provided them, and otherwise hash the response body, so an
+    unchanged document is not parsed again.
+
+    Timeouts, retries and circuit breaking follow policy (see
+    resilience.Policy), which can be shared with camera clients.
+
+    With partial_updates, setters send only the parts of the camera
+    document they changed instead of the whole document. If the NVR
+    turns out not to accept that, the whole document is sent instead
+    from then on.
+    """
     CHANNEL_NAMES = ['high', 'medium', 'low']
+    MAX_WORKERS = 32
 
-    def __init__(self, host, port, apikey, path='/', ssl=False):
+    def __init__(self, host, port, apikey, path='/', ssl=False,
+                 max_idle_connections=4, cache_ttl=None, cache_size=128,
+                 bootstrap_cache=None, track_changes=False, policy=None,
+                 partial_updates=False):
         self._host = host
         self._port = port
         self._path = path
@@ -61,21 +450,58 @@ class UVCRemote(object):
         if path != '/':
             raise Invalid('Path not supported yet')
         self._apikey = apikey
+        self._policy = policy or resilience.DEFAULT_POLICY
         self._log = logging.getLogger('UVC(%s:%s)' % (host, port))
-        self._bootstrap = self._get_bootstrap()
-        version = '.'.join(str(x) for x in self.server_version)
-        self._log.debug('Server version is %s' % version)
+        self._pool = ConnectionPool(self._get_http_connection,
+                                    max_idle=max_idle_connections)
+        if cache_ttl:
+            self._camera_cache = cache.CameraCache(cache_ttl, cache_size)
+        else:
+            self._camera_cache = None
+        self._bootstrap_cache = bootstrap_cache
+        self._bootstrap_data = None
+        self._server_version = None
+        self._pre_hooks = []
+        self._post_hooks = []
+        self._resolver = None
+        self._track_changes = track_changes
+        self._tracked = {}
+        if partial_updates:
+            self._originals = cache.BodyCache(cache_size)
+        else:
+            self._originals = None
+
+    @property
+    def _bootstrap(self):
+        """The NVR bootstrap document, fetched on first use.
+
+        If a bootstrap_cache (see store.CacheStore) was given, a copy
+        saved there recently is used instead of asking the NVR.
+        """
+        if self._bootstrap_data is None:
+            key = 'bootstrap:%s:%s' % (self._host, self._port)
+            if self._bootstrap_cache is not None:
+                self._bootstrap_data = self._bootstrap_cache.get(key)
+            if self._bootstrap_data is None:
+                self._bootstrap_data = self._get_bootstrap()
+                if self._bootstrap_cache is not None:
+                    self._bootstrap_cache.put(key, self._bootstrap_data)
+        return self._bootstrap_data
 
     @property
     def server_version(self):
-        version = self._bootstrap['systemInfo']['version'].split('.')
-        major = int(version[0])
-        minor = int(version[1])
-        try:
-            rev = int(version[2])
-        except ValueError:
-            rev = 0
-        return (major, minor, rev)
+        if self._server_version is None:
+            version = self._bootstrap['systemInfo']['version'].split('.')
+            major = int(version[0])
+            minor = int(version[1])
+            try:
+                rev = int(version[2])
+            except ValueError:
+                rev = 0
+            self._server_version = (major, minor, rev)
+            self._log.debug('Server version is %s',
+                            '.'.join(str(x) for x in self._server_version))
+        return self._server_version
 
     @property
     def camera_identifier(self):
@@ -85,60 +511,314 @@ class UVCRemote(object):
             return 'uuid'
 
     def _get_http_connection(self):
+        kwargs = self._policy.connection_args()
         if self._ssl:
-            return httplib.HTTPSConnection(self._host, self._port)
+            return httplib.HTTPSConnection(self._host, self._port, **kwargs)
         else:
-            return httplib.HTTPConnection(self._host, self._port)
+            return httplib.HTTPConnection(self._host, self._port, **kwargs)
+
+    @property
+    def policy(self):
+        """The resilience.Policy requests are made with."""
+        return self._policy
+
+    @property
+    def _breaker_key(self):
+        return '%s:%s' % (self._host, self._port)
 
-    def _safe_request(self, *args, **kwargs):
+    @property
+    def pool_stats(self):
+        """Hit/miss counters for the keep-alive connection pool."""
+        return self._pool.stats()
+
+    def close(self):
+        """Close any idle keep-alive connections to the NVR."""
+        self._pool.close()
+
+    @property
+    def cache_stats(self):
+        """Hit/miss/eviction counters for the camera document cache."""
+        if self._camera_cache is None:
+            return None
+        return self._camera_cache.stats()
+
+    def invalidate_cache(self, uuid=None):
+        """Forget the cached document for a camera, or for all of them."""
+        if self._camera_cache is not None:
+            self._camera_cache.invalidate(uuid)
+
+    def _send_unpooled(self, method, *args, **kwargs):
+        conn = self._get_http_connection()
+        self._policy.connect(conn)
+        conn.request(method, *args, **kwargs)
+        return conn.getresponse()
+
+    def _safe_request(self, method, *args, **kwargs):
         try:
-            conn = self._get_http_connection()
-            conn.request(*args, **kwargs)
-            return conn.getresponse()
+            return self._policy.call(
+                self._breaker_key, method,
+                lambda: self._send_unpooled(method, *args, **kwargs))
+        except resilience.CircuitOpen as ex:
+            raise CameraConnectionError(str(ex))
         except OSError:
             raise CameraConnectionError('Unable to contact camera')
         except httplib.HTTPException as ex:
             raise CameraConnectionError('Error connecting to camera: %s' % (
                 str(ex)))
 
-    def _uvc_request(self, *args, **kwargs):
+    def _uvc_request(self, path, method='GET', data=None,
+                     mimetype='application/json', track=False,
+                     bytes_saved=0):
+        cache_key = None
+        if self._camera_cache is not None:
+            match = CAMERA_PATH.match(path)
+            if match:
+                cache_key = match.group(1)
+        if cache_key and method == 'GET':
+            cached = self._camera_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        if track or bytes_saved:
+            def request():
+                return self._uvc_request_safe(path, method, data, mimetype,
+                                              track=track,
+                                              bytes_saved=bytes_saved)
+        else:
+            def request():
+                return self._uvc_request_safe(path, method, data, mimetype)
         try:
-            return self._uvc_request_safe(*args, **kwargs)
-        except OSError:
-            raise NvrError('Failed to contact NVR')
-        except httplib.HTTPException as ex:
-            raise NvrError('Error connecting to camera: %s' % str(ex))
-
-    def _uvc_request_safe(self, path, method='GET', data=None,
-                          mimetype='application/json'):
-        conn = self._get_http_connection()
+            try:
+                result = self._policy.call(self._breaker_key, method,
+                                           request)
+            except resilience.CircuitOpen as ex:
+                raise NvrError(str(ex))
+            except OSError:
+                raise NvrError('Failed to contact NVR')
+            except httplib.HTTPException as ex:
+                raise NvrError('Error connecting to camera: %s' % str(ex))
+        except Exception:
+            if cache_key:
+                self._camera_cache.invalidate(cache_key)
+            raise
+        if cache_key:
+            if method in ('GET', 'PUT'):
+                self._camera_cache.put(cache_key, result)
+            else:
+                self._camera_cache.invalidate(cache_key)
+        return result
+
+    def _request_url(self, path):
         if '?' in path:
-            url = '%s&apiKey=%s' % (path, self._apikey)
+            return '%s&apiKey=%s' % (path, self._apikey)
         else:
-            url = '%s?apiKey=%s' % (path, self._apikey)
+            return '%s?apiKey=%s' % (path, self._apikey)
 
-        headers = {
+    @staticmethod
+    def _request_headers(mimetype='application/json'):
+        return {
             'Content-Type': mimetype,
             'Accept': 'application/json, text/javascript, */*; q=0.01',
             'Accept-Encoding': 'gzip, deflate, sdch',
         }
-        self._log.debug('%s %s headers=%s data=%s' % (
-            method, url, headers, repr(data)))
-        conn.request(method, url, data, headers)
-        resp = conn.getresponse()
-        headers = dict(resp.getheaders())
-        self._log.debug('%s %s Result: %s %s' % (method, url, resp.status,
-                                                 resp.reason))
+
+    def _send(self, method, url, data, headers):
+        """Send a request on a pooled connection.
+
+        :returns: A tuple of the connection and its response, which the
+                  caller must read and then pass to _release()
+        """
+        conn, reused = self._pool.get()
+        try:
+            try:
+                self._policy.connect(conn)
+                conn.request(method, url, data, headers)
+                return conn, conn.getresponse()
+            except (socket.error, httplib.HTTPException) as ex:
+                if not reused or not _closed_by_server(ex):
+                    raise
+                # The server closed our idle keep-alive connection
+                self._log.debug('Reconnecting stale connection')
+                conn = self._pool.reconnect(conn)
+                self._policy.connect(conn)
+                conn.request(method, url, data, headers)
+                return conn, conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+
+    def _release(self, conn, resp):
+        """Return a connection whose response has been fully read."""
+        if resp.will_close:
+            conn.close()
+        else:
+            self._pool.put(conn)
+
+    def _check_status(self, method, url, resp, allow_not_modified=False):
+        self._log.debug('%s %s Result: %s %s',
+                        method, url, resp.status, resp.reason)
         if resp.status in (401, 403):
             raise NotAuthorized('NVR reported authorization failure')
-        if resp.status / 100 != 2:
+        if resp.status >= 500:
+            raise NvrServerError('Request failed: %s' % resp.status)
+        if resp.status >= 400:
+            raise NvrRequestError('Request failed: %s' % resp.status)
+        if resp.status / 100 != 2 and not (
+                resp.status == 304 and allow_not_modified):
             raise NvrError('Request failed: %s' % resp.status)
 
-        data = resp.read()
-        if (headers.get('content-encoding') == 'gzip' or
-                headers.get('Content-Encoding') == 'gzip'):
-            data = zlib.decompress(data, 32 + zlib.MAX_WBITS)
-        return json.loads(data.decode())
+    def _uvc_request_safe(self, path, method='GET', data=None,
+                          mimetype='application/json', track=False,
+                          bytes_saved=0):
+        url = self._request_url(path)
+        headers = self._request_headers(mimetype)
+        tracked = self._tracked.get(path) if track else None
+        if tracked is not None:
+            if tracked.etag:
+                headers['If-None-Match'] = tracked.etag
+            if tracked.last_modified:
+                headers['If-Modified-Since'] = tracked.last_modified
+        self._log.debug('%s %s headers=%s data=%r',
+                        method, url, headers, data)
+        info = metrics.RequestInfo(method, path, len(data) if data else 0)
+        info.bytes_saved = bytes_saved
+        self._run_hooks(self._pre_hooks, info)
+        try:
+            conn, resp = self._send(method, url, data, headers)
+            try:
+                info.status = resp.status
+                headers = dict(resp.getheaders())
+                self._check_status(method, url, resp, tracked is not None)
+                data = resp.read()
+            except Exception:
+                conn.close()
+                raise
+            self._release(conn, resp)
+            info.bytes_in = len(data)
+            if resp.status == 304 and tracked is not None:
+                return tracked.result
+
+            if (headers.get('content-encoding') == 'gzip' or
+                    headers.get('Content-Encoding') == 'gzip'):
+                start = time.time()
+                data = zlib.decompress(data, 32 + zlib.MAX_WBITS)
+                info.decompress_time = time.time() - start
+            if self._originals is not None and CAMERA_PATH.match(path):
+                # What the NVR has now, for _put_camera() to diff against
+                self._originals.put(path, data)
+            if track:
+                digest = hashlib.sha1(data).digest()
+                if tracked is not None and tracked.digest == digest:
+                    return tracked.result
+            start = time.time()
+            result = json.loads(data.decode())
+            info.parse_time = time.time() - start
+            if track:
+                self._tracked[path] = _Tracked(
+                    headers.get('etag') or headers.get('ETag'),
+                    (headers.get('last-modified') or
+                     headers.get('Last-Modified')),
+                    digest, result)
+            return result
+        except Exception as ex:
+            info.error = ex
+            raise
+        finally:
+            info.latency = time.time() - info.started
+            self._run_hooks(self._post_hooks, info)
+
+    def _open_stream(self, url, info):
+        conn, resp = self._send('GET', url, None, self._request_headers())
+        info.status = resp.status
+        try:
+            self._check_status('GET', url, resp)
+        except Exception:
+            conn.close()
+            raise
+        return conn, resp
+
+    def _uvc_iter(self, path, key='data', raw=False):
+        """GET path and yield the elements of its data array one by one.
+
+        The body is decompressed and parsed as it arrives, so only one
+        element at a time is held in memory rather than the whole
+        response. The connection goes back to the pool only if the
+        response is read to the end; stopping early closes it.
+
+        With raw, each element is yielded with its JSON text, as
+        streams.iter_json_items() does.
+        """
+        url = self._request_url(path)
+        self._log.debug('GET %s (streamed)', url)
+        info = metrics.RequestInfo('GET', path)
+        self._run_hooks(self._pre_hooks, info)
+        conn = body = None
+        finished = False
+        try:
+            try:
+                conn, resp = self._policy.call(
+                    self._breaker_key, 'GET',
+                    lambda: self._open_stream(url, info))
+                encoding = (resp.getheader('content-encoding') or '').lower()
+                body = streams.CountingReader(resp)
+                chunks = streams.TimedIterator(
+                    streams.iter_chunks(body, encoding == 'gzip'))
+                items = streams.TimedIterator(
+                    streams.iter_json_items(chunks, key, raw))
+                for item in items:
+                    # Time spent in our caller's loop is not counted
+                    info.decompress_time = chunks.elapsed - body.elapsed
+                    info.parse_time = items.elapsed - chunks.elapsed
+                    yield item
+                info.decompress_time = chunks.elapsed - body.elapsed
+                info.parse_time = items.elapsed - chunks.elapsed
+                # Read anything after the array so the connection is clean
+                while body.read(streams.DEFAULT_CHUNK_SIZE):
+                    pass
+                finished = True
+            except resilience.CircuitOpen as ex:
+                raise NvrError(str(ex))
+            except OSError:
+                raise NvrError('Failed to contact NVR')
+            except httplib.HTTPException as ex:
+                raise NvrError('Error connecting to camera: %s' % str(ex))
+            finally:
+                if body is not None:
+                    info.bytes_in = body.count
+                if conn is not None:
+                    if finished:
+                        self._release(conn, resp)
+                    else:
+                        conn.close()
+        except Exception as ex:
+            info.error = ex
+            raise
+        finally:
+            info.latency = time.time() - info.started
+            self._run_hooks(self._post_hooks, info)
+
+    def add_request_hook(self, post=None, pre=None):
+        """Register callables to run around every NVR request.
+
+        Both are called with a metrics.RequestInfo: pre before the
+        request is sent, post after the response has been parsed or the
+        request has failed. Exceptions from hooks are logged and ignored.
+        """
+        if pre is not None:
+            self._pre_hooks.append(pre)
+        if post is not None:
+            self._post_hooks.append(post)
+
+    def remove_request_hook(self, hook):
+        for hooks in (self._pre_hooks, self._post_hooks):
+            if hook in hooks:
+                hooks.remove(hook)
+
+    def _run_hooks(self, hooks, info):
+        for hook in hooks:
+            try:
+                hook(info)
+            except Exception:
+                self._log.exception('Request hook %r failed', hook)
 
     def _get_bootstrap(self):
         return self._uvc_request('/api/2.0/bootstrap')['data'][0]
@@ -156,15 +836,9 @@ class UVCRemote(object):
     def set_enablestatusled(self, uuid, mode):
         url = '/api/2.0/camera/%s' % uuid
         data = self._uvc_request(url)
-        mode = mode.lower()
-        if mode == 'true':
-            data['data'][0]['enableStatusLed'] = True
-        elif mode == 'false':
-            data['data'][0]['enableStatusLed'] = False
-        else:
-            raise Invalid('Unknown mode')
+        CAMERA_FIELDS['enablestatusled'].apply(data['data'][0], mode)
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['enableStatusLed']
         return data == updated
 
@@ -176,15 +850,10 @@ class UVCRemote(object):
     def set_enablesuggestedvideosettings(self, uuid, mode):
         url = '/api/2.0/camera/%s' % uuid
         data = self._uvc_request(url)
-        mode = mode.lower()
-        if mode == 'true':
-            data['data'][0]['enableSuggestedVideoSettings'] = True
-        elif mode == 'false':
-            data['data'][0]['enableSuggestedVideoSettings'] = False
-        else:
-            raise Invalid('Unknown mode')
+        CAMERA_FIELDS['enablesuggestedvideosettings'].apply(data['data'][0],
+                                                            mode)
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['enableSuggestedVideoSettings']
         return data == updated
 
@@ -223,7 +892,7 @@ class UVCRemote(object):
         data = self._uvc_request(url)
         data['data'][0]['micVolume'] = volume
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['micVolume']
         return data == updated
 
@@ -255,7 +924,7 @@ class UVCRemote(object):
         settings = data['data'][0]['recordingSettings']
         settings['prePaddingSecs'] = seconds
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['recordingSettings']
         return data == updated
 
@@ -272,7 +941,7 @@ class UVCRemote(object):
         settings = data['data'][0]['recordingSettings']
         settings['postPaddingSecs'] = seconds
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['recordingSettings']
         return data == updated
 
@@ -303,15 +972,9 @@ class UVCRemote(object):
         url = '/api/2.0/camera/%s' % uuid
         data = self._uvc_request(url)
         settings = data['data'][0]['ispSettings']
-        mode = mode.lower()
-        if mode == 'off':
-            settings['enableExternalIr'] = 0
-        elif mode == 'on':
-            settings['enableExternalIr'] = 1
-        else:
-            raise Invalid('Unknown mode')
+        CAMERA_FIELDS['externalirmode'].apply(data['data'][0], mode)
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['ispSettings']
         return settings == updated
 
@@ -336,15 +999,9 @@ class UVCRemote(object):
         url = '/api/2.0/camera/%s' % uuid
         data = self._uvc_request(url)
         settings = data['data'][0]['osdSettings']
-        mode = mode.lower()
-        if mode == 'off':
-            settings['enableDate'] = 0
-        elif mode == 'on':
-            settings['enableDate'] = 1
-        else:
-            raise Invalid('Unknown mode')
+        CAMERA_FIELDS['showosddatemode'].apply(data['data'][0], mode)
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['osdSettings']
         return settings == updated
 
@@ -369,15 +1026,9 @@ class UVCRemote(object):
         url = '/api/2.0/camera/%s' % uuid
         data = self._uvc_request(url)
         settings = data['data'][0]['osdSettings']
-        mode = mode.lower()
-        if mode == 'off':
-            settings['enableLogo'] = 0
-        elif mode == 'on':
-            settings['enableLogo'] = 1
-        else:
-            raise Invalid('Unknown mode')
+        CAMERA_FIELDS['showosdlogomode'].apply(data['data'][0], mode)
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['osdSettings']
         return settings == updated
 
@@ -400,7 +1051,7 @@ class UVCRemote(object):
         settings = data['data'][0]['ispSettings']
         settings['brightness'] = level
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['ispSettings']
 
     def get_irbrightness(self, uuid):
@@ -422,7 +1073,7 @@ class UVCRemote(object):
         settings = data['data'][0]['ispSettings']
         settings['irOnValBrightness'] = level
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['irOnValBrightness']
 
     def get_contrast(self, uuid):
@@ -444,7 +1095,7 @@ class UVCRemote(object):
         settings = data['data'][0]['ispSettings']
         settings['contrast'] = level
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['contrast']
 
     def get_ircontrast(self, uuid):
@@ -466,7 +1117,7 @@ class UVCRemote(object):
         settings = data['data'][0]['ispSettings']
         settings['irOnValContrast'] = level
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['irOnValContrast']
 
     def get_denoise(self, uuid):
@@ -488,7 +1139,7 @@ class UVCRemote(object):
         settings = data['data'][0]['ispSettings']
         settings['denoise'] = level
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['denoise']
 
     def get_irdenoise(self, uuid):
@@ -510,7 +1161,7 @@ class UVCRemote(object):
         settings = data['data'][0]['ispSettings']
         settings['irOnValDenoise'] = level
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['irOnValDenoise']
 
     def get_hue(self, uuid):
@@ -532,7 +1183,7 @@ class UVCRemote(object):
         settings = data['data'][0]['ispSettings']
         settings['hue'] = level
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['hue']
 
     def get_irhue(self, uuid):
@@ -554,7 +1205,7 @@ class UVCRemote(object):
         settings = data['data'][0]['ispSettings']
         settings['irOnValHue'] = level
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['irOnValHue']
 
     def get_saturation(self, uuid):
@@ -576,7 +1227,7 @@ class UVCRemote(object):
         settings = data['data'][0]['ispSettings']
         settings['saturation'] = level
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['saturation']
 
     def get_irsaturation(self, uuid):
@@ -598,7 +1249,7 @@ class UVCRemote(object):
         settings = data['data'][0]['ispSettings']
         settings['irOnValSaturation'] = level
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['irOnValSaturation']
 
     def get_sharpness(self, uuid):
@@ -620,7 +1271,7 @@ class UVCRemote(object):
         settings = data['data'][0]['ispSettings']
         settings['sharpness'] = level
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['sharpness']
 
     def get_irsharpness(self, uuid):
@@ -642,7 +1293,7 @@ class UVCRemote(object):
         settings = data['data'][0]['ispSettings']
         settings['irOnValSharpness'] = level
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['irOnValSharpness']
 
     def get_wdr(self, uuid):
@@ -664,7 +1315,7 @@ class UVCRemote(object):
         settings = data['data'][0]['ispSettings']
         settings['wdr'] = level
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['wdr']
 
     def get_lensdistortioncorrectionmode(self, uuid):
@@ -688,15 +1339,10 @@ class UVCRemote(object):
         url = '/api/2.0/camera/%s' % uuid
         data = self._uvc_request(url)
         settings = data['data'][0]['ispSettings']
-        mode = mode.lower()
-        if mode == 'off':
-            settings['lensDistortionCorrection'] = 0
-        elif mode == 'on':
-            settings['lensDistortionCorrection'] = 1
-        else:
-            raise Invalid('Unknown mode')
+        CAMERA_FIELDS['lensdistortioncorrectionmode'].apply(data['data'][0],
+                                                            mode)
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['ispSettings']
         return settings == updated
 
@@ -723,17 +1369,9 @@ class UVCRemote(object):
         url = '/api/2.0/camera/%s' % uuid
         data = self._uvc_request(url)
         settings = data['data'][0]['ispSettings']
-        mode = mode.lower()
-        if mode == 'normal':
-            settings['aemode'] = "auto"
-        elif mode == 'antiflicker50hz':
-            settings['aemode'] = "flick50"
-        elif mode == 'antiflicker60hz':
-            settings['aemode'] = "flick60"
-        else:
-            raise Invalid('Unknown mode')
+        CAMERA_FIELDS['aemode'].apply(data['data'][0], mode)
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['ispSettings']
         return settings == updated
 
@@ -760,15 +1398,9 @@ class UVCRemote(object):
         url = '/api/2.0/camera/%s' % uuid
         data = self._uvc_request(url)
         settings = data['data'][0]['ispSettings']
-        mode = mode.lower()
-        if mode == 'disabled':
-            settings['aggressiveAntiFlicker'] = 0
-        elif mode == 'enabled':
-            settings['aggressiveAntiFlicker'] = 1
-        else:
-            raise Invalid('Unknown mode')
+        CAMERA_FIELDS['aggressiveantiflicker'].apply(data['data'][0], mode)
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['ispSettings']
         return settings == updated
 
@@ -814,17 +1446,9 @@ class UVCRemote(object):
         url = '/api/2.0/camera/%s' % uuid
         data = self._uvc_request(url)
         settings = data['data'][0]['ispSettings']
-        level = level.lower()
-        if level == 'low':
-            settings['icrSensitivity'] = 0
-        elif level == 'medium':
-            settings['icrSensitivity'] = 1
-        elif level == 'high':
-            settings['icrSensitivity'] = 2
-        else:
-            raise Invalid('Unknown mode')
+        CAMERA_FIELDS['irsensitivity'].apply(data['data'][0], level)
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['ispSettings']
         return settings == updated
 
@@ -853,20 +1477,9 @@ class UVCRemote(object):
         url = '/api/2.0/camera/%s' % uuid
         data = self._uvc_request(url)
         settings = data['data'][0]['ispSettings']
-        mode = mode.lower()
-        if mode == 'off':
-            settings['irLedLevel'] = 0
-            settings['irLedMode'] = "manual"
-        elif mode == 'on':
-            settings['irLedLevel'] = 215
-            settings['irLedMode'] = "manual"
-        elif mode == 'auto':
-            settings['irLedLevel'] = 215
-            settings['irLedMode'] = "auto"
-        else:
-            raise Invalid('Unknown mode')
+        CAMERA_FIELDS['irledmode'].apply(data['data'][0], mode)
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['ispSettings']
         return settings == updated
 
@@ -885,14 +1498,14 @@ class UVCRemote(object):
             except ValueError:
                 raise Invalid('Setting `%s\' requires %s not %s' % (
                     key, dtype.__name__, type(settings[key]).__name__))
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         return data['data'][0]['ispSettings']
 
     def prune_zones(self, uuid):
         url = '/api/2.0/camera/%s' % uuid
         data = self._uvc_request(url)
         data['data'][0]['zones'] = [data['data'][0]['zones'][0]]
-        self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        self._put_camera(url, data['data'][0])
 
     def list_zones(self, uuid):
         url = '/api/2.0/camera/%s' % uuid
@@ -902,27 +1515,191 @@ class UVCRemote(object):
     def index(self):
         """Return an index of available cameras.
 
+        Camera documents are parsed one at a time as they arrive, so
+        only the index entries are held in memory, not the whole list.
+        With track_changes the list is fetched in one piece instead, so
+        that an unchanged list can be recognised.
+
         :returns: A list of dictionaries with keys of name, uuid
         """
+        if self._track_changes:
+            cams = self._uvc_request('/api/2.0/camera', track=True)['data']
+        else:
+            cams = self._uvc_iter('/api/2.0/camera')
+        return [_index_entry(x) for x in cams if not x['deleted']]
+
+    def fleet_snapshot(self):
+        """Fetch the full document for every camera in one request.
+
+        :returns: A FleetSnapshot that answers this client's getters
+                  from memory
+        """
         cams = self._uvc_request('/api/2.0/camera')['data']
-        return [{'name': x['name'],
-                 'uuid': x['uuid'],
-                 'state': x['state'],
-                 'managed': x['managed'],
-                 'id': x['_id'],
-             } for x in cams if not x['deleted']]
+        return FleetSnapshot(self, cams)
+
+    def camera_models(self):
+        """Return a model.Camera for every camera that is not deleted.
+
+        Each camera keeps its document as JSON text until more than its
+        ids, name, addresses and state are asked for, which takes much
+        less memory than fleet_snapshot() for a large fleet.
+        """
+        cams = (model.Camera.from_json(text, doc) for doc, text in
+                self._uvc_iter('/api/2.0/camera', raw=True))
+        return [cam for cam in cams if not cam.deleted]
+
+    def get_camera_model(self, uuid):
+        """Return a model.Camera for one camera."""
+        doc = self.get_camera(uuid)
+        if self._track_changes:
+            # The tracked document is shared, so edits must not touch it
+            doc = copy.deepcopy(doc)
+        return model.Camera.from_document(doc)
+
+    def put_camera(self, camera):
+        """Send a model.Camera back to the NVR, with any changes made.
+
+        :returns: A model.Camera of the updated document
+        """
+        url = '/api/2.0/camera/%s' % camera.identifier(self.camera_identifier)
+        if self._originals is not None and camera.decoded:
+            data = self._put_camera(url, camera.to_payload())
+        else:
+            data = self._uvc_request(url, 'PUT', camera.to_json())
+        return model.Camera.from_document(data['data'][0])
+
+    def _put_camera(self, url, document, original=None):
+        """PUT a changed camera document, or just the changes.
+
+        :param original: The document as fetched, or None to use the
+                         last response for url
+        :returns: The parsed response
+        """
+        full = json.dumps(document)
+        if self._originals is None:
+            return self._uvc_request(url, 'PUT', full)
+        if original is None:
+            body = self._originals.get(url)
+            original = body and json.loads(body.decode())['data'][0]
+        patch = original and camera_patch(original, document)
+        if patch is None:
+            return self._uvc_request(url, 'PUT', full)
+
+        payload = json.dumps(patch)
+        saved = len(full) - len(payload)
+        self._log.debug('PUT %s: %i of %i bytes (%i saved)', url,
+                        len(payload), len(full), saved)
+        try:
+            data = self._uvc_request(url, 'PUT', payload, bytes_saved=saved)
+        except NvrRequestError as ex:
+            self._log.info('NVR refused a partial update (%s), sending '
+                           'whole documents from now on', ex)
+            self._originals = None
+            return self._uvc_request(url, 'PUT', full)
+        if any(key not in data['data'][0] for key in original):
+            # The NVR replaced the document with the patch instead of
+            # merging it, so put the rest back
+            self._log.warning('NVR does not merge partial updates, '
+                              'sending whole documents from now on')
+            self._originals = None
+            return self._uvc_request(url, 'PUT', full)
+        return data
 
     def get_camera(self, uuid):
-        return self._uvc_request('/api/2.0/camera/%s' % uuid)['data'][0]
+        """Return the document for a camera.
 
-    def get_snapshot(self, uuid):
+        With track_changes, an unchanged camera is returned as the same
+        object as last time, so copy it before modifying it.
+        """
+        return self._uvc_request('/api/2.0/camera/%s' % uuid,
+                                 track=self._track_changes)['data'][0]
+
+    def changed_since(self, token=None):
+        """Find the cameras added, removed or changed since an earlier poll.
+
+        The camera list is fetched with change tracking, so an unchanged
+        fleet costs a conditional request or a hash of the response
+        rather than a parse and a comparison.
+
+        :param token: A ChangeToken from an earlier call, or None
+        :returns: A tuple of (list of changed camera _ids, ChangeToken).
+                  With no token every camera counts as changed.
+        """
+        cams = self._uvc_request('/api/2.0/camera', track=True)['data']
+        if token is not None and token.cameras is cams:
+            return [], token
+        new = ChangeToken(cams)
+        if token is None:
+            return sorted(new.by_id), new
+        changed = [ident for ident, cam in new.by_id.items()
+                   if token.by_id.get(ident) != cam]
+        changed.extend(ident for ident in token.by_id
+                       if ident not in new.by_id)
+        return sorted(changed), new
+
+    def map_cameras(self, fn, ids=None, max_workers=4, rate=None):
+        """Run an operation against many cameras concurrently.
+
+        :param fn: A callable taking a camera identifier, such as
+                   ``lambda ident: client.set_irledmode(ident, 'auto')``
+        :param ids: Camera identifiers, defaulting to every camera in
+                    index()
+        :param max_workers: Number of cameras handled at once (at most
+                            MAX_WORKERS)
+        :param rate: If set, the most operations to start per second
+                     across all workers
+        :returns: An OrderedDict of identifier to CameraResult, in the
+                  order of ids
+        """
+        if ids is None:
+            ids = [x[self.camera_identifier] for x in self.index()]
+        max_workers = max(1, min(max_workers, self.MAX_WORKERS))
+        limiter = rate and RateLimiter(rate)
+
+        def run(ident):
+            if limiter:
+                limiter.wait()
+            try:
+                return CameraResult(ident, value=fn(ident))
+            except Exception as ex:
+                self._log.debug('%s failed on %s: %s', fn, ident, ex)
+                return CameraResult(ident, error=ex)
+
+        with futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(run, ids))
+        return collections.OrderedDict((r.camera, r) for r in results)
+
+    def edit(self, uuid):
+        """Change several settings of a camera with one GET and one PUT.
+
+        :param uuid: Camera UUID
+        :returns: A CameraEditor to use as a context manager
+        """
+        return CameraEditor(self, uuid)
+
+    def _snapshot_response(self, uuid):
         url = '/api/2.0/snapshot/camera/%s?force=true&apiKey=%s' % (
             uuid, self._apikey)
-        print(url)
         resp = self._safe_request('GET', url)
         if resp.status != 200:
             raise NvrError('Snapshot returned %i' % resp.status)
-        return resp.read()
+        return resp
+
+    def get_snapshot(self, uuid):
+        return self._snapshot_response(uuid).read()
+
+    def stream_snapshot(self, uuid, sink,
+                        chunk_size=streams.DEFAULT_CHUNK_SIZE):
+        """Copy a snapshot from a camera into sink without buffering it.
+
+        :param uuid: Camera UUID
+        :param sink: A file, socket or writable buffer (see
+                     streams.copy_stream)
+        :param chunk_size: Size of the reusable copy buffer
+        :returns: The size of the image in bytes
+        """
+        return streams.copy_stream(self._snapshot_response(uuid), sink,
+                                   chunk_size)
 
     def get_recordmode(self, uuid):
         url = '/api/2.0/camera/%s' % uuid
@@ -943,29 +1720,16 @@ class UVCRemote(object):
         :param chan: One of the values from CHANNEL_NAMES
         :returns: True if successful, False or None otherwise
         """
-        self.dump(uuid)
         url = '/api/2.0/camera/%s' % uuid
         data = self._uvc_request(url)
 
         settings = data['data'][0]['recordingSettings']
-        mode = mode.lower()
-        if mode == 'none':
-            settings['fullTimeRecordEnabled'] = False
-            settings['motionRecordEnabled'] = False
-        elif mode == 'full':
-            settings['fullTimeRecordEnabled'] = True
-            settings['motionRecordEnabled'] = False
-        elif mode == 'motion':
-            settings['fullTimeRecordEnabled'] = False
-            settings['motionRecordEnabled'] = True
-        else:
-            raise Invalid('Unknown mode')
+        CAMERA_FIELDS['recordmode'].apply(data['data'][0], mode)
 
         if chan:
-            settings['channel'] = self.CHANNEL_NAMES.index(chan)
-            changed = data['data'][0]['recordingSettings']
+            CAMERA_FIELDS['recordchannel'].apply(data['data'][0], chan)
 
-        data = self._uvc_request(url, 'PUT', json.dumps(data['data'][0]))
+        data = self._put_camera(url, data['data'][0])
         updated = data['data'][0]['recordingSettings']
         return settings == updated
 
@@ -974,24 +1738,121 @@ class UVCRemote(object):
         data = self._uvc_request(url, 'PUT', json.dumps(alert))
         return data
 
+    def delete_alerts(self, alerts=None, predicate=None, max_workers=8,
+                      retries=3, backoff=0.5, rate=None, verify=True):
+        """Delete many alerts concurrently.
+
+        :param alerts: The alerts to delete, defaulting to the whole
+                       alert table
+        :param predicate: If set, only alerts for which this returns
+                          true are deleted (see alerts.alert_filter)
+        :param max_workers: Number of deletes in flight at once (at most
+                            MAX_WORKERS)
+        :param retries: Number of times to retry a delete that failed
+                        with a server or connection error, or was not
+                        applied; a request the NVR rejects (4xx) is not
+                        retried
+        :param backoff: Longest delay in seconds before the first retry,
+                        doubling for each one after that (see
+                        resilience.Policy.delay)
+        :param rate: If set, the most deletes to start per second
+        :param verify: Whether to list the alerts once afterwards and
+                       count how many of them are still there
+        :returns: An alerts.DeleteResult
+        """
+        if alerts is None:
+            alerts = self.iter_alerts()
+        if predicate is not None:
+            alerts = [alert for alert in alerts if predicate(alert)]
+        else:
+            alerts = list(alerts)
+        max_workers = max(1, min(max_workers, self.MAX_WORKERS))
+        limiter = rate and RateLimiter(rate)
+        retry_policy = resilience.Policy(
+            backoff=backoff, max_backoff=self._policy.max_backoff)
+        result = alerts_module.DeleteResult()
+
+        def delete(alert):
+            alert = dict(alert, alertState='deleted')
+            for attempt in range(retries + 1):
+                if limiter:
+                    limiter.wait()
+                try:
+                    resp = self.delete_alert(alert)
+                    if resp['data'][0]['_id'] != alert['_id']:
+                        raise NvrError('Alert %s was not deleted' %
+                                       alert['_id'])
+                    return alert['_id'], None
+                except (NotAuthorized, NvrRequestError) as ex:
+                    return alert['_id'], ex
+                except (NvrError, KeyError, IndexError) as ex:
+                    if attempt == retries:
+                        return alert['_id'], ex
+                    self._log.debug('Deleting alert %s failed (%s), '
+                                    'retrying', alert['_id'], ex)
+                    time.sleep(retry_policy.delay(attempt))
+
+        with futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for ident, error in pool.map(delete, alerts):
+                if error is None:
+                    result.deleted.append(ident)
+                else:
+                    result.failed[ident] = error
+
+        if verify:
+            targets = set(alert['_id'] for alert in alerts)
+            result.remaining = sum(
+                1 for alert in self.iter_alerts()
+                if alert['_id'] in targets and
+                alert.get('alertState') != 'deleted')
+        return result
+
     def get_all_alerts(self):
+        return self.get_alerts()
+
+    def get_alerts(self, **params):
+        """Return alerts, passing params to the NVR as query arguments.
+
+        Without params this is the whole alert table. See
+        alerts.AlertSync for fetching only new alerts.
+        """
+        return list(self.iter_alerts(**params))
+
+    def iter_alerts(self, **params):
+        """Like get_alerts(), but yield alerts one at a time.
+
+        Alerts are parsed as the response arrives, so going through a
+        large alert table does not need it all in memory at once.
+        """
         url = '/api/2.0/alert'
-        data = self._uvc_request(url)
-        return data['data']
+        if params:
+            url = '%s?%s' % (url, urlencode(sorted(params.items())))
+        return self._uvc_iter(url)
+
+    @property
+    def resolver(self):
+        """A resolver.CameraResolver over this NVR's cameras.
+
+        Its index is saved in the bootstrap_cache, if one was given.
+        """
+        if self._resolver is None:
+            self._resolver = resolver_module.CameraResolver(
+                self, store=self._bootstrap_cache)
+        return self._resolver
 
     def name_to_uuid(self, name):
         """Attempt to convert a camera name to its UUID.
 
+        Names are matched ignoring case if there is no exact match, and
+        MAC addresses, hosts and ids are accepted too. The camera index
+        is cached (see resolver), so repeated lookups do not each
+        download the fleet.
+
         :param name: Camera name
         :returns: The UUID of the first camera with the same name if found,
                   otherwise None. On v3.2.0 and later, returns id.
         """
-        cameras = self.index()
-        if self.server_version >= (3, 2, 0):
-            cams_by_name = {x['name']: x['id'] for x in cameras}
-        else:
-            cams_by_name = {x['name']: x['uuid'] for x in cameras}
-        return cams_by_name.get(name)
+        return self.resolver.resolve(name)
 
     def test_login(self, username, password):
         headers = {'Content-Type': 'application/json'}
@@ -1002,6 +1863,79 @@ class UVCRemote(object):
         return resp
 
 
+class FleetSnapshot(object):
+    """An in-memory copy of every camera document on the NVR.
+
+    Cameras can be looked up by _id, uuid, name or MAC address. Any of
+    the getters of the UVCRemote it was taken from (get_recordmode,
+    get_cameraipaddress, list_zones, ...) can be called on the snapshot
+    and are answered from memory; everything else goes to the NVR.
+    """
+    READ_METHODS = ('dump', 'list_zones', 'name_to_uuid')
+
+    def __init__(self, client, cameras):
+        self._client = client
+        self._cameras = cameras
+        self._resolver = None
+        self._by_key = {}
+        self._by_mac = {}
+        for cam in cameras:
+            for key in ('_id', 'uuid', 'name'):
+                if cam.get(key) is not None:
+                    self._by_key.setdefault(cam[key], cam)
+            if cam.get('mac'):
+                self._by_mac.setdefault(_normalize_mac(cam['mac']), cam)
+
+    def __len__(self):
+        return len(self._cameras)
+
+    def __iter__(self):
+        return iter(self._cameras)
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith('get_') or name in self.READ_METHODS:
+            func = getattr(type(self._client), name)
+            func = getattr(func, '__func__', func)
+            return types.MethodType(func, self)
+        return attr
+
+    def lookup(self, key):
+        """Find a camera document by _id, uuid, name or MAC address.
+
+        :returns: The camera document, or None if not found
+        """
+        try:
+            return self._by_key[key]
+        except KeyError:
+            return self._by_mac.get(_normalize_mac(key))
+
+    def index(self):
+        return [_index_entry(x) for x in self._cameras if not x['deleted']]
+
+    @property
+    def resolver(self):
+        if self._resolver is None:
+            self._resolver = resolver_module.CameraResolver(self, ttl=None)
+        return self._resolver
+
+    def get_camera(self, uuid):
+        camera = self.lookup(uuid)
+        if camera is None:
+            raise NvrError('Request failed: 404')
+        return copy.deepcopy(camera)
+
+    def _uvc_request(self, path, method='GET', data=None,
+                     mimetype='application/json'):
+        if method == 'GET':
+            match = CAMERA_PATH.match(path)
+            if match:
+                return {'data': [self.get_camera(match.group(1))]}
+            elif path == '/api/2.0/camera':
+                return {'data': copy.deepcopy(self._cameras)}
+        return self._client._uvc_request(path, method, data, mimetype)
+
+
 def get_auth_from_env():
     """Attempt to get UVC NVR connection information from the environment.
 
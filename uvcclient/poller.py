@@ -0,0 +1,208 @@
+import collections
+import heapq
+import logging
+import threading
+import time
+
+from concurrent import futures
+
+from uvcclient import router as router_module
+
+LOG = logging.getLogger(__name__)
+
+
+def percentile(values, pct):
+    """Return the nearest-rank percentile of values, or None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = int(round(pct / 100.0 * len(ordered) + 0.5)) - 1
+    return ordered[max(0, min(rank, len(ordered) - 1))]
+
+
+class CameraStats(object):
+    """Frame counts and fetch latencies for one polled camera."""
+
+    def __init__(self, window=1000):
+        self.frames = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_error = None
+        self.started = None
+        self.latencies = collections.deque(maxlen=window)
+
+    def fps(self, now=None):
+        if not self.started:
+            return 0.0
+        elapsed = (now or time.time()) - self.started
+        if elapsed <= 0:
+            return 0.0
+        return self.frames / elapsed
+
+    def summary(self, now=None):
+        latencies = list(self.latencies)
+        return {'frames': self.frames,
+                'skipped': self.skipped,
+                'errors': self.errors,
+                'fps': self.fps(now),
+                'p50': percentile(latencies, 50),
+                'p90': percentile(latencies, 90),
+                'p99': percentile(latencies, 99)}
+
+
+class SnapshotPoller(object):
+    """Fetches snapshots from many cameras, each at its own interval.
+
+    Fetches run on a shared worker pool and go through a
+    router.SnapshotRouter, which picks between the camera itself and the
+    NVR proxy the same way as for single snapshots. Each camera keeps
+    one logged-in camera client, which is reused for every frame and
+    logs in again only when its session is rejected. If the camera
+    cannot be reached directly, the snapshot is taken through the NVR
+    instead and a direct connection is retried after ``retry_direct``
+    seconds, backing off if it keeps failing. A camera still busy with
+    its previous frame when the next one is due skips that tick rather
+    than queueing it.
+
+    :param client: A UVCRemote
+    :param cameras: A list of camera identifiers
+    :param interval: Seconds between frames, or a dict of identifier to
+                     seconds with an entry for every camera
+    :param callback: Called as callback(camera_id, image, timestamp)
+                     from a worker thread for every frame
+    :param max_workers: Size of the shared worker pool
+    :param password_lookup: Called with a camera document to get the
+                            camera's admin password; defaults to 'ubnt'
+    :param direct: Whether to try the camera before the NVR proxy
+    :param session_store: Passed on to the camera clients to save their
+                          sessions (see store.InfoStore)
+    :param policy: The resilience.Policy of the camera clients; defaults
+                   to the policy of client
+    :param router: A router.SnapshotRouter to use instead of one made
+                   from the arguments above
+    """
+
+    def __init__(self, client, cameras, interval, callback, max_workers=8,
+                 password_lookup=None, direct=True, retry_direct=60,
+                 session_store=None, policy=None, router=None):
+        self._client = client
+        self._cameras = list(cameras)
+        if isinstance(interval, dict):
+            missing = [ident for ident in self._cameras
+                       if ident not in interval]
+            if missing:
+                raise ValueError('No interval for cameras %s' %
+                                 ', '.join(map(str, missing)))
+            self._intervals = interval
+        else:
+            self._intervals = dict((ident, interval)
+                                   for ident in self._cameras)
+        self._callback = callback
+        self._max_workers = max_workers
+        if router is None:
+            if direct:
+                routes = router_module.ROUTES
+            else:
+                routes = (router_module.NVR,)
+            router = router_module.SnapshotRouter(
+                client, cooldown=retry_direct, routes=routes,
+                password_lookup=password_lookup,
+                session_store=session_store, policy=policy)
+        self._router = router
+        self._stats = dict((ident, CameraStats()) for ident in self._cameras)
+        self._infos = {}
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+
+    def _camera_info(self, ident):
+        """Return the document of a camera, fetching it once."""
+        info = self._infos.get(ident)
+        if info is None:
+            info = self._infos[ident] = self._client.get_camera(ident)
+        return info
+
+    def fetch(self, ident):
+        """Fetch one snapshot from a camera, directly or via the NVR."""
+        return self._router.get_snapshot(self._camera_info(ident))
+
+    def _poll(self, ident):
+        stats = self._stats[ident]
+        start = time.time()
+        try:
+            image = self.fetch(ident)
+            end = time.time()
+            stats.frames += 1
+            stats.latencies.append(end - start)
+            self._callback(ident, image, end)
+        except Exception as ex:
+            LOG.warning('Snapshot from %s failed: %s', ident, ex)
+            stats.errors += 1
+            stats.last_error = ex
+        finally:
+            with self._lock:
+                self._in_flight.discard(ident)
+
+    def _tick(self, ident):
+        with self._lock:
+            if ident in self._in_flight:
+                self._stats[ident].skipped += 1
+                return
+            self._in_flight.add(ident)
+        self._executor.submit(self._poll, ident)
+
+    def _run(self):
+        now = time.time()
+        schedule = [(now, ident) for ident in self._cameras]
+        heapq.heapify(schedule)
+        for stats in self._stats.values():
+            stats.started = now
+        while schedule and not self._stop.is_set():
+            due, ident = heapq.heappop(schedule)
+            if self._stop.wait(max(0, due - time.time())):
+                break
+            self._tick(ident)
+            interval = self._intervals[ident]
+            due += interval
+            now = time.time()
+            while due <= now:
+                # We fell behind; drop missed ticks instead of bursting
+                self._stats[ident].skipped += 1
+                due += interval
+            heapq.heappush(schedule, (due, ident))
+
+    def start(self):
+        """Start polling in the background."""
+        self._stop.clear()
+        self._executor = futures.ThreadPoolExecutor(
+            max_workers=self._max_workers)
+        self._thread = threading.Thread(target=self._run,
+                                        name='SnapshotPoller')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, wait=True):
+        """Stop polling, optionally waiting for fetches in progress."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def run(self, duration):
+        """Poll for duration seconds, then stop."""
+        self.start()
+        try:
+            self._stop.wait(duration)
+        finally:
+            self.stop()
+
+    def stats(self):
+        """Return a dict of camera identifier to its frame statistics."""
+        now = time.time()
+        return dict((ident, stats.summary(now))
+                    for ident, stats in self._stats.items())
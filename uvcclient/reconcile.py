@@ -0,0 +1,221 @@
+"""Bring camera settings in line with a desired-state file.
+
+The file is JSON, with settings named as in nvr.CAMERA_FIELDS (the
+same names as the set_* methods) and taking the same values::
+
+    {
+        "defaults": {"irledmode": "auto", "recordmode": "motion"},
+        "groups": {"garage*": {"irsensitivity": "high"}},
+        "cameras": {"Front Porch": {"brightness": 60}}
+    }
+
+Group patterns are globs matched against camera names, ignoring case,
+and are applied in file order. Cameras are named by name (ignoring
+case), _id, uuid, MAC address or host. Later sections override earlier
+ones, so a camera entry wins over its groups, which win over the
+defaults. Settings that are not modes (brightness, padding times, ...)
+take whole numbers.
+"""
+
+import collections
+import copy
+import fnmatch
+import json
+import logging
+import numbers
+
+from uvcclient import nvr
+
+LOG = logging.getLogger(__name__)
+
+
+class DesiredState(object):
+    """Validated desired settings: defaults, glob groups and cameras."""
+
+    def __init__(self, defaults=None, groups=None, cameras=None):
+        self.defaults = defaults or {}
+        self.groups = list((groups or {}).items())
+        self.cameras = cameras or {}
+        for settings in ([self.defaults] + [s for p, s in self.groups] +
+                         list(self.cameras.values())):
+            self._validate(settings)
+
+    @staticmethod
+    def _validate(settings):
+        for name, value in settings.items():
+            try:
+                field = nvr.CAMERA_FIELDS[name]
+            except KeyError:
+                raise nvr.Invalid('Unknown setting %s' % name)
+            if field.modes is None and (
+                    not isinstance(value, numbers.Integral) or
+                    isinstance(value, bool)):
+                raise nvr.Invalid('Invalid value %r for %s: expected a '
+                                  'whole number' % (value, name))
+            try:
+                field.values(value)
+            except nvr.Invalid:
+                raise nvr.Invalid('Invalid value %r for %s' % (value, name))
+
+    @classmethod
+    def from_dict(cls, data):
+        unknown = set(data) - set(['defaults', 'groups', 'cameras'])
+        if unknown:
+            raise nvr.Invalid('Unknown sections: %s' %
+                              ', '.join(sorted(unknown)))
+        return cls(data.get('defaults'), data.get('groups'),
+                   data.get('cameras'))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f, object_pairs_hook=collections.OrderedDict)
+        return cls.from_dict(data)
+
+    def settings_for(self, camera, camera_key=None):
+        """Return the desired settings for one camera document.
+
+        :param camera_key: The key of this camera's entry in cameras,
+                           if it has one
+        """
+        settings = collections.OrderedDict(self.defaults)
+        name = (camera.get('name') or '').lower()
+        for pattern, group in self.groups:
+            if fnmatch.fnmatchcase(name, pattern.lower()):
+                settings.update(group)
+        if camera_key is not None:
+            settings.update(self.cameras[camera_key])
+        return settings
+
+
+class CameraPlan(object):
+    """The changes needed to bring one camera to its desired state.
+
+    changes maps each setting name to a dict of the document keys it
+    changes, as (current, desired) pairs. document is the camera
+    document with the changes applied, ready to PUT, and original is
+    the document it was planned against.
+    """
+
+    def __init__(self, camera, name, changes, document, original=None):
+        self.camera = camera
+        self.name = name
+        self.changes = changes
+        self.document = document
+        self.original = original
+
+    def describe(self):
+        lines = ['%s (%s):' % (self.name, self.camera)]
+        for setting, keys in self.changes.items():
+            lines.append('  %s: %s' % (setting, ', '.join(
+                '%s %r -> %r' % (key, old, new)
+                for key, (old, new) in sorted(keys.items()))))
+        return '\n'.join(lines)
+
+
+class Plan(object):
+    """All the camera changes needed, plus camera entries that matched
+    nothing on the NVR."""
+
+    def __init__(self, cameras, unmatched):
+        self.cameras = cameras
+        self.unmatched = unmatched
+
+    def __len__(self):
+        return len(self.cameras)
+
+    def __iter__(self):
+        return iter(self.cameras)
+
+    def describe(self):
+        lines = [camera.describe() for camera in self.cameras]
+        for key in self.unmatched:
+            lines.append('Error: %s: no such camera' % key)
+        return '\n'.join(lines)
+
+
+def _changes(camera, settings):
+    changes = collections.OrderedDict()
+    for name, value in settings.items():
+        field = nvr.CAMERA_FIELDS[name]
+        section = camera.get(field.section, {}) if field.section else camera
+        differ = dict((key, (section.get(key), want))
+                      for key, want in field.values(value).items()
+                      if section.get(key) != want)
+        if differ:
+            changes[name] = differ
+    return changes
+
+
+def plan(client, desired, fleet=None):
+    """Work out which cameras need which changes.
+
+    :param client: A UVCRemote
+    :param desired: A DesiredState
+    :param fleet: A FleetSnapshot to plan against; one is fetched if
+                  not given
+    :returns: A Plan
+    """
+    if fleet is None:
+        fleet = client.fleet_snapshot()
+    keys = {}
+    unmatched = []
+    for key in desired.cameras:
+        camera = fleet.lookup(key)
+        if camera is None:
+            # Names differing only in case, MAC formats and hosts
+            entry = fleet.resolver.lookup(key)
+            camera = entry and fleet.lookup(entry['id'])
+        if camera is None:
+            unmatched.append(key)
+        else:
+            keys[camera['_id']] = key
+
+    ident_key = '_id' if client.camera_identifier == 'id' else 'uuid'
+    cameras = []
+    for camera in fleet:
+        if camera.get('deleted'):
+            continue
+        settings = desired.settings_for(camera, keys.get(camera['_id']))
+        changes = _changes(camera, settings)
+        if not changes:
+            continue
+        document = copy.deepcopy(camera)
+        for name in changes:
+            nvr.CAMERA_FIELDS[name].apply(document, settings[name])
+        cameras.append(CameraPlan(camera[ident_key], camera.get('name'),
+                                  changes, document, camera))
+    return Plan(cameras, unmatched)
+
+
+def apply(client, plan, max_workers=4, rate=None):
+    """PUT every planned camera document, several at a time.
+
+    :returns: An OrderedDict of camera identifier to nvr.CameraResult,
+              whose value is the updated document
+    """
+    planned = dict((camera.camera, camera) for camera in plan)
+
+    def put(ident):
+        data = client._put_camera('/api/2.0/camera/%s' % ident,
+                                  planned[ident].document,
+                                  planned[ident].original)
+        return data['data'][0]
+
+    return client.map_cameras(put, [camera.camera for camera in plan],
+                              max_workers=max_workers, rate=rate)
+
+
+def reconcile(client, desired, dry_run=False, max_workers=4, rate=None):
+    """Plan and, unless dry_run, apply the changes for a desired state.
+
+    Nothing is applied if any camera entry matches no camera, since the
+    file is then likely wrong.
+
+    :returns: A tuple of the Plan and the results from apply(), which
+              are None for a dry run or unmatched cameras
+    """
+    changes = plan(client, desired)
+    if dry_run or not changes or changes.unmatched:
+        return changes, None
+    return changes, apply(client, changes, max_workers, rate)
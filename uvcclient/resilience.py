@@ -0,0 +1,262 @@
+"""Timeouts, retries and circuit breaking for NVR and camera requests.
+
+A Policy is given to UVCRemote and UVCCameraClient (the same one can be
+shared by any number of clients and threads)::
+
+    policy = Policy(connect_timeout=5, read_timeout=30, retries=2,
+                    breakers=BreakerRegistry())
+    client = nvr.UVCRemote(host, port, apikey, policy=policy)
+    cam = camera.UVCCameraClient(addr, user, password, policy=policy)
+
+Requests that fail with a network error, a timeout or (from the NVR) a
+5xx status are retried after a random delay of up to backoff * 2 ** n
+seconds. GETs are always retried; other methods only if the connection
+could not be opened, since otherwise the server may have acted on the
+request already. Each host has its own CircuitBreaker, which fails
+requests straight away once the host has failed failure_threshold
+times in a row, until reset_timeout has passed and a trial request
+succeeds.
+
+The default Policy has no timeouts, retries or breakers, which is how
+the clients behaved before it existed.
+"""
+
+import logging
+import random
+import socket
+import threading
+import time
+
+# Python3 compatibility
+try:
+    import httplib
+except ImportError:
+    from http import client as httplib
+
+LOG = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpen(Exception):
+    """A host's breaker is open, so the request was not attempted."""
+    pass
+
+
+class TransientError(Exception):
+    """Mixed into errors that are worth retrying, such as a 503."""
+    pass
+
+
+class ConnectError(socket.error):
+    """The connection could not be opened, so nothing was sent."""
+    pass
+
+
+class CircuitBreaker(object):
+    """Tracks consecutive failures of one host.
+
+    :param failure_threshold: Failures in a row that open the breaker
+    :param reset_timeout: Seconds an open breaker waits before letting
+                          a trial request through
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self._threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened = 0
+        self._trial = False
+        self.failures = 0
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if (self._state == OPEN and
+                time.time() - self._opened >= self._reset_timeout):
+            self._state = HALF_OPEN
+            self._trial = False
+        return self._state
+
+    def allow(self):
+        """Return whether a request may be sent now.
+
+        While half-open, only one trial request is let through.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED or (state == HALF_OPEN and not self._trial):
+                self._trial = state == HALF_OPEN
+                return True
+            self.rejected += 1
+            return False
+
+    def success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._trial = False
+            self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if (self._state == HALF_OPEN or
+                    self.failures >= self._threshold):
+                if self._state != OPEN:
+                    self.trips += 1
+                self._state = OPEN
+                self._opened = time.time()
+                self._trial = False
+
+    def stats(self):
+        with self._lock:
+            return {'state': self._current_state(),
+                    'failures': self.failures,
+                    'trips': self.trips,
+                    'rejected': self.rejected}
+
+
+class BreakerRegistry(object):
+    """One CircuitBreaker per host, created on first use.
+
+    :param failure_threshold: Passed to each CircuitBreaker
+    :param reset_timeout: Passed to each CircuitBreaker
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self._threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, host):
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(
+                    self._threshold, self._reset_timeout)
+            return breaker
+
+    def reset(self, host=None):
+        with self._lock:
+            if host is None:
+                self._breakers.clear()
+            else:
+                self._breakers.pop(host, None)
+
+    def stats(self):
+        """Return a dict of host to its breaker's stats()."""
+        with self._lock:
+            breakers = list(self._breakers.items())
+        return dict((host, breaker.stats()) for host, breaker in breakers)
+
+
+class Policy(object):
+    """How requests are timed out, retried and circuit broken.
+
+    :param connect_timeout: Seconds to wait for a connection, or None
+    :param read_timeout: Seconds to wait for each read once connected,
+                         or None
+    :param retries: Times to retry a request that failed transiently
+    :param backoff: Longest delay in seconds before the first retry;
+                    each retry after that may wait twice as long
+    :param max_backoff: Longest delay before any retry
+    :param retry_methods: Methods that are retried after any transient
+                          failure, not just a failure to connect
+    :param breakers: A BreakerRegistry, or None for no circuit breaking
+    """
+
+    def __init__(self, connect_timeout=None, read_timeout=None, retries=0,
+                 backoff=0.5, max_backoff=10, retry_methods=('GET', 'HEAD'),
+                 breakers=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_methods = frozenset(retry_methods)
+        self.breakers = breakers
+
+    def connection_args(self):
+        """Keyword arguments for an HTTPConnection."""
+        if self.connect_timeout is None:
+            return {}
+        return {'timeout': self.connect_timeout}
+
+    def connect(self, conn):
+        """Open conn if it is not already open, and set its read timeout.
+
+        :raises: ConnectError if the connection could not be opened
+        """
+        if conn.sock is not None:
+            return
+        try:
+            conn.connect()
+        except (socket.error, OSError) as ex:
+            raise ConnectError(*ex.args)
+        if self.connect_timeout is not None or self.read_timeout is not None:
+            conn.sock.settimeout(self.read_timeout)
+
+    @staticmethod
+    def is_transient(error):
+        return isinstance(error, (socket.error, OSError,
+                                  httplib.HTTPException, TransientError))
+
+    def delay(self, attempt):
+        """Seconds to wait before retry number attempt (from zero)."""
+        return random.uniform(0, min(self.max_backoff,
+                                     self.backoff * 2 ** attempt))
+
+    def _retryable(self, method, error, idempotent=None):
+        if idempotent is None:
+            idempotent = method in self.retry_methods
+        return isinstance(error, ConnectError) or idempotent
+
+    def call(self, host, method, fn, idempotent=None):
+        """Call fn() for a request to host, retrying it as configured.
+
+        :param idempotent: Whether the request may be sent again after
+                           it may have reached the host; by default,
+                           whether method is one of retry_methods
+        :raises: CircuitOpen if host's breaker is open, otherwise
+                 whatever the last attempt raised
+        """
+        breaker = self.breakers and self.breakers.get(host)
+        attempt = 0
+        while True:
+            if breaker and not breaker.allow():
+                raise CircuitOpen('%s has failed too often, not trying '
+                                  'it again yet' % host)
+            try:
+                result = fn()
+            except Exception as ex:
+                if not self.is_transient(ex):
+                    # The host answered, so it is alive
+                    if breaker:
+                        breaker.success()
+                    raise
+                if breaker:
+                    breaker.failure()
+                if (attempt >= self.retries or
+                        not self._retryable(method, ex, idempotent)):
+                    raise
+                wait = self.delay(attempt)
+                LOG.debug('%s to %s failed (%s), retrying in %.2fs',
+                          method, host, ex, wait)
+                time.sleep(wait)
+                attempt += 1
+                continue
+            if breaker:
+                breaker.success()
+            return result
+
+
+DEFAULT_POLICY = Policy()
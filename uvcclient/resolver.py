@@ -0,0 +1,166 @@
+import fnmatch
+import logging
+import re
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+GLOB_CHARS = re.compile(r'[*?\[]')
+
+
+def _fold(name):
+    try:
+        return name.lower()
+    except AttributeError:
+        return name
+
+
+def _mac_key(mac):
+    return re.sub('[^0-9a-f]', '', mac.lower())
+
+
+class CameraResolver(object):
+    """Finds cameras by name, uuid, _id, MAC address or host.
+
+    The index behind it is a copy of the client's index() that is
+    refreshed when it is older than ttl, and also when a lookup misses
+    (at most once every min_refresh seconds, so that looking up names
+    that do not exist does not download the fleet every time). With a
+    store (see store.CacheStore) the index is also saved on disk, so
+    separate runs of a script can share it.
+
+    :param client: A UVCRemote, or anything with index() and
+                   camera_identifier
+    :param ttl: Seconds an index is used before being fetched again, or
+                None to keep it until a lookup misses
+    :param store: Where to save the index between runs, or None
+    :param min_refresh: Fewest seconds between refreshes on a miss
+    """
+
+    def __init__(self, client, ttl=300, store=None, min_refresh=5):
+        self._client = client
+        self._ttl = ttl
+        self._store = store
+        self._min_refresh = min_refresh
+        self._lock = threading.Lock()
+        self._cameras = None
+        self._loaded = 0
+        self._exact = {}
+        self._by_name = {}
+
+    @property
+    def _store_key(self):
+        return 'cameras:%s:%s' % (self._client._host, self._client._port)
+
+    def _build(self, cameras, loaded):
+        exact = {}
+        by_name = {}
+        for cam in cameras:
+            for key in ('id', 'uuid', 'host'):
+                if cam.get(key):
+                    exact.setdefault(cam[key], cam)
+            if cam.get('mac'):
+                exact.setdefault(_mac_key(cam['mac']), cam)
+            by_name.setdefault(_fold(cam['name']), []).append(cam)
+        self._cameras = cameras
+        self._loaded = loaded
+        self._exact = exact
+        self._by_name = by_name
+
+    def _expired(self):
+        if self._cameras is None:
+            return True
+        return self._ttl is not None and time.time() - self._loaded > self._ttl
+
+    def refresh(self):
+        """Fetch the index from the NVR now."""
+        cameras = self._client.index()
+        with self._lock:
+            self._build(cameras, time.time())
+        if self._store is not None:
+            self._store.put(self._store_key, cameras)
+        return cameras
+
+    def _ensure(self):
+        if not self._expired():
+            return
+        if self._cameras is None and self._store is not None:
+            # Keep the time the index was fetched, so a miss refreshes
+            # it as soon as it would have in the run that saved it
+            cameras, saved = self._store.get_entry(self._store_key,
+                                                   ttl=self._ttl)
+            if cameras is not None:
+                LOG.debug('Using saved camera index')
+                with self._lock:
+                    self._build(cameras, saved)
+                return
+        self.refresh()
+
+    def _refresh_on_miss(self):
+        if time.time() - self._loaded < self._min_refresh:
+            return False
+        LOG.debug('Camera not found, refreshing index')
+        self.refresh()
+        return True
+
+    def cameras(self):
+        """Return the index entries of every camera."""
+        self._ensure()
+        return list(self._cameras)
+
+    def _lookup(self, key):
+        cam = self._exact.get(key)
+        if cam is None:
+            try:
+                cam = self._exact.get(_mac_key(key))
+            except AttributeError:
+                pass
+        if cam is None:
+            matches = self._by_name.get(_fold(key))
+            if matches:
+                exact = [x for x in matches if x['name'] == key]
+                cam = (exact or matches)[0]
+        return cam
+
+    def lookup(self, key):
+        """Find the index entry of a camera.
+
+        key may be an _id, uuid, MAC address (in any format), host, or
+        name. Names are matched ignoring case, preferring an exact match.
+
+        :returns: The index entry, or None if there is no such camera
+        """
+        self._ensure()
+        cam = self._lookup(key)
+        if cam is None and self._refresh_on_miss():
+            cam = self._lookup(key)
+        return cam
+
+    def resolve(self, key):
+        """Return the identifier to use in requests for a camera, or None.
+
+        This is the uuid on NVRs before v3.2.0, and the id after.
+        """
+        cam = self.lookup(key)
+        return cam and cam[self._client.camera_identifier]
+
+    def _search(self, pattern):
+        folded = _fold(pattern)
+        if GLOB_CHARS.search(pattern):
+            return [cam for cam in self._cameras
+                    if fnmatch.fnmatchcase(_fold(cam['name']), folded)]
+        return [cam for cam in self._cameras
+                if _fold(cam['name']).startswith(folded)]
+
+    def find(self, pattern):
+        """Return the entries of cameras whose names match pattern.
+
+        A pattern with glob characters (*, ? or [) is matched as a glob,
+        anything else as a name prefix, both ignoring case.
+        """
+        self._ensure()
+        found = self._search(pattern)
+        if not found and self._refresh_on_miss():
+            found = self._search(pattern)
+        return found
@@ -0,0 +1,295 @@
+"""Choose how to fetch each camera's snapshots.
+
+A snapshot can come straight from the camera (which needs its admin
+password, see store.InfoStore) or be proxied by the NVR. The direct
+route is usually faster, but some cameras cannot be reached from where
+the client runs and some passwords are not known, and trying them
+first on every call costs a failed connection each time.
+
+SnapshotRouter keeps, for each camera and route, a moving average of
+how long a snapshot took and how many times in a row the route has
+failed. It uses the fastest healthy route, sends a request down the
+other one now and then to see whether it has become faster or working
+again, and saves what it learned so the next run starts from it.
+"""
+
+import io
+import logging
+import threading
+import time
+
+from uvcclient import camera as camera_module
+from uvcclient import nvr
+from uvcclient import streams
+
+LOG = logging.getLogger(__name__)
+
+DIRECT = 'direct'
+NVR = 'nvr'
+ROUTES = (DIRECT, NVR)
+
+DIRECT_ERRORS = (camera_module.CameraAuthError,
+                 camera_module.CameraConnectError)
+NVR_ERRORS = (nvr.NvrError, nvr.NotAuthorized, nvr.CameraConnectionError)
+
+
+class RouteStats(object):
+    """What is known about one route to one camera.
+
+    ewma is the moving average of seconds per snapshot, or None if the
+    route has never worked. failures counts failures in a row.
+    """
+
+    __slots__ = ('ewma', 'failures', 'last_attempt', 'last_failure')
+
+    def __init__(self, ewma=None, failures=0, last_attempt=0,
+                 last_failure=0):
+        self.ewma = ewma
+        self.failures = failures
+        self.last_attempt = last_attempt
+        self.last_failure = last_failure
+
+    def to_dict(self):
+        return dict((key, getattr(self, key)) for key in self.__slots__)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**dict((key, data[key]) for key in cls.__slots__
+                          if key in data))
+
+    def __repr__(self):
+        return '<RouteStats ewma=%s failures=%i>' % (self.ewma, self.failures)
+
+
+class SnapshotRouter(object):
+    """Fetches snapshots by the best route for each camera.
+
+    A route that has failed is left alone for cooldown seconds, doubling
+    with each further failure up to max_cooldown. Once a camera has a
+    preferred route, the other one is tried instead at most every
+    probe_interval seconds; if the probe fails, the preferred route is
+    used for that call after all.
+
+    The routing table is saved whenever the route a camera would use
+    first changes, rather than after every snapshot. Camera clients are
+    kept logged in between snapshots, and dropped when the camera fails.
+
+    :param client: A UVCRemote
+    :param store: A store.CacheStore to keep the routing table in, or
+                  None to keep it only in memory
+    :param passwords: A store.InfoStore with camera passwords and
+                      sessions, or None to try the default password
+    :param camera_port: Port of the cameras' web interface
+    :param alpha: Weight of the newest latency in the moving average
+    :param probe_interval: Fewest seconds between probes of the route
+                           that is not preferred
+    :param cooldown: Seconds to avoid a route after it first fails
+    :param max_cooldown: Longest time to avoid a failing route
+    :param routes: The routes that may be used
+    :param password_lookup: Called with a camera document to get the
+                            camera's admin password, instead of looking
+                            it up in passwords
+    :param session_store: Where the camera clients save their sessions;
+                          defaults to passwords
+    :param policy: The resilience.Policy of the camera clients; defaults
+                   to the policy of client
+    """
+
+    def __init__(self, client, store=None, passwords=None, camera_port=80,
+                 alpha=0.3, probe_interval=300, cooldown=60,
+                 max_cooldown=3600, routes=ROUTES, password_lookup=None,
+                 session_store=None, policy=None):
+        self._client = client
+        self._store = store
+        self._passwords = passwords
+        self._allowed = tuple(routes)
+        self._password_lookup = password_lookup
+        if session_store is None:
+            session_store = passwords
+        self._session_store = session_store
+        self._policy = policy
+        self._camera_clients = {}
+        self._camera_port = camera_port
+        self._alpha = alpha
+        self._probe_interval = probe_interval
+        self._cooldown = cooldown
+        self._max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+        self._table = None
+
+    @property
+    def _store_key(self):
+        return 'snapshot-routes:%s:%s' % (self._client._host,
+                                          self._client._port)
+
+    def _load(self):
+        if self._table is None:
+            saved = None
+            if self._store is not None:
+                saved = self._store.get(self._store_key, ttl=float('inf'))
+            self._table = dict(
+                (camera, dict((route, RouteStats.from_dict(stats))
+                              for route, stats in routes.items()))
+                for camera, routes in (saved or {}).items())
+        return self._table
+
+    def _routes(self, ident):
+        """Return the RouteStats of each route to a camera."""
+        routes = self._load().setdefault(ident, {})
+        for route in self._allowed:
+            routes.setdefault(route, RouteStats())
+        return routes
+
+    def table(self):
+        """Return {camera: {route: RouteStats}} for every camera seen."""
+        with self._lock:
+            return dict((camera, dict(routes))
+                        for camera, routes in self._load().items())
+
+    def _save(self):
+        if self._store is not None:
+            self._store.put(self._store_key, dict(
+                (camera, dict((route, stats.to_dict())
+                              for route, stats in routes.items()))
+                for camera, routes in self._table.items()))
+
+    def _healthy(self, stats, now):
+        if not stats.failures:
+            return True
+        cooldown = min(self._max_cooldown,
+                       self._cooldown * 2 ** (stats.failures - 1))
+        return now - stats.last_failure >= cooldown
+
+    def _order(self, routes, usable, now):
+        """Return the healthy routes, fastest first, and the failing
+        ones, longest failed first."""
+        healthy = [route for route in usable
+                   if self._healthy(routes[route], now)]
+        # Routes that have never worked are tried first, to learn about
+        # them; after that the fastest wins
+        healthy.sort(key=lambda route: routes[route].ewma or 0)
+        failing = sorted((route for route in usable
+                          if route not in healthy),
+                         key=lambda route: routes[route].last_failure)
+        return healthy, failing
+
+    def plan(self, camera_info):
+        """Return the routes to try for a camera, best first."""
+        with self._lock:
+            routes = self._routes(camera_info['_id'])
+            now = time.time()
+            usable = [route for route in self._allowed
+                      if route != DIRECT or camera_info.get('host')]
+            healthy, failing = self._order(routes, usable, now)
+            if (len(healthy) > 1 and routes[healthy[0]].ewma is not None and
+                    now - routes[healthy[1]].last_attempt >=
+                    self._probe_interval):
+                LOG.debug('Probing %s route to %s', healthy[1],
+                          camera_info['_id'])
+                healthy.reverse()
+            return healthy + failing
+
+    def _preferred(self, routes, now):
+        healthy, failing = self._order(routes, self._allowed, now)
+        return (healthy + failing)[0]
+
+    def _record(self, ident, route, latency=None):
+        with self._lock:
+            routes = self._routes(ident)
+            stats = routes[route]
+            stats.last_attempt = time.time()
+            before = self._preferred(routes, stats.last_attempt)
+            if latency is None:
+                stats.failures += 1
+                stats.last_failure = stats.last_attempt
+            else:
+                stats.failures = 0
+                if stats.ewma is None:
+                    stats.ewma = latency
+                else:
+                    stats.ewma = (self._alpha * latency +
+                                  (1 - self._alpha) * stats.ewma)
+            if self._preferred(routes, stats.last_attempt) != before:
+                self._save()
+
+    def _camera_client(self, camera_info):
+        """Return the camera client for a camera, creating it once."""
+        with self._lock:
+            cam_client = self._camera_clients.get(camera_info['_id'])
+        if cam_client is not None:
+            return cam_client
+        if self._password_lookup is not None:
+            password = self._password_lookup(camera_info)
+        elif self._passwords is not None:
+            password = self._passwords.get_camera_password(
+                camera_info['uuid'])
+        else:
+            password = None
+        if self._client.server_version >= (3, 2, 0):
+            cls = camera_module.UVCCameraClientV320
+        else:
+            cls = camera_module.UVCCameraClient
+        cam_client = cls(camera_info['host'], camera_info['username'],
+                         password or 'ubnt', port=self._camera_port,
+                         session_store=self._session_store,
+                         policy=self._policy or self._client.policy)
+        with self._lock:
+            self._camera_clients[camera_info['_id']] = cam_client
+        return cam_client
+
+    def _open(self, camera_info, route):
+        if route == DIRECT:
+            cam_client = self._camera_client(camera_info)
+            cam_client.ensure_login()
+            return cam_client._snapshot_response()
+        if self._client.camera_identifier == 'id':
+            ident = camera_info['_id']
+        else:
+            ident = camera_info['uuid']
+        return self._client._snapshot_response(ident)
+
+    def stream_snapshot(self, camera_info, sink,
+                        chunk_size=streams.DEFAULT_CHUNK_SIZE):
+        """Copy a snapshot of a camera into sink by the best route.
+
+        A route that fails before any of the image is copied is recorded
+        as failed and the next one is tried. A failure part way through
+        the copy is raised, since sink already holds part of an image.
+
+        :param camera_info: The camera's document (see get_camera())
+        :param sink: A file, socket or writable buffer (see
+                     streams.copy_stream)
+        :returns: The size of the image in bytes
+        :raises: nvr.NvrError if no route can be used for the camera
+        """
+        ident = camera_info['_id']
+        error = None
+        for route in self.plan(camera_info):
+            start = time.time()
+            try:
+                resp = self._open(camera_info, route)
+            except (DIRECT_ERRORS if route == DIRECT else NVR_ERRORS) as ex:
+                LOG.debug('Snapshot of %s via %s failed: %s', ident, route,
+                          ex)
+                if route == DIRECT:
+                    with self._lock:
+                        self._camera_clients.pop(ident, None)
+                self._record(ident, route)
+                error = ex
+                continue
+            try:
+                size = streams.copy_stream(resp, sink, chunk_size)
+            except Exception:
+                self._record(ident, route)
+                raise
+            self._record(ident, route, time.time() - start)
+            return size
+        if error is None:
+            raise nvr.NvrError('No usable route for camera %s' % ident)
+        raise error
+
+    def get_snapshot(self, camera_info):
+        """Return a snapshot of a camera as bytes, by the best route."""
+        buf = io.BytesIO()
+        self.stream_snapshot(camera_info, buf)
+        return buf.getvalue()
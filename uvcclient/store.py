@@ -2,9 +2,11 @@ import base64
 import json
 import logging
 import os
+import time
 
 LOG = logging.getLogger(__name__)
 _INFO_STORE = None
+_CACHE_STORE = None
 
 
 class UnableToManageStore(Exception):
@@ -51,9 +53,97 @@ class InfoStore(object):
         self._data['camera_passwords'][uuid] = password
         self.save()
 
+    def get_camera_session(self, key):
+        """Return a saved camera session cookie, if it has not expired."""
+        session = self._data.get('camera_sessions', {}).get(key)
+        if session and session['expires'] > time.time():
+            return session['cookie']
+        return None
+
+    def set_camera_session(self, key, cookie, expires):
+        sessions = self._data.setdefault('camera_sessions', {})
+        for other in list(sessions):
+            if sessions[other]['expires'] <= time.time():
+                del sessions[other]
+        sessions[key] = {'cookie': cookie, 'expires': expires}
+        self.save()
+
+    def get_alert_mark(self, key):
+        """Return the alert high-water mark saved for an NVR, if any."""
+        return self._data.get('alert_marks', {}).get(key)
+
+    def set_alert_mark(self, key, mark):
+        self._data.setdefault('alert_marks', {})[key] = mark
+        self.save()
+
+
+class CacheStore(object):
+    """A small on-disk cache of JSON documents that expire after ttl.
+
+    Unlike InfoStore, nothing here is precious: any error reading the
+    cache just means everything is fetched again.
+    """
+
+    def __init__(self, path=None, ttl=3600):
+        if path is None:
+            path = os.path.expanduser(os.path.join('~', '.uvcclient-cache'))
+        self._path = path
+        self._ttl = ttl
+
+    def _load(self):
+        try:
+            with open(self._path, 'r') as f:
+                return json.loads(f.read())
+        except (OSError, IOError):
+            return {}
+        except ValueError as ex:
+            LOG.warning('Ignoring corrupt cache %s: %s', self._path, ex)
+            return {}
+
+    def get(self, key, ttl=None):
+        """Return the cached data for key, or None if missing or expired."""
+        return self.get_entry(key, ttl)[0]
+
+    def get_entry(self, key, ttl=None):
+        """Return (data, time saved) for key, or (None, None) if missing
+        or expired."""
+        if ttl is None:
+            ttl = self._ttl
+        entry = self._load().get(key)
+        if entry is None or time.time() - entry['time'] > ttl:
+            return None, None
+        return entry['data'], entry['time']
+
+    def put(self, key, data):
+        entries = self._load()
+        entries[key] = {'time': time.time(), 'data': data}
+        self._save(entries)
+
+    def invalidate(self, key):
+        entries = self._load()
+        if entries.pop(key, None) is not None:
+            self._save(entries)
+
+    def _save(self, entries):
+        tmp = '%s.%i.tmp' % (self._path, os.getpid())
+        try:
+            with open(tmp, 'w') as f:
+                f.write(json.dumps(entries))
+            os.chmod(tmp, 0o600)
+            os.rename(tmp, self._path)
+        except (OSError, IOError) as ex:
+            LOG.debug('Unable to write cache: %s', ex)
+
 
 def get_info_store(path=None):
     global _INFO_STORE
     if _INFO_STORE is None:
         _INFO_STORE = InfoStore(path)
     return _INFO_STORE
+
+
+def get_cache_store(path=None):
+    global _CACHE_STORE
+    if _CACHE_STORE is None:
+        _CACHE_STORE = CacheStore(path)
+    return _CACHE_STORE
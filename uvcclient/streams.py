@@ -0,0 +1,222 @@
+import codecs
+import json
+import re
+import time
+import zlib
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_DELIMITERS = ',]} \t\n\r'
+
+
+def copy_stream(source, sink, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Copy everything readable from source into sink.
+
+    Data is read with readinto() into one reusable buffer, so memory use
+    does not grow with the size of what is copied.
+
+    :param source: A file-like object, such as an HTTP response
+    :param sink: A file-like object with write(), a socket (sendall() is
+                 used), or a writable buffer such as a bytearray, which
+                 is filled in place from the start
+    :param chunk_size: Size of the copy buffer
+    :returns: The number of bytes copied
+    """
+    write = getattr(sink, 'sendall', None) or getattr(sink, 'write', None)
+    if write is None:
+        return _fill_buffer(source, memoryview(sink))
+
+    readinto = getattr(source, 'readinto', None)
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    total = 0
+    while True:
+        if readinto is not None:
+            count = readinto(buf)
+            chunk = view[:count]
+        else:
+            chunk = source.read(chunk_size)
+            count = len(chunk)
+        if not count:
+            return total
+        write(chunk)
+        total += count
+
+
+def _fill_buffer(source, view):
+    total = 0
+    readinto = getattr(source, 'readinto', None)
+    while total < len(view):
+        if readinto is not None:
+            count = readinto(view[total:])
+        else:
+            chunk = source.read(len(view) - total)
+            count = len(chunk)
+            view[total:total + count] = chunk
+        if not count:
+            return total
+        total += count
+    if source.read(1):
+        raise ValueError('Data does not fit in a buffer of %i bytes' %
+                         len(view))
+    return total
+
+
+class CountingReader(object):
+    """Wraps a file-like object, counting the bytes read through it and
+    the seconds spent reading them."""
+
+    def __init__(self, source):
+        self._source = source
+        self.count = 0
+        self.elapsed = 0.0
+
+    def read(self, size=-1):
+        start = time.time()
+        data = self._source.read(size)
+        self.elapsed += time.time() - start
+        self.count += len(data)
+        return data
+
+
+class TimedIterator(object):
+    """Wraps an iterator, adding up the seconds spent in next()."""
+
+    def __init__(self, iterable):
+        self._iter = iter(iterable)
+        self.elapsed = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.time()
+        try:
+            return next(self._iter)
+        finally:
+            self.elapsed += time.time() - start
+
+    next = __next__
+
+
+def iter_chunks(source, gzipped=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield everything readable from source, a chunk at a time.
+
+    :param gzipped: Whether to decompress the data (gzip or zlib) as it
+                    is read, rather than all at once at the end
+    """
+    decompressor = gzipped and zlib.decompressobj(32 + zlib.MAX_WBITS)
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        if decompressor:
+            chunk = decompressor.decompress(chunk)
+        if chunk:
+            yield chunk
+    if decompressor:
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+
+class _TextBuffer(object):
+    """Decoded text from a sequence of UTF-8 chunks, read on demand."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def more(self):
+        """Read another chunk, dropping the text already consumed."""
+        if self.eof:
+            return False
+        self.text = self.text[self.pos:]
+        self.pos = 0
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self.eof = True
+            self.text += self._decoder.decode(b'', True)
+            return False
+        self.text += self._decoder.decode(chunk)
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character, or ''."""
+        while True:
+            self.pos = _WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text) or not self.more():
+                return self.text[self.pos:self.pos + 1]
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError('Expected one of %r but found %r' % (chars,
+                                                                  char))
+        self.pos += 1
+        return char
+
+    def value(self, decoder, raw=False):
+        """Decode the next complete JSON value.
+
+        :param raw: Whether to return a tuple of the value and its JSON
+                    text, rather than just the value
+        """
+        self.peek()
+        while True:
+            try:
+                obj, end = decoder.raw_decode(self.text, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise
+                self.more()
+                continue
+            # A number is only complete once something that cannot be
+            # part of it follows: '1' may be the start of '1.5' or '1e3'
+            if (self.eof or self.text[self.pos] in '{["' or
+                    (end < len(self.text) and
+                     self.text[end] in _DELIMITERS)):
+                text = self.text[self.pos:end] if raw else None
+                self.pos = end
+                return (obj, text) if raw else obj
+            self.more()
+
+
+def iter_json_items(chunks, key='data', raw=False):
+    """Yield the elements of one array in a JSON object as they are parsed.
+
+    Only the element being parsed and the unparsed rest of the current
+    chunk are held in memory, so this suits responses like the NVR's
+    ``{"data": [...], "meta": {...}}`` with very long arrays.
+
+    :param chunks: An iterable of bytes, such as iter_chunks()
+    :param key: The top-level key of the array
+    :param raw: Whether to yield a tuple of each element and its JSON
+                text, rather than just the element
+    """
+    buf = _TextBuffer(chunks)
+    decoder = json.JSONDecoder()
+    buf.expect('{')
+    if buf.peek() == '}':
+        return
+    while True:
+        name = buf.value(decoder)
+        buf.expect(':')
+        if name == key and buf.peek() == '[':
+            buf.pos += 1
+            if buf.peek() == ']':
+                buf.pos += 1
+            else:
+                while True:
+                    yield buf.value(decoder, raw)
+                    if buf.expect(',]') == ']':
+                        break
+        else:
+            buf.value(decoder)
+        if buf.expect(',}') == '}':
+            return
@@ -0,0 +1,237 @@
+import logging
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+LOG = logging.getLogger(__name__)
+
+# Fields that change on every poll without anything interesting happening
+VOLATILE_KEYS = frozenset(['lastSeen', 'upSince', 'uptime', 'stats',
+                           'lastRecordingId', 'lastRecordingStartTime'])
+
+
+class CameraEvent(object):
+    """Something that happened to one camera between two polls."""
+
+    def __init__(self, camera, name, timestamp):
+        self.camera = camera
+        self.name = name
+        self.timestamp = timestamp
+
+    def _details(self):
+        return ''
+
+    def __repr__(self):
+        return '<%s %s (%s)%s>' % (self.__class__.__name__, self.camera,
+                                   self.name, self._details())
+
+
+class CameraAdded(CameraEvent):
+    def __init__(self, camera, name, timestamp, document):
+        super(CameraAdded, self).__init__(camera, name, timestamp)
+        self.document = document
+
+
+class CameraRemoved(CameraEvent):
+    def __init__(self, camera, name, timestamp, document):
+        super(CameraRemoved, self).__init__(camera, name, timestamp)
+        self.document = document
+
+
+class StateChanged(CameraEvent):
+    """The camera's state changed, such as CONNECTED to DISCONNECTED."""
+
+    def __init__(self, camera, name, timestamp, old, new):
+        super(StateChanged, self).__init__(camera, name, timestamp)
+        self.old = old
+        self.new = new
+
+    def _details(self):
+        return ' %s -> %s' % (self.old, self.new)
+
+
+class SettingChanged(CameraEvent):
+    """Any other field of the camera document changed.
+
+    path is the tuple of keys leading to the field, such as
+    ('recordingSettings', 'motionRecordEnabled'). Lists are compared
+    whole, so a changed zone gives one event for ('zones',).
+    """
+
+    def __init__(self, camera, name, timestamp, path, old, new):
+        super(SettingChanged, self).__init__(camera, name, timestamp)
+        self.path = path
+        self.old = old
+        self.new = new
+
+    @property
+    def key(self):
+        return '.'.join(self.path)
+
+    def _details(self):
+        return ' %s: %r -> %r' % (self.key, self.old, self.new)
+
+
+def diff(old, new, ignore=(), path=()):
+    """Yield (path, old, new) for every differing leaf of two documents.
+
+    Keys in ignore are skipped at any depth. A key missing on one side
+    is reported with None as its value there.
+    """
+    for key in set(old) | set(new):
+        if key in ignore:
+            continue
+        a = old.get(key)
+        b = new.get(key)
+        if a == b:
+            continue
+        if isinstance(a, dict) and isinstance(b, dict):
+            for change in diff(a, b, ignore, path + (key,)):
+                yield change
+        else:
+            yield path + (key,), a, b
+
+
+class FleetWatcher(object):
+    """Polls the NVR's camera list and reports what changed as events.
+
+    Each poll uses UVCRemote.changed_since, so an unchanged fleet is
+    recognised from the response alone and only cameras whose document
+    changed are diffed. The poll interval starts at interval, grows by
+    backoff after every poll that finds nothing (up to max_interval) and
+    drops back as soon as something changes.
+
+    Events go to every callback passed to subscribe(), from the polling
+    thread, and can also be consumed with events().
+
+    :param client: A UVCRemote
+    :param interval: Seconds between polls while things are changing
+    :param max_interval: Longest time between polls when idle
+    :param backoff: Factor the interval grows by after an idle poll
+    :param ignore: Document keys whose changes are not reported
+    """
+
+    def __init__(self, client, interval=5, max_interval=60, backoff=1.5,
+                 ignore=VOLATILE_KEYS):
+        self._client = client
+        self._min_interval = interval
+        self._max_interval = max_interval
+        self._backoff = backoff
+        self._ignore = frozenset(ignore)
+        self._token = None
+        self._callbacks = []
+        self._stop = threading.Event()
+        self._thread = None
+        self.interval = interval
+
+    def subscribe(self, callback):
+        """Call callback(event) for every event from now on."""
+        self._callbacks.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._callbacks:
+            self._callbacks.remove(callback)
+
+    def _camera_events(self, ident, old, new, now):
+        if old is not None and old.get('deleted'):
+            old = None
+        if new is not None and new.get('deleted'):
+            new = None
+        if old is None and new is None:
+            return []
+        if old is None:
+            return [CameraAdded(ident, new.get('name'), now, new)]
+        if new is None:
+            return [CameraRemoved(ident, old.get('name'), now, old)]
+        events = []
+        name = new.get('name')
+        for path, a, b in diff(old, new, self._ignore):
+            if path == ('state',):
+                events.append(StateChanged(ident, name, now, a, b))
+            else:
+                events.append(SettingChanged(ident, name, now, path, a, b))
+        return events
+
+    def poll(self):
+        """Poll once and return the events, also sending them to callbacks.
+
+        The first poll only records the fleet and returns no events.
+        """
+        previous = self._token
+        changed, self._token = self._client.changed_since(previous)
+        if previous is None:
+            return []
+        now = time.time()
+        events = []
+        for ident in changed:
+            events.extend(self._camera_events(ident,
+                                              previous.by_id.get(ident),
+                                              self._token.by_id.get(ident),
+                                              now))
+        for event in events:
+            for callback in list(self._callbacks):
+                try:
+                    callback(event)
+                except Exception:
+                    LOG.exception('Watcher callback %r failed', callback)
+        return events
+
+    def _next_interval(self, busy):
+        if busy:
+            return self._min_interval
+        return min(self.interval * self._backoff, self._max_interval)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                events = self.poll()
+            except Exception as ex:
+                LOG.warning('Polling cameras failed: %s', ex)
+                events = []
+            self.interval = self._next_interval(bool(events))
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Start polling in the background."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='FleetWatcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def events(self, timeout=None):
+        """Return an iterator over events from now until stop() is called.
+
+        Events are collected from the moment this is called, even
+        before the iterator is first advanced.
+
+        :param timeout: If set, stop iterating after this many seconds
+                        without an event
+        """
+        pending = queue.Queue()
+        self.subscribe(pending.put)
+        return self._drain(pending, timeout)
+
+    def _drain(self, pending, timeout):
+        try:
+            waited = 0
+            while not self._stop.is_set():
+                try:
+                    yield pending.get(timeout=0.1)
+                    waited = 0
+                except queue.Empty:
+                    waited += 0.1
+                    if timeout is not None and waited >= timeout:
+                        return
+        finally:
+            self.unsubscribe(pending.put)